@@ -0,0 +1,176 @@
+# HELPER
+# Benchmark of keeping scratch state of modal operators on the Scene versus in the operator.
+# Lazy Mix and Lazy Connect used to write Scene.NWBusyDrawing and Scene.NWDrawColType while dragging.
+# Writing an ID property tags the scene as changed: the next scene update has work to do and every undo step
+# stores the changed scene. Now the state lives in the operator, which Blender never sees.
+#
+# This script drags the real Lazy Mix and Lazy Connect operators over a node tree in a heavy scratch scene,
+# once as they are and once with the scene writes they used to do, and counts scene updates with changes
+# and the memory taken by undo steps. Everything it creates is removed at the end.
+#
+#
+#
+##############################
+#
+# WORKFLOW
+#
+# 1. Open Blender with the UI (undo is disabled in background mode), new file, with a Node Editor open.
+# 2. Open this script in the Text Editor and run it.
+# 3. Read results in the console, one line per operator and way of storing the state:
+#        <operator> <name>: events <n>, updated scenes <n>, undo memory <MB>, <seconds>
+#    "operator state" is what the operators do now, "scene property" adds what they did before.
+#
+# Operators get mouse events from the script, not from the window manager: invoke(), modal() and Esc run
+# as in a real drag, the Node Editor is only redrawn once the script is done.
+# Adjust NUM_OBJECTS, NUM_NODES and NUM_EVENTS for bigger scenes. Undo memory is read from the process
+# (resident size on Linux, peak size elsewhere), so close other files for stable numbers.
+#
+#
+#
+# Just take a look at the script and you'll figure out other uses of it.
+
+import bpy
+import os
+import time
+import importlib.machinery
+
+NUM_OBJECTS = 20000  # objects in the scratch scene
+NUM_NODES = 100  # nodes in the scratch tree, the drag goes over them
+NUM_EVENTS = 2000  # mouse moves, as during a long drag
+UNDO_EVERY = 100  # mouse moves per drag, one undo step each
+
+ADDON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "node_wrangler_wip.py")
+nw = importlib.machinery.SourceFileLoader("node_wrangler_benchmark", ADDON_FILE).load_module()
+
+updates = [0]
+
+
+def memory_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def count_updates(scene):
+    if bpy.data.scenes.is_updated:
+        updates[0] += 1
+
+
+class Event:
+    def __init__(self, type, x, y):
+        self.type = type
+        self.mouse_region_x = x
+        self.mouse_region_y = y
+
+
+class WindowManager:
+    # events come from the script
+    def modal_handler_add(self, op):
+        pass
+
+
+class Context:
+    # what the lazy operators read from the context, for the Node Editor area
+    def __init__(self, area, scene):
+        self.area = area
+        self.region = [region for region in area.regions if region.type == 'WINDOW'][0]
+        self.space_data = area.spaces.active
+        self.scene = scene
+        self.active_node = None
+        self.window_manager = WindowManager()
+
+
+class Drag:
+    # stands in for the operator instance, holds its properties and the state invoke() sets
+    mode = 'MIX'
+    merge_type = 'AUTO'
+
+    def report(self, type, message):
+        print(message)
+
+
+def drag(operator, context, write, start):
+    # one drag from the left of the region to the right, cancelled with Esc so the tree isn't changed
+    op = Drag()
+    region = context.region
+    y = region.height // 2
+    operator.invoke(op, context, Event('MOUSEMOVE', 0, y))
+    for i in range(UNDO_EVERY):
+        x = region.width * i // UNDO_EVERY
+        operator.modal(op, context, Event('MOUSEMOVE', x, y))
+        write(context.scene, start + i)
+        context.scene.update()
+    operator.modal(op, context, Event('ESC', region.width, y))
+
+
+def write_nothing(scene, i):
+    pass
+
+
+def write_scene(scene, i):
+    scene.NWBenchBusyDrawing = "Node.%03d" % (i % NUM_NODES)
+    scene.NWBenchDrawColType = 'RGBA' if i % 2 else 'VALUE'
+
+
+def run(operator, name, context, write):
+    updates[0] = 0
+    start_memory = memory_mb()
+    start = time.time()
+    for i in range(0, NUM_EVENTS, UNDO_EVERY):
+        drag(operator, context, write, i)
+        bpy.ops.ed.undo_push(message="Benchmark " + name)
+    print("%-32s events %d, updated scenes %d, undo memory %.1f MB, %.2f s" %
+          (operator.bl_label + " " + name + ":", NUM_EVENTS, updates[0], memory_mb() - start_memory,
+           time.time() - start))
+
+
+areas = [area for area in bpy.context.screen.areas if area.type == 'NODE_EDITOR']
+if not areas:
+    raise RuntimeError("Open a Node Editor first")
+space = areas[0].spaces.active
+screen = bpy.context.screen
+original = {'scene': screen.scene, 'tree_type': space.tree_type, 'pin': space.pin, 'tree': space.node_tree}
+
+# scratch data
+scene = bpy.data.scenes.new("NW Benchmark")
+mesh = bpy.data.meshes.new("NW Benchmark")
+objects = [bpy.data.objects.new("NW Benchmark", mesh) for i in range(NUM_OBJECTS)]
+for obj in objects:
+    scene.objects.link(obj)
+material = bpy.data.materials.new("NW Benchmark")
+material.use_nodes = True
+tree = material.node_tree
+for i in range(NUM_NODES):
+    node = tree.nodes.new('ShaderNodeMixRGB' if i % 2 else 'ShaderNodeRGB')
+    node.location = ((i % 10) * 200.0, (i // 10) * -200.0)
+
+bpy.types.Scene.NWBenchBusyDrawing = bpy.props.StringProperty()
+bpy.types.Scene.NWBenchDrawColType = bpy.props.StringProperty()
+try:
+    screen.scene = scene
+    space.tree_type = 'ShaderNodeTree'
+    space.pin = True
+    space.node_tree = tree
+    scene.update()
+    bpy.app.handlers.scene_update_post.append(count_updates)
+    context = Context(areas[0], scene)
+    for operator in (nw.NWLazyMix, nw.NWLazyConnect):
+        run(operator, "operator state", context, write_nothing)
+        run(operator, "scene property", context, write_scene)
+finally:
+    if count_updates in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(count_updates)
+    space.node_tree = original['tree']
+    space.pin = original['pin']
+    space.tree_type = original['tree_type']
+    screen.scene = original['scene']
+    del bpy.types.Scene.NWBenchBusyDrawing
+    del bpy.types.Scene.NWBenchDrawColType
+    bpy.data.scenes.remove(scene)
+    for obj in objects:
+        bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(mesh)
+    bpy.data.materials.remove(material)
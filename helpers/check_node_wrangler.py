@@ -0,0 +1,194 @@
+# HELPER
+# Checks of Node Wrangler functions that only work with real Blender data.
+# Parts of the add-on introspect RNA or read whole node trees, mistakes in those only show when
+# they run inside Blender. Each check builds what it needs in scratch datablocks and removes them.
+#
+#
+#
+##############################
+#
+# WORKFLOW
+#
+# 1. Run from the root of the repository:
+#        blender -b --factory-startup --python "helpers/check_node_wrangler.py"
+#    or open this script in the Text Editor of a new file and run it.
+# 2. Read results in the console, one line per check:
+#        <check>: OK
+#        <check>: FAILED <error>
+#    The last line tells how many checks failed.
+#
+# Checks load the add-on from node_wrangler_wip.py next to this folder, it doesn't have to be enabled.
+#
+#
+#
+# Just take a look at the script and you'll figure out other uses of it.
+
+import bpy
+import os
+import sys
+import traceback
+import importlib.machinery
+
+ADDON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "node_wrangler_wip.py")
+nw = importlib.machinery.SourceFileLoader("node_wrangler_check", ADDON_FILE).load_module()
+
+
+def check_node_catalog():
+    catalog = nw.build_node_catalog()
+    nodes = catalog['nodes']
+    assert 'ShaderNodeMath' in nodes, "Math node missing"
+    info = nodes['ShaderNodeMath']
+    assert info['type'] == 'MATH' and info['tree'] == 'ShaderNodeTree', info
+    assert ('operation', 'ENUM') in info['props'], info['props']
+    assert not [tree for tree in bpy.data.node_groups if tree.name.startswith("NW Catalog")], "scratch trees left"
+    # every node type of the menus is in the catalog
+    missing = [ident for tree_type, tree_name, category, nodes_props in nw.nodes_catalog
+               for ident, node_type, rna_name in nodes_props if ident not in nodes]
+    print("    %d node types, not in this version: %s" % (len(nodes), ", ".join(missing) or "none"))
+
+
+def check_export_import():
+    tree = bpy.data.node_groups.new("NW Check", 'ShaderNodeTree')
+    try:
+        rgb = tree.nodes.new('ShaderNodeRGB')
+        rgb.location = (1000.0, 500.0)
+        rgb.outputs[0].default_value = (1.0, 0.5, 0.0, 1.0)
+        ramp = tree.nodes.new('ShaderNodeValToRGB')
+        ramp.location = (1100.0, 200.0)
+        ramp.color_ramp.elements.new(0.5).color = (0.0, 0.0, 1.0, 1.0)
+        mix = tree.nodes.new('ShaderNodeMixRGB')
+        mix.location = (1200.0, 500.0)
+        mix.blend_type = 'ADD'
+        tree.links.new(rgb.outputs[0], mix.inputs[1])
+        data = nw.center_nodes(nw.serialize_nodes(tree.nodes, tree.links))
+        data = nw.nodes_from_bytes(nw.nodes_to_bytes(data))
+        for node in list(tree.nodes):
+            tree.nodes.remove(node)
+        nw.instantiate_nodes(data, tree.nodes, tree.links, (10.0, 20.0))
+        locations = sorted(tuple(node.location) for node in tree.nodes)
+        assert locations == [(-90.0, 120.0), (10.0, -180.0), (110.0, 120.0)], locations
+        assert len(tree.links) == 1
+        assert [node.blend_type for node in tree.nodes if node.type == 'MIX_RGB'] == ['ADD']
+        colors = [tuple(node.outputs[0].default_value) for node in tree.nodes if node.type == 'RGB']
+        assert colors == [(1.0, 0.5, 0.0, 1.0)], colors
+        elements = [(element.position, tuple(element.color)) for node in tree.nodes if node.type == 'VALTORGB'
+                    for element in node.color_ramp.elements]
+        assert elements == [(0.0, (0.0, 0.0, 0.0, 1.0)), (0.5, (0.0, 0.0, 1.0, 1.0)), (1.0, (1.0, 1.0, 1.0, 1.0))], elements
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+
+def check_duplicate_nodes():
+    # Merge Duplicate Nodes: same type, properties and inputs are duplicates, also downstream of duplicates
+    tree = bpy.data.node_groups.new("NW Check", 'ShaderNodeTree')
+    try:
+        rgb = tree.nodes.new('ShaderNodeRGB')
+        math = [tree.nodes.new('ShaderNodeMath') for i in range(5)]
+        math[2].operation = 'MULTIPLY'
+        for node in math[:3]:
+            tree.links.new(rgb.outputs[0], node.inputs[0])
+        tree.links.new(math[0].outputs[0], math[3].inputs[0])
+        tree.links.new(math[1].outputs[0], math[4].inputs[0])
+        groups = nw.duplicate_nodes(nw.TreeGraph(tree.nodes, tree.links))
+        names = sorted(sorted(node.name for node in group) for group in groups)
+        expected = sorted([sorted([math[0].name, math[1].name]), sorted([math[3].name, math[4].name])])
+        assert names == expected, names
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+
+def check_duplicate_values():
+    # values kept on outputs (RGB) and in structs (color ramps) make nodes different
+    tree = bpy.data.node_groups.new("NW Check", 'ShaderNodeTree')
+    try:
+        rgb = [tree.nodes.new('ShaderNodeRGB') for i in range(3)]
+        rgb[0].outputs[0].default_value = (1.0, 0.0, 0.0, 1.0)
+        rgb[1].outputs[0].default_value = (0.0, 1.0, 0.0, 1.0)
+        rgb[2].outputs[0].default_value = (1.0, 0.0, 0.0, 1.0)
+        ramps = [tree.nodes.new('ShaderNodeValToRGB') for i in range(2)]
+        ramps[1].color_ramp.elements[0].position = 0.25
+        groups = nw.duplicate_nodes(nw.TreeGraph(tree.nodes, tree.links))
+        names = sorted(sorted(node.name for node in group) for group in groups)
+        assert names == [sorted([rgb[0].name, rgb[2].name])], names
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+
+def check_layout_changed():
+    # Arrange Changed Nodes: a new node goes right of the node linked to its input,
+    # and not onto an unlinked node that is already there
+    tree = bpy.data.node_groups.new("NW Check", 'ShaderNodeTree')
+    try:
+        rgb = tree.nodes.new('ShaderNodeRGB')
+        rgb.location = (0.0, 0.0)
+        mix = tree.nodes.new('ShaderNodeMixRGB')
+        mix.location = (-500.0, 300.0)
+        tree.links.new(rgb.outputs[0], mix.inputs[1])
+        # where the mix node goes without other nodes
+        other = tree.nodes.new('ShaderNodeRGB')
+        other.location = (rgb.dimensions[0] + 80.0, 0.0)
+        moved = nw.layout_changed(tree.nodes, tree.links, {mix.name: True}, 80.0)
+        assert moved == set([mix.name]), moved
+        assert tuple(other.location) == (rgb.dimensions[0] + 80.0, 0.0), tuple(other.location)
+        assert tuple(mix.location) != tuple(other.location), tuple(mix.location)
+        (x, y), (w, h) = mix.location, mix.dimensions
+        (ox, oy), (ow, oh) = other.location, other.dimensions
+        assert not (x < ox + ow and ox < x + w and y > oy - oh and oy > y - h), (tuple(mix.location), tuple(other.location))
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+
+def check_mix_hsv():
+    # Constant folding of Mix RGB against values of ramp_blend() in Blender
+    gray = [0.5, 0.5, 0.5, 1.0]
+    red = [1.0, 0.0, 0.0, 1.0]
+    pink = [0.5, 0.25, 0.25, 1.0]  # h 0, s 0.5, v 0.5
+    cases = [
+        ('COLOR', 1.0, gray, red, [0.5, 0.0, 0.0, 1.0]),
+        ('COLOR', 0.5, gray, red, [0.5, 0.25, 0.25, 1.0]),
+        ('COLOR', 1.0, red, gray, red),  # no saturation in color2: color1
+        ('HUE', 1.0, pink, [0.0, 1.0, 0.0, 1.0], [0.25, 0.5, 0.25, 1.0]),
+        ('SATURATION', 1.0, pink, red, [0.5, 0.0, 0.0, 1.0]),
+        ('SATURATION', 1.0, gray, red, gray),  # no saturation in color1: color1
+        ('VALUE', 1.0, pink, [1.0, 1.0, 1.0, 1.0], [1.0, 0.5, 0.5, 1.0]),
+    ]
+    for blend_type, fac, color1, color2, expected in cases:
+        result = nw.eval_mix(blend_type, fac, color1, color2)
+        assert all(abs(a - b) < 1e-6 for a, b in zip(result, expected)), (blend_type, fac, result, expected)
+
+
+def check_mix_ramp():
+    # Darken and Lighten of compositor and Blender Internal nodes, against values of ramp_blend() in Blender
+    cases = [
+        ('DARKEN', 0.5, [0.8, 0.8, 0.8, 1.0], [0.2, 0.2, 0.2, 1.0], [0.6, 0.6, 0.6, 1.0]),
+        ('LIGHTEN', 0.5, [0.2, 0.2, 0.2, 1.0], [0.8, 0.8, 0.8, 1.0], [0.4, 0.4, 0.4, 1.0]),
+    ]
+    for blend_type, fac, color1, color2, expected in cases:
+        result = nw.eval_mix(blend_type, fac, color1, color2, functions=nw.ramp_mix_functions)
+        assert all(abs(a - b) < 1e-6 for a, b in zip(result, expected)), (blend_type, fac, result, expected)
+    # logarithm of base 1 is inf or nan in Blender, it isn't folded
+    assert nw.eval_math('LOGARITHM', 2.0, 1.0) is None
+
+
+checks = [
+    check_node_catalog,
+    check_export_import,
+    check_duplicate_nodes,
+    check_duplicate_values,
+    check_layout_changed,
+    check_mix_hsv,
+    check_mix_ramp,
+]
+
+failed = 0
+for check in checks:
+    try:
+        check()
+        print(check.__name__ + ": OK")
+    except Exception:
+        failed += 1
+        print(check.__name__ + ": FAILED")
+        traceback.print_exc()
+print("%d of %d checks failed" % (failed, len(checks)))
+if bpy.app.background and failed:
+    sys.exit(1)
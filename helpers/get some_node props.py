@@ -1,8 +1,11 @@
 # HELPER
-# This script helps creating lists of properties of nodes.
+# This script rebuilds the node catalog of Node Wrangler and helps creating lists of properties of nodes.
 # Creating variables that store several nodes' properties that will then be used to add new nodes, change nodes' types etc.
-# may be a time consuming process where you go through several data by hand and try to figure out how certain things are named.
-# I used this little script to create "swap_submenu_items.py" file.
+# used to be a time consuming process where you add nodes one by one and try to figure out how certain things are named.
+# Now every node type is introspected from RNA (bpy.types) by "build_node_catalog()" of the add-on:
+# identifier, type, category, inputs and outputs (name, type) and properties that can be copied.
+# The catalog is cached as JSON in the config folder, one file per Blender version,
+# and is loaded by the add-on the first time it's needed.
 #
 #
 #
@@ -10,25 +13,49 @@
 #
 # WORKFLOW
 #
-# 1. create variable's name and set it to tuple type
+# 1. Enable Node Wrangler
 # 2. Create text datablock named 'storage'
-# 3. Add node from "ADD NODE" menu (one by one for every type of node from every "category")
-# 4. run script.
+# 3. run script.
 #
-# this will create new line in the 'storage' text datablock.
+# This will rebuild and save the catalog, and write entries of all node types to the 'storage' text datablock,
+# grouped by category, in the form used by the "*_nodes_props" tables:
+#     ('ShaderNodeTexCoord', 'TEX_COORD', 'Texture Coordinate'),
 #
-# 5. When completing with all submenu items, we can copy lines of 'storage' and paste to entries of variable.
+# 4. Copy lines of 'storage' and paste to entries of variable. Types in category 'Other' are not in any table yet.
 #
 #
 #
 # Just take a look at the script and you'll figure out other uses of it.
 
 import bpy
+import sys
 
-nodes = bpy.context.scene.node_tree.nodes
+# find the add-on module, whatever name the file was installed with
+nw = None
+for module in list(sys.modules.values()):
+    if hasattr(module, 'build_node_catalog') and hasattr(module, 'save_node_catalog'):
+        nw = module
+        break
+if nw is None:
+    raise Exception("Node Wrangler is not enabled")
 
-n = nodes.active
+catalog = nw.build_node_catalog()
+nw.save_node_catalog(catalog)
+nw.node_catalog.clear()
+nw.node_catalog.update(catalog['nodes'])
+print("Saved catalog of " + str(len(catalog['nodes'])) + " node types to " + nw.node_catalog_path())
 
-the_string = "    ('" + n.rna_type.identifier + "', '" + n.type + "', '" + n.rna_type.name + "'),\n"
-bpy.data.texts['storage'].write(the_string)
-print(the_string)
\ No newline at end of file
+storage = bpy.data.texts.get('storage')
+if storage is None:
+    storage = bpy.data.texts.new('storage')
+
+by_category = {}
+for ident, info in sorted(catalog['nodes'].items()):
+    by_category.setdefault((info['tree'], info['category']), []).append((ident, info))
+
+for (tree, category), entries in sorted(by_category.items()):
+    storage.write("# " + tree + ": " + category + "\n")
+    for ident, info in entries:
+        the_string = "    ('" + ident + "', '" + info['type'] + "', '" + info['name'] + "'),\n"
+        storage.write(the_string)
+        print(the_string, end='')
@@ -32,10 +32,22 @@ bl_info = {
 import bpy
 import blf
 import bgl
+import time
+import os
+import sys
+import json
+import struct
+import colorsys
+import multiprocessing
+import hashlib
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+from bpy.app.handlers import persistent
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 from bpy.types import Operator, Panel, Menu
-from bpy.props import FloatProperty, EnumProperty, BoolProperty, StringProperty, FloatVectorProperty
+from bpy.props import FloatProperty, EnumProperty, BoolProperty, StringProperty, FloatVectorProperty, IntProperty
 from mathutils import Vector
-from math import cos, sin, pi, sqrt
+from math import cos, sin, tan, asin, acos, atan, log, floor, pi, sqrt
 
 #################
 # rl_outputs:
@@ -303,6 +315,29 @@ compo_layout_nodes_props = (
     ('CompositorNodeSwitch', 'SWITCH', 'Switch'),
 )
 
+# Single catalog of node categories per tree type.
+# Submenus of "Switch Type to..." and items of NWSwitchNodeType.to_type are built from it.
+# entry = (node_tree.type, tree name used in idnames, category name, nodes props)
+nodes_catalog = (
+    ('SHADER', 'Shaders', 'Input', shaders_input_nodes_props),
+    ('SHADER', 'Shaders', 'Output', shaders_output_nodes_props),
+    ('SHADER', 'Shaders', 'Shader', shaders_shader_nodes_props),
+    ('SHADER', 'Shaders', 'Texture', shaders_texture_nodes_props),
+    ('SHADER', 'Shaders', 'Color', shaders_color_nodes_props),
+    ('SHADER', 'Shaders', 'Vector', shaders_vector_nodes_props),
+    ('SHADER', 'Shaders', 'Converter', shaders_converter_nodes_props),
+    ('SHADER', 'Shaders', 'Layout', shaders_layout_nodes_props),
+    ('COMPOSITING', 'Compo', 'Input', compo_input_nodes_props),
+    ('COMPOSITING', 'Compo', 'Output', compo_output_nodes_props),
+    ('COMPOSITING', 'Compo', 'Color', compo_color_nodes_props),
+    ('COMPOSITING', 'Compo', 'Converter', compo_converter_nodes_props),
+    ('COMPOSITING', 'Compo', 'Filter', compo_filter_nodes_props),
+    ('COMPOSITING', 'Compo', 'Vector', compo_vector_nodes_props),
+    ('COMPOSITING', 'Compo', 'Matte', compo_matte_nodes_props),
+    ('COMPOSITING', 'Compo', 'Distort', compo_distort_nodes_props),
+    ('COMPOSITING', 'Compo', 'Layout', compo_layout_nodes_props),
+)
+
 # list of blend types of "Mix" nodes in a form that can be used as 'items' for EnumProperty.
 # used list, not tuple for easy merging with other lists.
 blend_types = [
@@ -356,6 +391,45 @@ navs = [
     ('PREV', 'Prev', 'Previous blend type/operation'),
 ]
 
+
+class NodeTypesIndex:
+    # Constant time lookups into nodes_catalog and the enum tables, built once at import.
+    # Operators use those instead of building lists from the tables on every call.
+
+    def __init__(self, catalog):
+        self.by_type = {}  # (node_tree.type, node.type): (identifier, type, rna_type.name)
+        self.by_category = {}  # (node_tree.type, category): frozenset of node types
+        self.category = {}  # (node_tree.type, node.type): category
+        for tree_type, tree_name, category, nodes_props in catalog:
+            types = frozenset(node_type for ident, node_type, rna_name in nodes_props)
+            self.by_category[(tree_type, category)] = types
+            for node_type in types:
+                self.category.setdefault((tree_type, node_type), category)
+            for props in nodes_props:
+                self.by_type.setdefault((tree_type, props[1]), props)
+        shader = self.by_category[('SHADER', 'Shader')]
+        self.shader_types = shader
+        self.mix_shader_types = frozenset(('MIX_SHADER', 'ADD_SHADER'))
+        self.bsdf_types = shader - self.mix_shader_types  # shaders that can get a texture setup
+        self.texture_types = self.by_category[('SHADER', 'Texture')]
+        self.shader_output_types = self.by_category[('SHADER', 'Output')]
+        self.output_types = self.shader_output_types | frozenset(('COMPOSITE',))
+        # nodes that don't need their outputs linked to be used, groups only if they have such nodes inside
+        # (see is_output_node())
+        self.end_types = frozenset((
+            'OUTPUT_MATERIAL', 'OUTPUT', 'VIEWER', 'COMPOSITE',
+            'SPLITVIEWER', 'OUTPUT_FILE', 'LEVELS', 'OUTPUT_LAMP',
+            'OUTPUT_WORLD', 'GROUP_INPUT', 'GROUP_OUTPUT',
+        ))
+        self.image_types = frozenset(('IMAGE', 'TEX_IMAGE', 'TEX_ENVIRONMENT', 'TEXTURE'))
+        # enum items: identifier: index in list
+        self.blend_type_index = dict((t[0], i) for i, t in enumerate(blend_types))
+        self.operation_index = dict((o[0], i) for i, o in enumerate(operations))
+        self.nav_names = frozenset(nav[0] for nav in navs)
+
+
+node_types = NodeTypesIndex(nodes_catalog)
+
 draw_color_sets = {
     "red_white": (
         (1.0, 1.0, 1.0, 0.7),
@@ -491,40 +565,59 @@ def node_mid_pt(node, axis):
     return d
 
 
-def autolink(node1, node2, links):
-    link_made = False
-    for outp in node1.outputs:
-        for inp in node2.inputs:
-            if not inp.is_linked and inp.type == outp.type:
-                link_made = True
-                links.new(outp, inp)
-                return True
+# score of linking output of type to input of type: same type, then conversions that keep most of the data.
+# Shaders can't be converted to other types. Missing pairs score 0.
+socket_conversion = {
+    ('SHADER', 'SHADER'): 4,
+    ('RGBA', 'RGBA'): 4,
+    ('VECTOR', 'VECTOR'): 4,
+    ('VALUE', 'VALUE'): 4,
+    ('RGBA', 'VECTOR'): 2,
+    ('VECTOR', 'RGBA'): 2,
+    ('VALUE', 'RGBA'): 2,
+    ('VALUE', 'VECTOR'): 2,
+    ('RGBA', 'VALUE'): 1,
+    ('VECTOR', 'VALUE'): 1,
+    ('RGBA', 'SHADER'): 1,
+    ('VALUE', 'SHADER'): 1,
+}
 
-    # force some connection even if the type doesn't match
-    for outp in node1.outputs:
-        for inp in node2.inputs:
-            if not inp.is_linked:
-                link_made = True
-                links.new(outp, inp)
-                return True
 
-    # even if no sockets are open, force one of matching type
-    for outp in node1.outputs:
-        for inp in node2.inputs:
-            if inp.type == outp.type:
-                link_made = True
-                links.new(outp, inp)
-                return True
+def socket_score(out_type, out_name, in_type, in_name, in_linked):
+    # Free inputs first, then type conversion, then similar names.
+    # Same order as trying free inputs of matching type, any free input, then linked ones.
+    score = 0 if in_linked else 10
+    score += socket_conversion.get((out_type, in_type), 0)
+    if out_name == in_name:
+        score += 1
+    elif out_name in in_name or in_name in out_name:
+        score += 0.5
+    return score
+
+
+def best_link(node1, node2):
+    # (output of node1, input of node2) with the best socket_score, first of equal ones. None if no sockets.
+    # Sockets are read once, the pairs are scored on plain data.
+    outputs = [(s, s.type, s.name.lower()) for s in node1.outputs if s.enabled]
+    inputs = [(s, s.type, s.name.lower(), s.is_linked) for s in node2.inputs if s.enabled]
+    best = None
+    best_score = -1
+    for outp, out_type, out_name in outputs:
+        for inp, in_type, in_name, in_linked in inputs:
+            score = socket_score(out_type, out_name, in_type, in_name, in_linked)
+            if score > best_score:
+                best = outp, inp
+                best_score = score
+    return best
 
-    # do something!
-    for outp in node1.outputs:
-        for inp in node2.inputs:
-            link_made = True
-            links.new(outp, inp)
-            return True
 
+def autolink(node1, node2, links):
+    pair = best_link(node1, node2)
+    if pair:
+        links.new(pair[0], pair[1])
+        return True
     print("Could not make a link from " + node1.name + " to " + node2.name)
-    return link_made
+    return False
 
 
 def node_at_pos(nodes, context, event):
@@ -594,7 +687,7 @@ def draw_circle(mx, my, radius, colour=[1.0, 1.0, 1.0, 0.7]):
 
 
 def draw_callback_mixnodes(self, context, mode="MIX"):
-    if self.mouse_path:
+    if self.mouse_start:
         settings = context.user_preferences.addons[__name__].preferences
         if settings.bgl_antialiasing:
             bgl.glEnable(bgl.GL_LINE_SMOOTH)
@@ -613,10 +706,8 @@ def draw_callback_mixnodes(self, context, mode="MIX"):
         else:
             colors = draw_color_sets['black']
 
-        m1x = self.mouse_path[0][0]
-        m1y = self.mouse_path[0][1]
-        m2x = self.mouse_path[-1][0]
-        m2y = self.mouse_path[-1][1]
+        m1x, m1y = self.mouse_start
+        m2x, m2y = self.mouse_end
 
         # circle outline
         draw_circle(m1x, m1y, 6, colors[0])
@@ -629,6 +720,14 @@ def draw_callback_mixnodes(self, context, mode="MIX"):
         draw_circle(m1x, m1y, 5, colors[2])
         draw_circle(m2x, m2y, 5, colors[2])
 
+        # sockets that will be linked (Lazy Connect)
+        preview = getattr(self, 'preview', "")
+        if preview:
+            bgl.glColor4f(1.0, 1.0, 1.0, 1.0)
+            blf.size(0, 12, 72)
+            blf.position(0, m2x + 12, m2y + 12, 0)
+            blf.draw(0, preview)
+
         # restore opengl defaults
         bgl.glLineWidth(1)
         bgl.glDisable(bgl.GL_BLEND)
@@ -638,27 +737,1887 @@ def draw_callback_mixnodes(self, context, mode="MIX"):
             bgl.glDisable(bgl.GL_LINE_SMOOTH)
 
 
-def get_nodes_links(context):
+# pixels the mouse has to move before lines of lazy operators are drawn again
+lazy_redraw_threshold = 2
+
+
+def move_mouse_end(op, event):
+    # Store mouse position as end of the line drawn by lazy operators (the first one is the start).
+    # Returns True if the line has to be redrawn. End point is updated in place, moves allocate nothing.
+    x = event.mouse_region_x
+    y = event.mouse_region_y
+    end = op.mouse_end
+    if op.mouse_start is None:
+        op.mouse_start = (x, y)
+    elif abs(x - end[0]) <= lazy_redraw_threshold and abs(y - end[1]) <= lazy_redraw_threshold:
+        return False
+    end[0] = x
+    end[1] = y
+    return True
+
+
+def edited_tree_path(context):
+    # Trees from the one shown in the Node Editor down to the edited group, nested to any depth.
     space = context.space_data
-    tree = space.node_tree
-    nodes = tree.nodes
-    links = tree.links
-    active = nodes.active
+    path = getattr(space, 'path', None)
+    if path:
+        return [item.node_tree for item in path]
+    # Without space.path: a group that is edited is the active node of the tree it is in,
+    # and context.active_node is the active node of the edited group.
+    # if context.active_node == active node of a tree, that tree is the edited one.
+    trees = [space.node_tree]
     context_active = context.active_node
-    # check if we are working on regular node tree or node group is currently edited.
-    # if group is edited - active node of space_tree is the group
-    # if context.active_node != space active node - it means that the group is being edited.
-    # in such case we set "nodes" to be nodes of this group, "links" to be links of this group
-    # if context.active_node == space.active_node it means that we are not currently editing group
-    is_main_tree = True
-    if active:
-        is_main_tree = context_active == active
-    if not is_main_tree:  # if group is currently edited
-        tree = active.node_tree
-        nodes = tree.nodes
-        links = tree.links
-
-    return nodes, links
+    while True:
+        active = trees[-1].nodes.active
+        if (active is None or active == context_active or active.type != 'GROUP' or
+                active.node_tree is None or active.node_tree in trees):
+            return trees
+        trees.append(active.node_tree)
+
+
+class EditedTree:
+    # Handle of the tree edited in the Node Editor, that knows how it was reached.
+    # path: trees from the one shown in the editor to the edited one
+    # key: pointers of the path, tells apart a group entered from different trees
+    def __init__(self, context):
+        self.path = edited_tree_path(context)
+        self.tree = self.path[-1]
+        self.nodes = self.tree.nodes
+        self.links = self.tree.links
+        self.key = tuple(tree.as_pointer() for tree in self.path)
+
+    def __str__(self):
+        return " > ".join(tree.name for tree in self.path)
+
+
+def get_nodes_links(context):
+    tree = edited_tree_path(context)[-1]
+    return tree.nodes, tree.links
+
+
+# Node catalog: metadata of every node type introspected from RNA.
+# Built once per Blender version and cached on disk as JSON, loaded on first use by node_info().
+# catalog entry = identifier: {
+#     'type': node.type, 'name': rna_type.name, 'tree': node tree type, 'category': category in nodes_catalog,
+#     'inputs': [(name, type, has default_value), ...], 'outputs': [(name, type), ...],
+#     'props': [(identifier, rna type), ...] type specific properties that can be set,
+#     'structs': [identifier, ...] type specific read only structs (curves, color ramps...),
+# }
+NODE_CATALOG_FORMAT = 1
+node_catalog = {}
+
+
+def node_catalog_path():
+    directory = bpy.utils.user_resource('CONFIG', "node_wrangler", autocreate=True)
+    return os.path.join(directory, "node_catalog_%d_%d_%d.json" % tuple(bpy.app.version))
+
+
+def build_node_catalog():
+    # Every node type found in bpy.types is added to a temporary tree to read its sockets and properties.
+    categories = {}
+    for tree_type, tree_name, category, nodes_props in nodes_catalog:
+        for ident, node_type, rna_name in nodes_props:
+            categories.setdefault(ident, category)
+    base_props = {prop.identifier for prop in bpy.types.Node.bl_rna.properties}
+    trees = {}
+    nodes = {}
+    try:
+        for ident in dir(bpy.types):
+            cls = getattr(bpy.types, ident)
+            if not isinstance(cls, type) or not issubclass(cls, bpy.types.Node):
+                continue
+            if issubclass(cls, bpy.types.CompositorNode):
+                tree_type = 'CompositorNodeTree'
+            elif issubclass(cls, bpy.types.TextureNode):
+                tree_type = 'TextureNodeTree'
+            else:
+                tree_type = 'ShaderNodeTree'
+            if tree_type not in trees:
+                trees[tree_type] = bpy.data.node_groups.new("NW Catalog", tree_type)
+            try:
+                node = trees[tree_type].nodes.new(ident)
+            except RuntimeError:
+                continue  # base classes and types not available in this kind of tree
+            props = []
+            structs = []
+            for prop in node.bl_rna.properties:
+                if prop.identifier in base_props:
+                    continue
+                if not prop.is_readonly:
+                    props.append((prop.identifier, prop.type))
+                elif prop.type == 'POINTER':
+                    structs.append(prop.identifier)
+            nodes[ident] = {
+                'type': node.type,
+                'name': node.rna_type.name,
+                'tree': tree_type,
+                'category': categories.get(ident, 'Other'),
+                'inputs': [(s.name, s.type, hasattr(s, 'default_value')) for s in node.inputs],
+                'outputs': [(s.name, s.type) for s in node.outputs],
+                'props': props,
+                'structs': structs,
+            }
+            trees[tree_type].nodes.remove(node)
+    finally:
+        for tree in trees.values():
+            bpy.data.node_groups.remove(tree)
+    return {'format': NODE_CATALOG_FORMAT, 'blender': list(bpy.app.version), 'nodes': nodes}
+
+
+def save_node_catalog(catalog):
+    try:
+        with open(node_catalog_path(), 'w') as f:
+            json.dump(catalog, f, indent=1, sort_keys=True)
+    except (IOError, OSError) as err:
+        print("Node Wrangler: could not save node catalog: " + str(err))
+
+
+def load_node_catalog():
+    # Return cached catalog or None if there is none for this version of Blender
+    try:
+        with open(node_catalog_path()) as f:
+            catalog = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if catalog.get('format') != NODE_CATALOG_FORMAT or catalog.get('blender') != list(bpy.app.version):
+        return None
+    return catalog
+
+
+def node_info(ident):
+    # Catalog entry of node type "ident" or None for unknown types (for example custom nodes).
+    # Can build the catalog, so only call it where bpy.data can be modified (operators).
+    if not node_catalog:
+        catalog = load_node_catalog()
+        if catalog is None:
+            catalog = build_node_catalog()
+            save_node_catalog(catalog)
+        node_catalog.update(catalog['nodes'])
+    return node_catalog.get(ident)
+
+
+# Node tree serialization.
+# Compact form of a tree or a selection that can be saved as JSON or packed binary and
+# instantiated in any tree of the same type (export/import, templates).
+# nodes data = {
+#     'format': NODES_FORMAT, 'tree': node_tree.type,
+#     'nodes': [[identifier, name, parent index or -1, loc x, loc y, width, props, inputs, outputs, structs], ...],
+#     'links': [[from node index, output index, to node index, input index], ...],
+# }
+# props = {property: value} only properties that differ from RNA defaults.
+# inputs = [[input index, default_value], ...] of unlinked inputs.
+# outputs = [[output index, default_value], ...] of outputs with a value set on the node (Value, RGB).
+# structs = {struct: contents} of color ramps, curves and other read only structs, see serialize_struct().
+# Values are numbers, strings, lists (arrays, enum flags) or {'id': [bpy.data collection, name]} for datablocks.
+# Format 1 had no outputs and structs, it's still read.
+NODES_FORMAT = 2
+NODES_MAGIC = b'NWN'
+# node attributes common to all types, serialized when not default
+node_base_props = ('label', 'hide', 'mute', 'use_custom_color', 'color', 'show_options', 'show_preview')
+# (bpy.types ID type, bpy.data collection) of datablocks node properties can point to
+id_collections = (
+    ('Image', 'images'),
+    ('Texture', 'textures'),
+    ('NodeTree', 'node_groups'),
+    ('Object', 'objects'),
+    ('MovieClip', 'movieclips'),
+    ('Mask', 'masks'),
+    ('Scene', 'scenes'),
+    ('Text', 'texts'),
+    ('Material', 'materials'),
+)
+
+
+def serialize_value(value):
+    # RNA value to plain data, None if it can't be stored
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bpy.types.ID):
+        for type_name, collection in id_collections:
+            if isinstance(value, getattr(bpy.types, type_name)):
+                return {'id': [collection, value.name]}
+        return None
+    if isinstance(value, (set, frozenset)):  # enum flag
+        return sorted(value)
+    try:
+        return [v for v in value]  # arrays (vectors, colors)
+    except TypeError:
+        return None
+
+
+def deserialize_value(value):
+    if isinstance(value, dict):
+        collection, name = value['id']
+        return getattr(bpy.data, collection).get(name)
+    return value
+
+
+def rna_default(prop):
+    if prop.type == 'ENUM':
+        return sorted(prop.default_flag) if prop.is_enum_flag else prop.default
+    if prop.type in {'BOOLEAN', 'INT', 'FLOAT'} and prop.array_length:
+        return list(prop.default_array)
+    if prop.type == 'POINTER':
+        return None
+    return prop.default
+
+
+def node_type_props(node):
+    # Names of properties specific to type of node (not common to all nodes).
+    info = node_info(node.rna_type.identifier)
+    if info is not None:
+        return [prop for prop, prop_type in info['props']]
+    return [p.identifier for p in node.bl_rna.properties if not p.is_readonly and
+            p.identifier not in bpy.types.Node.bl_rna.properties]
+
+
+def node_props(node, prop_names):
+    # {property: value} of properties in prop_names that differ from RNA defaults
+    rna_props = node.bl_rna.properties
+    props = {}
+    for prop in prop_names:
+        value = serialize_value(getattr(node, prop))
+        if value is not None and value != rna_default(rna_props[prop]):
+            props[prop] = value
+    return props
+
+
+def node_input_values(node):
+    # [[input index, value], ...] of unlinked inputs
+    inputs = []
+    for i, socket in enumerate(node.inputs):
+        if not socket.is_linked and hasattr(socket, 'default_value'):
+            value = serialize_value(socket.default_value)
+            if value is not None:
+                inputs.append([i, value])
+    return inputs
+
+
+def node_output_values(node):
+    # [[output index, value], ...] of outputs with a value set on the node (Value and RGB nodes)
+    outputs = []
+    for i, socket in enumerate(node.outputs):
+        if hasattr(socket, 'default_value'):
+            value = serialize_value(socket.default_value)
+            if value is not None and value != rna_default(socket.bl_rna.properties['default_value']):
+                outputs.append([i, value])
+    return outputs
+
+
+def node_structs(node):
+    # Names of read only structs of node (color ramps, curves, texture mappings...), not in node_props()
+    info = node_info(node.rna_type.identifier)
+    if info is not None:
+        return info['structs']
+    return [p.identifier for p in node.bl_rna.properties if p.is_readonly and p.type == 'POINTER' and
+            p.identifier not in bpy.types.Node.bl_rna.properties]
+
+
+def serialize_struct(struct):
+    # {property: value} of settings of a struct that differ from defaults, {property: contents} of
+    # nested structs, positions and colors of color ramp 'elements', points of curve mapping 'curves'.
+    rna_props = struct.bl_rna.properties
+    contents = node_props(struct, [prop.identifier for prop in rna_props if not prop.is_readonly])
+    for prop in rna_props:
+        if prop.is_readonly and prop.type == 'POINTER' and prop.identifier != 'rna_type':
+            nested = getattr(struct, prop.identifier)
+            if nested is not None:
+                contents[prop.identifier] = serialize_struct(nested)
+    if isinstance(struct, bpy.types.ColorRamp):
+        contents['elements'] = [[element.position, list(element.color)] for element in struct.elements]
+    elif isinstance(struct, bpy.types.CurveMapping):
+        contents['curves'] = [[[point.location[0], point.location[1], point.handle_type] for point in curve.points]
+                              for curve in struct.curves]
+    return contents
+
+
+def node_struct_values(node):
+    # {struct: contents} of structs of node
+    structs = {}
+    for name in node_structs(node):
+        struct = getattr(node, name, None)
+        if struct is not None:
+            structs[name] = serialize_struct(struct)
+    return structs
+
+
+def serialize_nodes(nodes, links, selected_only=False):
+    entries = []
+    index = {}  # node name: index in entries
+    for node in nodes:
+        if node.select or not selected_only:
+            index[node.name] = len(entries)
+            entries.append(node)
+
+    data_nodes = []
+    for node in entries:
+        props = node_props(node, node_base_props)
+        props.update(node_props(node, node_type_props(node)))
+        inputs = node_input_values(node)
+        outputs = node_output_values(node)
+        structs = node_struct_values(node)
+        x, y = node.location
+        parent = -1
+        if node.parent:
+            parent = index.get(node.parent.name, -1)
+            if parent == -1:
+                # parent not serialized: store absolute location
+                frame = node.parent
+                while frame:
+                    x += frame.location.x
+                    y += frame.location.y
+                    frame = frame.parent
+        data_nodes.append([node.rna_type.identifier, node.name, parent, x, y, node.width, props, inputs,
+                           outputs, structs])
+
+    data_links = []
+    socket_index = {}  # socket pointer: index in outputs or inputs
+    for node in entries:
+        for sockets in (node.inputs, node.outputs):
+            for i, socket in enumerate(sockets):
+                socket_index[socket.as_pointer()] = i
+    for link in links:
+        from_i = index.get(link.from_node.name)
+        to_i = index.get(link.to_node.name)
+        if from_i is not None and to_i is not None:
+            data_links.append([from_i, socket_index[link.from_socket.as_pointer()],
+                               to_i, socket_index[link.to_socket.as_pointer()]])
+
+    tree = nodes.id_data
+    return {'format': NODES_FORMAT, 'tree': tree.type, 'nodes': data_nodes, 'links': data_links}
+
+
+def restore_struct(struct, contents):
+    # Set contents of serialize_struct() on a struct. Returns False if some of it couldn't be set.
+    done = True
+    rna_props = struct.bl_rna.properties
+    collections = {}
+    for prop, value in contents.items():
+        if prop in {'elements', 'curves'}:
+            collections[prop] = value
+        elif prop in rna_props and rna_props[prop].is_readonly:
+            nested = getattr(struct, prop, None)
+            done = nested is not None and restore_struct(nested, value) and done
+        else:
+            try:
+                setattr(struct, prop, deserialize_value(value))
+            except (AttributeError, TypeError, ValueError):
+                done = False
+    if 'elements' in collections and isinstance(struct, bpy.types.ColorRamp):
+        # elements are kept sorted by position: first one is set, others removed and added again
+        elements = struct.elements
+        while len(elements) > 1:
+            elements.remove(elements[-1])
+        for i, (position, color) in enumerate(collections['elements']):
+            if i == 0:
+                # position last, setting it sorts the elements
+                elements[0].color = color
+                elements[0].position = position
+            else:
+                elements.new(position).color = color
+    if 'curves' in collections and isinstance(struct, bpy.types.CurveMapping):
+        for curve, points in zip(struct.curves, collections['curves']):
+            if not hasattr(curve.points, 'new'):
+                done = False  # points can't be added in this version
+                continue
+            # curves keep at least two points, the ends are set and the ones between added
+            while len(curve.points) > 2:
+                curve.points.remove(curve.points[1])
+            curve.points[0].location = points[0][:2]
+            curve.points[1].location = points[-1][:2]
+            for x, y, handle_type in points[1:-1]:
+                curve.points.new(x, y)
+            for point, (x, y, handle_type) in zip(curve.points, points):
+                point.handle_type = handle_type
+        if hasattr(struct, 'update'):
+            struct.update()
+    return done
+
+
+def center_nodes(data):
+    # Move serialized nodes so that their center is at the origin, they are added at mouse position.
+    # Only nodes without parent, the others are relative to their frame.
+    roots = [entry for entry in data['nodes'] if entry[2] == -1]
+    if roots:
+        mid_x = sum(entry[3] for entry in roots) / len(roots)
+        mid_y = sum(entry[4] for entry in roots) / len(roots)
+        for entry in roots:
+            entry[3] -= mid_x
+            entry[4] -= mid_y
+    return data
+
+
+def instantiate_nodes(data, nodes, links, offset=(0.0, 0.0)):
+    # Create every node first, then every link, each in a single pass. Return new nodes.
+    # offset is added to location of nodes without parent.
+    new_nodes = [nodes.new(entry[0]) for entry in data['nodes']]
+    for node, (ident, name, parent, x, y, width, props, inputs, outputs, structs) in zip(new_nodes, data['nodes']):
+        node.name = name
+        node.select = True
+        for prop, value in props.items():
+            try:
+                setattr(node, prop, deserialize_value(value))
+            except (AttributeError, TypeError, ValueError):
+                print("Node Wrangler: could not set " + prop + " of " + node.name)
+        for i, value in inputs:
+            if i < len(node.inputs):
+                try:
+                    node.inputs[i].default_value = value
+                except (AttributeError, TypeError, ValueError):
+                    pass
+        for i, value in outputs:
+            if i < len(node.outputs):
+                try:
+                    node.outputs[i].default_value = value
+                except (AttributeError, TypeError, ValueError):
+                    pass
+        for name, contents in structs.items():
+            struct = getattr(node, name, None)
+            if struct is None or not restore_struct(struct, contents):
+                print("Node Wrangler: could not set all of " + name + " of " + node.name)
+        node.width = width
+    # parents before locations: locations of children are relative to parents
+    for node, entry in zip(new_nodes, data['nodes']):
+        if entry[2] != -1:
+            node.parent = new_nodes[entry[2]]
+    for node, entry in zip(new_nodes, data['nodes']):
+        if entry[2] == -1:
+            node.location = entry[3] + offset[0], entry[4] + offset[1]
+        else:
+            node.location = entry[3], entry[4]
+    for from_i, out_i, to_i, in_i in data['links']:
+        outputs = new_nodes[from_i].outputs
+        inputs = new_nodes[to_i].inputs
+        if out_i < len(outputs) and in_i < len(inputs):
+            links.new(outputs[out_i], inputs[in_i])
+    return new_nodes
+
+
+def nodes_to_json(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def nodes_from_json(text):
+    data = json.loads(text)
+    if data.get('format') not in {1, NODES_FORMAT}:
+        raise ValueError("Unsupported nodes format")
+    for entry in data['nodes']:
+        if len(entry) == 8:  # format 1
+            entry.extend(([], {}))
+    data['format'] = NODES_FORMAT
+    return data
+
+
+# Packed binary form. Little endian:
+# magic, format (B), tree type, number of strings (I), strings, number of nodes (I), nodes, number of links (I), links
+# string: length (H) + utf-8. Strings (identifiers, names, props, enum items) are stored once and referenced by index (I).
+# node: identifier (I), name (I), parent (i), loc x, loc y, width (3d), number of props (H),
+#       props (I + value), number of inputs (H), inputs (H + value), number of outputs (H), outputs (H + value),
+#       structs (value). Format 1 ends after inputs.
+# value: tag (c) + data
+# link: 4 indexes (4I)
+def pack_value(value, out, string_index):
+    if value is None:
+        out.append(b'N')
+    elif isinstance(value, bool):
+        out.append(b'b' + struct.pack('<?', value))
+    elif isinstance(value, int):
+        out.append(b'i' + struct.pack('<q', value))
+    elif isinstance(value, float):
+        out.append(b'f' + struct.pack('<d', value))
+    elif isinstance(value, str):
+        out.append(b's' + struct.pack('<I', string_index(value)))
+    elif isinstance(value, dict) and list(value) == ['id']:
+        collection, name = value['id']
+        out.append(b'p' + struct.pack('<II', string_index(collection), string_index(name)))
+    elif isinstance(value, dict):
+        out.append(b'd' + struct.pack('<H', len(value)))
+        for key, v in value.items():
+            out.append(struct.pack('<I', string_index(key)))
+            pack_value(v, out, string_index)
+    else:  # list
+        out.append(b'l' + struct.pack('<H', len(value)))
+        for v in value:
+            pack_value(v, out, string_index)
+
+
+def unpack_value(data, offset, strings):
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b'N':
+        return None, offset
+    if tag == b'b':
+        return struct.unpack_from('<?', data, offset)[0], offset + 1
+    if tag == b'i':
+        return struct.unpack_from('<q', data, offset)[0], offset + 8
+    if tag == b'f':
+        return struct.unpack_from('<d', data, offset)[0], offset + 8
+    if tag == b's':
+        return strings[struct.unpack_from('<I', data, offset)[0]], offset + 4
+    if tag == b'p':
+        collection, name = struct.unpack_from('<II', data, offset)
+        return {'id': [strings[collection], strings[name]]}, offset + 8
+    if tag == b'd':
+        count = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        value = {}
+        for i in range(count):
+            key = strings[struct.unpack_from('<I', data, offset)[0]]
+            value[key], offset = unpack_value(data, offset + 4, strings)
+        return value, offset
+    if tag == b'l':
+        count = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        value = []
+        for i in range(count):
+            v, offset = unpack_value(data, offset, strings)
+            value.append(v)
+        return value, offset
+    raise ValueError("Unknown value tag in packed nodes")
+
+
+def nodes_to_bytes(data):
+    strings = []
+    string_ids = {}
+
+    def string_index(s):
+        if s not in string_ids:
+            string_ids[s] = len(strings)
+            strings.append(s)
+        return string_ids[s]
+
+    body = [struct.pack('<I', len(data['nodes']))]
+    for ident, name, parent, x, y, width, props, inputs, outputs, structs in data['nodes']:
+        body.append(struct.pack('<IIiddd', string_index(ident), string_index(name), parent, x, y, width))
+        body.append(struct.pack('<H', len(props)))
+        for prop, value in props.items():
+            body.append(struct.pack('<I', string_index(prop)))
+            pack_value(value, body, string_index)
+        for sockets in (inputs, outputs):
+            body.append(struct.pack('<H', len(sockets)))
+            for i, value in sockets:
+                body.append(struct.pack('<H', i))
+                pack_value(value, body, string_index)
+        pack_value(structs, body, string_index)
+    body.append(struct.pack('<I', len(data['links'])))
+    body.append(b''.join(struct.pack('<4I', *link) for link in data['links']))
+
+    tree = data['tree'].encode('utf-8')
+    head = [NODES_MAGIC, struct.pack('<BH', data['format'], len(tree)), tree, struct.pack('<I', len(strings))]
+    for s in strings:
+        encoded = s.encode('utf-8')
+        head.append(struct.pack('<H', len(encoded)) + encoded)
+    return b''.join(head + body)
+
+
+def nodes_from_bytes(data):
+    if data[:3] != NODES_MAGIC:
+        raise ValueError("Not packed nodes data")
+    offset = 3
+    format, tree_len = struct.unpack_from('<BH', data, offset)
+    if format not in {1, NODES_FORMAT}:
+        raise ValueError("Unsupported nodes format")
+    offset += 3
+    tree = data[offset:offset + tree_len].decode('utf-8')
+    offset += tree_len
+    count = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    strings = []
+    for i in range(count):
+        length = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        strings.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    count = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    data_nodes = []
+    for n in range(count):
+        ident, name, parent, x, y, width = struct.unpack_from('<IIiddd', data, offset)
+        offset += 36
+        props = {}
+        num = struct.unpack_from('<H', data, offset)[0]
+        offset += 2
+        for i in range(num):
+            prop = strings[struct.unpack_from('<I', data, offset)[0]]
+            props[prop], offset = unpack_value(data, offset + 4, strings)
+        sockets = [[], []]  # inputs, outputs
+        for values in sockets[:1] if format == 1 else sockets:
+            num = struct.unpack_from('<H', data, offset)[0]
+            offset += 2
+            for i in range(num):
+                index = struct.unpack_from('<H', data, offset)[0]
+                value, offset = unpack_value(data, offset + 2, strings)
+                values.append([index, value])
+        structs = {}
+        if format != 1:
+            structs, offset = unpack_value(data, offset, strings)
+        data_nodes.append([strings[ident], strings[name], parent, x, y, width, props] + sockets + [structs])
+
+    count = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    data_links = [list(struct.unpack_from('<4I', data, offset + 16 * i)) for i in range(count)]
+    return {'format': NODES_FORMAT, 'tree': tree, 'nodes': data_nodes, 'links': data_links}
+
+
+def read_nodes_file(filepath):
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if raw[:3] == NODES_MAGIC:
+        return nodes_from_bytes(raw)
+    return nodes_from_json(raw.decode('utf-8'))
+
+
+def write_nodes_file(filepath, data):
+    if filepath.lower().endswith('.json'):
+        raw = nodes_to_json(data).encode('utf-8')
+    else:
+        raw = nodes_to_bytes(data)
+    with open(filepath, 'wb') as f:
+        f.write(raw)
+
+
+# Node templates.
+# Node setups saved in packed form, one file per template, in the templates folder (add-on preferences).
+# Menus only use the index: {file name: [template name, tree type, modification time]},
+# cached in "template_index.json" next to the templates and loaded with the menus (register_ui),
+# when the folder changes and by Refresh Templates. Menus never touch files.
+# Body of a template is read only when it's added.
+TEMPLATE_INDEX_FILE = "template_index.json"
+node_templates = {
+    'loaded': False,
+    'path': "",
+    'index': {},
+    'error': "",  # why the index couldn't be saved (read only folder), it's kept in memory then
+}
+
+
+def templates_path_update(self, context):
+    node_templates['loaded'] = False
+    if lazy_ui['registered']:
+        try:
+            load_template_index(context)
+        except (IOError, OSError) as err:
+            print("Node Wrangler: could not read templates: " + str(err))
+
+
+def templates_path(context):
+    settings = context.user_preferences.addons[__name__].preferences
+    if settings.templates_path:
+        path = bpy.path.abspath(settings.templates_path)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+    return bpy.utils.user_resource('CONFIG', os.path.join("node_wrangler", "templates"), autocreate=True)
+
+
+def template_tree_type(filepath):
+    # Tree type from the header of packed template, JSON templates have to be parsed.
+    with open(filepath, 'rb') as f:
+        head = f.read(6)
+        if head[:3] == NODES_MAGIC:
+            tree_len = struct.unpack_from('<H', head, 4)[0]
+            return f.read(tree_len).decode('utf-8')
+    return read_nodes_file(filepath)['tree']
+
+
+def save_template_index():
+    path = os.path.join(node_templates['path'], TEMPLATE_INDEX_FILE)
+    node_templates['error'] = ""
+    try:
+        with open(path, 'w') as f:
+            json.dump(node_templates['index'], f)
+    except (IOError, OSError) as err:
+        node_templates['error'] = str(err)
+        print("Node Wrangler: could not save template index: " + str(err))
+
+
+def load_template_index(context, rescan=False):
+    if node_templates['loaded'] and not rescan:
+        return node_templates['index']
+    path = templates_path(context)
+    cached = {}
+    if not rescan:
+        try:
+            with open(os.path.join(path, TEMPLATE_INDEX_FILE)) as f:
+                cached = json.load(f)
+        except (IOError, ValueError):
+            pass
+    index = {}
+    for filename in os.listdir(path):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in {'.nwn', '.json'} or filename == TEMPLATE_INDEX_FILE:
+            continue
+        mtime = os.path.getmtime(os.path.join(path, filename))
+        entry = cached.get(filename)
+        if entry is None or entry[2] != mtime:
+            try:
+                entry = [name, template_tree_type(os.path.join(path, filename)), mtime]
+            except (IOError, ValueError, struct.error):
+                print("Node Wrangler: invalid template " + filename)
+                continue
+        index[filename] = entry
+    node_templates['path'] = path
+    node_templates['index'] = index
+    node_templates['loaded'] = True
+    node_templates['error'] = ""
+    if index != cached:
+        save_template_index()
+    return index
+
+
+def templates_for_tree(tree_type):
+    # [(template name, file name), ...] for menus, sorted by name. No file access.
+    return sorted((entry[0], filename) for filename, entry in node_templates['index'].items()
+                  if entry[1] == tree_type)
+
+
+# Tree analysis.
+# Graph passes (duplicates, optimizations). Links are read once into maps by node name.
+class TreeGraph:
+    def __init__(self, nodes, links):
+        self.nodes = nodes
+        self.incoming = {node.name: [] for node in nodes}  # node name: links to inputs
+        self.outgoing = {node.name: [] for node in nodes}  # node name: links from outputs
+        self.socket_index = {}  # socket pointer: index in inputs or outputs
+        for node in nodes:
+            for sockets in (node.inputs, node.outputs):
+                for i, socket in enumerate(sockets):
+                    self.socket_index[socket.as_pointer()] = i
+        for link in links:
+            self.incoming[link.to_node.name].append(link)
+            self.outgoing[link.from_node.name].append(link)
+
+    def input_index(self, link):
+        return self.socket_index[link.to_socket.as_pointer()]
+
+    def output_index(self, link):
+        return self.socket_index[link.from_socket.as_pointer()]
+
+    def order(self):
+        # Nodes sorted so that nodes linked to inputs of a node come before it (Kahn's algorithm).
+        pending = {name: len(links) for name, links in self.incoming.items()}
+        ready = [node for node in self.nodes if not pending[node.name]]
+        ordered = []
+        while ready:
+            node = ready.pop()
+            ordered.append(node)
+            for link in self.outgoing[node.name]:
+                name = link.to_node.name
+                pending[name] -= 1
+                if not pending[name]:
+                    ready.append(link.to_node)
+        if len(ordered) < len(self.nodes):  # cycle of invalid links
+            done = {node.name for node in ordered}
+            ordered.extend(node for node in self.nodes if node.name not in done)
+        return ordered
+
+
+def freeze_value(value):
+    # serialized value to hashable
+    if isinstance(value, list):
+        return tuple(freeze_value(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_value(v)) for k, v in value.items()))
+    return value
+
+
+def structure_ids(graph, ordered):
+    # Hash-consing of nodes: {node name: id}. Nodes get the same id when they have the same type,
+    # properties, unlinked inputs, output values (Value, RGB), struct contents (color ramps, curves)
+    # and their linked inputs come from nodes with the same ids,
+    # so they compute the same values. Nodes without outputs (outputs, frames) are never equal.
+    # "ordered" is graph.order(), ids of linked nodes are known when a node is reached.
+    table = {}
+    ids = {}
+    for node in ordered:
+        if not node.outputs:
+            key = ('', node.name)
+        else:
+            props = node_props(node, node_type_props(node))
+            props['mute'] = node.mute
+            linked = sorted((graph.input_index(link), ids.get(link.from_node.name, link.from_node.name),
+                             graph.output_index(link))
+                            for link in graph.incoming[node.name])
+            key = (node.rna_type.identifier, freeze_value(props),
+                   freeze_value(node_input_values(node)), freeze_value(node_output_values(node)),
+                   freeze_value(node_struct_values(node)), tuple(linked))
+        ids[node.name] = table.setdefault(key, len(table))
+    return ids
+
+
+def duplicate_nodes(graph):
+    # [[node, duplicate, ...], ...] groups of equivalent nodes, upstream groups first.
+    ordered = graph.order()
+    ids = structure_ids(graph, ordered)
+    groups = {}
+    found = []
+    for node in ordered:
+        group = groups.get(ids[node.name])
+        if group is None:
+            groups[ids[node.name]] = [node]
+            found.append(groups[ids[node.name]])
+        else:
+            group.append(node)
+    return [group for group in found if len(group) > 1]
+
+
+# Constant folding.
+# Python versions of Math and Mix RGB nodes, keyed by identifiers of "operations" and "blend_types".
+# Guarded the same way as the nodes: invalid input gives 0.0 instead of an error,
+# None where the node gives inf or nan, such nodes are not folded.
+def safe_divide(a, b):
+    return a / b if b != 0.0 else 0.0
+
+
+def safe_power(a, b):
+    if a < 0.0 and b != int(b):
+        return 0.0
+    try:
+        return a ** b
+    except (OverflowError, ZeroDivisionError):
+        return 0.0
+
+
+def safe_log(a, b):
+    if a > 0.0 and b > 0.0:
+        if b == 1.0:
+            return None  # division by log(1)
+        return log(a) / log(b)
+    return 0.0
+
+
+math_functions = {
+    'ADD': lambda a, b: a + b,
+    'MULTIPLY': lambda a, b: a * b,
+    'SUBTRACT': lambda a, b: a - b,
+    'DIVIDE': safe_divide,
+    'SINE': lambda a, b: sin(a),
+    'COSINE': lambda a, b: cos(a),
+    'TANGENT': lambda a, b: tan(a),
+    'ARCSINE': lambda a, b: asin(a) if -1.0 <= a <= 1.0 else 0.0,
+    'ARCCOSINE': lambda a, b: acos(a) if -1.0 <= a <= 1.0 else 0.0,
+    'ARCTANGENT': lambda a, b: atan(a),
+    'POWER': safe_power,
+    'LOGARITHM': safe_log,
+    'MINIMUM': min,
+    'MAXIMUM': max,
+    'ROUND': lambda a, b: floor(a + 0.5),
+    'LESS_THAN': lambda a, b: 1.0 if a < b else 0.0,
+    'GREATER_THAN': lambda a, b: 1.0 if a > b else 0.0,
+}
+
+
+def mix_channels(fn):
+    # blend of r, g, b channels: fn(c1, c2, t) of one channel
+    def mix(c1, c2, t):
+        return [fn(a, b, t) for a, b in zip(c1, c2)]
+    return mix
+
+
+def mix_dodge(a, b, t):
+    if a == 0.0:
+        return a
+    tmp = 1.0 - t * b
+    if tmp <= 0.0:
+        return 1.0
+    return min(a / tmp, 1.0)
+
+
+def mix_burn(a, b, t):
+    tmp = 1.0 - t + t * b
+    if tmp <= 0.0:
+        return 0.0
+    return max(0.0, min(1.0 - (1.0 - a) / tmp, 1.0))
+
+
+def mix_hsv(c1, c2, t, mode):
+    # HUE, SATURATION, VALUE and COLOR blend types, as ramp_blend() of Blender
+    h1, s1, v1 = colorsys.rgb_to_hsv(*c1)
+    h2, s2, v2 = colorsys.rgb_to_hsv(*c2)
+    if mode == 'SATURATION':
+        if s1 == 0.0:
+            return list(c1)
+        return list(colorsys.hsv_to_rgb(h1, (1.0 - t) * s1 + t * s2, v1))
+    if mode == 'VALUE':
+        return list(colorsys.hsv_to_rgb(h1, s1, (1.0 - t) * v1 + t * v2))
+    # hue (and saturation for color) of color2 with value of color1, blended with factor
+    if s2 == 0.0:
+        return list(c1)
+    col = colorsys.hsv_to_rgb(h2, s1 if mode == 'HUE' else s2, v1)
+    return [a + t * (b - a) for a, b in zip(c1, col)]
+
+
+def mix_soft_light(a, b, t):
+    scr = 1.0 - (1.0 - b) * (1.0 - a)
+    return (1.0 - t) * a + t * ((1.0 - a) * b * a + a * scr)
+
+
+mix_functions = {
+    'MIX': mix_channels(lambda a, b, t: a + t * (b - a)),
+    'ADD': mix_channels(lambda a, b, t: a + t * b),
+    'MULTIPLY': mix_channels(lambda a, b, t: a * (1.0 - t + t * b)),
+    'SUBTRACT': mix_channels(lambda a, b, t: a - t * b),
+    'SCREEN': mix_channels(lambda a, b, t: 1.0 - (1.0 - t + t * (1.0 - b)) * (1.0 - a)),
+    'DIVIDE': mix_channels(lambda a, b, t: (1.0 - t) * a + t * a / b if b != 0.0 else a),
+    'DIFFERENCE': mix_channels(lambda a, b, t: a + t * (abs(a - b) - a)),
+    'DARKEN': mix_channels(lambda a, b, t: a + t * (min(a, b) - a)),
+    'LIGHTEN': mix_channels(lambda a, b, t: a + t * (max(a, b) - a)),
+    'OVERLAY': mix_channels(lambda a, b, t: a * (1.0 - t + 2.0 * t * b) if a < 0.5 else
+                            1.0 - (1.0 - t + 2.0 * t * (1.0 - b)) * (1.0 - a)),
+    'DODGE': mix_channels(mix_dodge),
+    'BURN': mix_channels(mix_burn),
+    'HUE': lambda c1, c2, t: mix_hsv(c1, c2, t, 'HUE'),
+    'SATURATION': lambda c1, c2, t: mix_hsv(c1, c2, t, 'SATURATION'),
+    'VALUE': lambda c1, c2, t: mix_hsv(c1, c2, t, 'VALUE'),
+    'COLOR': lambda c1, c2, t: mix_hsv(c1, c2, t, 'COLOR'),
+    'SOFT_LIGHT': mix_channels(mix_soft_light),
+    'LINEAR_LIGHT': mix_channels(lambda a, b, t: a + t * (2.0 * b - 1.0)),
+}
+
+
+# Compositor and Blender Internal shader nodes blend as ramp_blend(), only Darken and Lighten differ
+ramp_mix_functions = dict(mix_functions)
+ramp_mix_functions.update({
+    'DARKEN': mix_channels(lambda a, b, t: min(a, b + (1.0 - b) * (1.0 - t))),
+    'LIGHTEN': mix_channels(lambda a, b, t: max(a, t * b)),
+})
+
+
+def clamp(value, low=0.0, high=1.0):
+    return max(low, min(value, high))
+
+
+def eval_math(operation, a, b, use_clamp=False):
+    value = math_functions[operation](a, b)
+    return clamp(value) if use_clamp and value is not None else value
+
+
+def eval_mix(blend_type, fac, color1, color2, use_clamp=False, use_alpha=False, functions=mix_functions):
+    # RGBA result, alpha of color1. functions: mix_functions (Cycles) or ramp_mix_functions
+    t = clamp(fac)
+    if use_alpha:
+        t *= color2[3]
+    rgb = functions[blend_type](color1[:3], color2[:3], t)
+    if use_clamp:
+        rgb = [clamp(c) for c in rgb]
+    return list(rgb) + [color1[3]]
+
+
+# weights of r, g, b when a color is linked to a value input
+bw_weights = {
+    'SHADER': (0.2126, 0.7152, 0.0722),
+    'COMPOSITING': (0.35, 0.45, 0.2),
+}
+
+
+def socket_value(value, socket_type, tree_type):
+    # value or RGBA of folded node converted to type of input it's linked to
+    is_color = isinstance(value, list)
+    if socket_type == 'VALUE' and is_color:
+        return sum(w * c for w, c in zip(bw_weights[tree_type], value))
+    if socket_type == 'RGBA' and not is_color:
+        return [value, value, value, 1.0]
+    return value
+
+
+def fold_constants(graph, ordered, tree_type, use_cycles=True):
+    # Values of Math and Mix RGB nodes whose inputs are all unlinked or linked from other such nodes,
+    # Value and RGB nodes. {node name: value (float) or RGBA (list)}. "ordered" is graph.order().
+    # use_cycles: shader nodes are evaluated by Cycles, not Blender Internal.
+    functions = mix_functions if tree_type == 'SHADER' and use_cycles else ramp_mix_functions
+    values = {}
+    for node in ordered:
+        if node.mute:
+            continue
+        if node.type in {'VALUE', 'RGB'}:
+            value = node.outputs[0].default_value
+            values[node.name] = value if node.type == 'VALUE' else list(value)
+            continue
+        if node.type == 'MATH':
+            if node.operation not in math_functions:
+                continue
+        elif node.type == 'MIX_RGB':
+            if node.blend_type not in mix_functions:
+                continue
+        else:
+            continue
+        inputs = []
+        for socket in node.inputs:
+            value = socket.default_value
+            if socket.type == 'RGBA':
+                value = list(value)
+            inputs.append(value)
+        constant = True
+        for link in graph.incoming[node.name]:
+            value = values.get(link.from_node.name)
+            if value is None:
+                constant = False
+                break
+            i = graph.input_index(link)
+            inputs[i] = socket_value(value, node.inputs[i].type, tree_type)
+        if not constant:
+            continue
+        use_clamp = getattr(node, 'use_clamp', False)
+        if node.type == 'MATH':
+            value = eval_math(node.operation, inputs[0], inputs[1], use_clamp)
+            if value is not None:
+                values[node.name] = value
+        else:
+            values[node.name] = eval_mix(node.blend_type, inputs[0], inputs[1], inputs[2],
+                                         use_clamp, getattr(node, 'use_alpha', False), functions)
+    return values
+
+
+def bypass_input(node, tree_type):
+    # Index of input that node passes on unchanged (Mix with factor 0 or 1, adding 0, multiplying by 1),
+    # None if output depends on more inputs.
+    if node.mute:
+        return None
+    if node.type in {'MIX_RGB', 'MIX_SHADER'}:
+        fac = node.inputs[0]
+        if fac.is_linked or getattr(node, 'use_clamp', False):
+            return None
+        if fac.default_value == 0.0:
+            return 1
+        if fac.default_value == 1.0:
+            if node.type == 'MIX_SHADER':
+                return 2
+            # compositor Mix keeps alpha of first image
+            if node.blend_type == 'MIX' and not node.use_alpha and tree_type == 'SHADER':
+                return 2
+    elif node.type == 'MATH' and not node.use_clamp:
+        identity = {'ADD': 0.0, 'MULTIPLY': 1.0}.get(node.operation)
+        if identity is not None:
+            for i, other in ((0, 1), (1, 0)):
+                if not node.inputs[i].is_linked and node.inputs[i].default_value == identity:
+                    return other
+    return None
+
+
+def nested_trees(trees):
+    # Trees and the node groups used in them, to any depth. Each tree once, however many trees use it.
+    # Yields (tree, path), path: group nodes leading to the tree from the first tree it was found in.
+    seen = set()
+    stack = [(tree, ()) for tree in reversed(list(trees))]
+    while stack:
+        tree, path = stack.pop()
+        key = tree.as_pointer()
+        if key in seen:
+            continue
+        seen.add(key)
+        yield tree, path
+        groups = [node for node in tree.nodes if node.type == 'GROUP' and node.node_tree]
+        for node in reversed(groups):
+            stack.append((node.node_tree, path + (node,)))
+
+
+def tree_has_outputs(tree, memo):
+    # True if a group has nodes used without linked outputs (viewers, file outputs), in nested groups too.
+    # memo: {tree pointer: result}, shared by one operation so that each group is checked once.
+    key = tree.as_pointer()
+    if key not in memo:
+        memo[key] = False  # in case of a group used inside itself
+        memo[key] = any(is_output_node(node, memo) for node in tree.nodes
+                        if node.type not in {'GROUP_INPUT', 'GROUP_OUTPUT'})
+    return memo[key]
+
+
+def is_output_node(node, memo):
+    # Node used even if its outputs are not linked, memo as in tree_has_outputs().
+    if node.type == 'GROUP':
+        return node.node_tree is not None and tree_has_outputs(node.node_tree, memo)
+    return node.type in node_types.end_types
+
+
+def unused_nodes(graph, ordered, unused, memo=None):
+    # Add nodes that are only used by nodes in "unused" to it. "ordered" is graph.order().
+    if memo is None:
+        memo = {}
+    for node in reversed(ordered):
+        outgoing = graph.outgoing[node.name]
+        if (outgoing and not is_output_node(node, memo) and
+                all(link.to_node.name in unused for link in outgoing)):
+            unused.add(node.name)
+    return unused
+
+
+# results of last complexity report, shown in the panel
+complexity_report = {
+    'tree': None,  # name of analyzed tree
+    'stats': None,  # tree_complexity() of it
+    'top': [],  # [(material name, stats), ...] most expensive materials
+}
+
+
+def image_key(image):
+    # images loaded from the same file are duplicates
+    if image.source == 'FILE' and not image.packed_file:
+        return os.path.normpath(bpy.path.abspath(image.filepath, library=image.library))
+    return image.name
+
+
+def tree_complexity(nodes, links, tree_type):
+    # Statistics of a tree for the complexity report, in one pass over nodes in topological order
+    # and one back (unused nodes).
+    # Depth of a node is the number of nodes on the longest path to it, textures are counted on that path.
+    graph = TreeGraph(nodes, links)
+    ordered = graph.order()
+    lookup_types = node_types.texture_types | node_types.image_types
+    categories = {}
+    depth = {}
+    textures = {}
+    images = {}  # image_key: pointers of images loading it
+    muted = 0
+    for node in ordered:
+        if node.type == 'FRAME':
+            continue
+        category = node_types.category.get((tree_type, node.type), 'Other')
+        categories[category] = categories.get(category, 0) + 1
+        if node.mute:
+            muted += 1
+        node_depth = node_textures = 0
+        for link in graph.incoming[node.name]:
+            name = link.from_node.name
+            if name not in depth:
+                continue  # cycle of invalid links, order() puts those nodes last
+            if (depth[name], textures[name]) > (node_depth, node_textures):
+                node_depth, node_textures = depth[name], textures[name]
+        depth[node.name] = node_depth + 1
+        textures[node.name] = node_textures + (node.type in lookup_types)
+        image = getattr(node, 'image', None)
+        if image is not None:
+            images.setdefault(image_key(image), set()).add(image.as_pointer())
+
+    outputs = [node for node in ordered if not node.outputs and node.type != 'FRAME']
+    used = set(node.name for node in outputs)
+    for node in reversed(ordered):
+        if any(link.to_node.name in used for link in graph.outgoing[node.name]):
+            used.add(node.name)
+    critical = None
+    if outputs:
+        critical = max(outputs, key=lambda node: (depth[node.name], textures[node.name]))
+    return {
+        'nodes': len(depth),
+        'categories': categories,
+        'outputs': dict((node.name, depth[node.name]) for node in outputs),
+        'depth': depth[critical.name] if critical else 0,
+        'critical_textures': textures[critical.name] if critical else 0,
+        'unused': len(depth) - len(used & set(depth)),
+        'duplicate_images': sum(len(pointers) - 1 for pointers in images.values()),
+        'muted': muted,
+    }
+
+
+# Incremental layout.
+# Operators that add or replace nodes mark them changed, "Arrange Changed" places only those nodes
+# and moves nodes downstream of them just as far as needed to stop overlaps.
+# {node_tree pointer: {node name: place}} place: False if location of node is kept (replaced nodes).
+changed_nodes = {}
+
+
+def mark_changed(nodes, changed, place=True):
+    tree_changed = changed_nodes.setdefault(nodes.id_data.as_pointer(), {})
+    for node in changed:
+        tree_changed[node.name] = place
+
+
+def absolute_location(node):
+    x, y = node.location
+    parent = node.parent
+    while parent:
+        x += parent.location.x
+        y += parent.location.y
+        parent = parent.parent
+    return x, y
+
+
+def set_absolute_location(node, x, y):
+    px, py = absolute_location(node.parent) if node.parent else (0.0, 0.0)
+    node.location = x - px, y - py
+
+
+class NodeGrid:
+    # Rectangles of nodes (absolute x, y of top left, width, height) in buckets of a uniform grid,
+    # so that finding nodes overlapping a rectangle only checks nodes near it.
+    def __init__(self, cell=400.0):
+        self.cell = cell
+        self.rects = {}  # node name: [x, y, w, h]
+        self.buckets = {}
+
+    def keys(self, rect):
+        x, y, w, h = rect
+        c = self.cell
+        for i in range(int(x // c), int((x + w) // c) + 1):
+            for j in range(int((y - h) // c), int(y // c) + 1):
+                yield i, j
+
+    def add(self, name, rect):
+        self.rects[name] = rect
+        for key in self.keys(rect):
+            self.buckets.setdefault(key, set()).add(name)
+
+    def remove(self, name):
+        for key in self.keys(self.rects[name]):
+            self.buckets[key].discard(name)
+
+    def move(self, name, x, y):
+        self.remove(name)
+        self.rects[name][0] = x
+        self.rects[name][1] = y
+        self.add(name, self.rects[name])
+
+    def overlapping(self, name, margin=0.0):
+        x, y, w, h = self.rects[name]
+        found = set()
+        for key in self.keys((x - margin, y + margin, w + 2 * margin, h + 2 * margin)):
+            for other in self.buckets.get(key, ()):
+                if other != name and other not in found:
+                    ox, oy, ow, oh = self.rects[other]
+                    if (x - margin < ox + ow and ox < x + w + margin and
+                            y + margin > oy - oh and oy > y - h - margin):
+                        found.add(other)
+        return found
+
+
+def socket_neighbours(node, outputs):
+    # Names of nodes linked to outputs (or inputs) of node. Only linked sockets are asked for links.
+    names = []
+    for socket in (node.outputs if outputs else node.inputs):
+        if socket.is_linked:
+            for link in socket.links:
+                names.append(link.to_node.name if outputs else link.from_node.name)
+    return names
+
+
+def layout_changed(nodes, links, changed, spacing=80.0):
+    # Place changed nodes next to their linked nodes and resolve overlaps they cause.
+    # changed: {node name: place}. Returns names of moved nodes.
+    # Links are only read from sockets of changed nodes and of nodes pushed by them (socket.links goes
+    # over all links of the tree). Rects of all nodes are read in one pass, so that placed nodes
+    # don't land on any node, and found near the placed ones through the grid.
+    changed = dict((name, place) for name, place in changed.items()
+                   if name in nodes and nodes[name].type != 'FRAME')
+    grid = NodeGrid()
+    for node in nodes:
+        if node.type != 'FRAME':
+            x, y = absolute_location(node)
+            grid.add(node.name, [x, y, node.dimensions.x, node.dimensions.y])
+    outgoing = {}  # node name: names of nodes linked to its outputs, read when needed
+
+    def downstream_of(name):
+        if name not in outgoing:
+            outgoing[name] = [down for down in socket_neighbours(nodes[name], True)
+                              if nodes[down].type != 'FRAME']
+        return outgoing[name]
+
+    upstream = dict((name, socket_neighbours(nodes[name], False)) for name in changed)
+    downstream = dict((name, downstream_of(name)) for name in changed)
+
+    # changed nodes in order of links between them
+    order = []
+    pending = {name: sum(1 for up in upstream[name] if up in changed) for name in changed}
+    ready = [name for name, count in pending.items() if not count]
+    while ready:
+        name = ready.pop()
+        order.append(name)
+        for down in downstream[name]:
+            if down in pending:
+                pending[down] -= 1
+                if not pending[down]:
+                    ready.append(down)
+    order.extend(name for name in changed if name not in order)
+
+    # nodes with final location
+    anchors = set(name for name in grid.rects if not changed.get(name, False))
+    # right of linked inputs first (merge nodes), then left of linked outputs (texture setups)
+    for name in order:
+        ups = [grid.rects[up] for up in upstream[name] if up in anchors]
+        if changed[name] and ups:
+            grid.move(name, max(x + w for x, y, w, h in ups) + spacing,
+                      sum(y for x, y, w, h in ups) / len(ups))
+            anchors.add(name)
+    for name in reversed(order):
+        downs = [grid.rects[down] for down in downstream[name] if down in anchors]
+        if changed[name] and name not in anchors and downs:
+            rect = grid.rects[name]
+            grid.move(name, min(x for x, y, w, h in downs) - rect[2] - spacing,
+                      sum(y for x, y, w, h in downs) / len(downs))
+            anchors.add(name)
+
+    moved = set(changed)
+    for name in order:
+        # nodes downstream of changed node are shifted right, others make changed node move down
+        reachable = set()
+        stack = [name]
+        while stack:
+            for down in downstream_of(stack.pop()):
+                if down not in reachable:
+                    reachable.add(down)
+                    stack.append(down)
+        for _ in range(len(grid.rects)):
+            others = grid.overlapping(name, spacing / 2.0)
+            if not others:
+                break
+            blocking = [other for other in others if other not in reachable or other in changed]
+            if blocking:
+                lowest = min(grid.rects[other][1] - grid.rects[other][3] for other in blocking)
+                grid.move(name, grid.rects[name][0], lowest - spacing / 2.0)
+                continue
+            # push downstream nodes, and their downstream nodes as far as they are too close
+            right = grid.rects[name][0] + grid.rects[name][2] + spacing
+            stack = [(other, right) for other in others]
+            while stack:
+                other, limit = stack.pop()
+                rect = grid.rects[other]
+                if rect[0] < limit:
+                    grid.move(other, limit, rect[1])
+                    moved.add(other)
+                    next_limit = rect[0] + rect[2] + spacing
+                    stack.extend((down, next_limit) for down in downstream_of(other) if down not in changed)
+
+    for name in moved:
+        set_absolute_location(nodes[name], grid.rects[name][0], grid.rects[name][1])
+    return moved
+
+
+def connected_components(count, edges, max_size=0):
+    # Union-find over edges [(i, j), ...] of items 0..count-1. Returns lists of indices of connected items.
+    # With max_size, sets are only joined while they stay that small, which splits big components
+    # into connected clusters.
+    parent = list(range(count))
+    size = [1] * count
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:  # path compression
+            parent[i], i = root, parent[i]
+        return root
+
+    for i, j in edges:
+        a, b = find(i), find(j)
+        if a == b or (max_size and size[a] + size[b] > max_size):
+            continue
+        if size[a] < size[b]:
+            a, b = b, a
+        parent[b] = a
+        size[a] += size[b]
+    components = {}
+    for i in range(count):
+        components.setdefault(find(i), []).append(i)
+    return list(components.values())
+
+
+def link_adjacency(links):
+    # {node name: names of nodes linked to its inputs}, {node name: names of nodes linked to its outputs}
+    upstream = {}
+    downstream = {}
+    for link in links:
+        from_name = link.from_node.name
+        to_name = link.to_node.name
+        upstream.setdefault(to_name, []).append(from_name)
+        downstream.setdefault(from_name, []).append(to_name)
+    return upstream, downstream
+
+
+def linked_nodes(start, adjacency, depth=0, stop=None):
+    # Names of nodes reached from names in start by breadth first search over adjacency maps,
+    # up to depth steps (0: no limit). Nodes for which stop(name) is True are reached but not passed.
+    found = set(start)
+    frontier = list(start)
+    step = 0
+    while frontier and (not depth or step < depth):
+        step += 1
+        next_frontier = []
+        for name in frontier:
+            if stop is not None and name not in start and stop(name):
+                continue
+            for adjacent in adjacency:
+                for other in adjacent.get(name, ()):
+                    if other not in found:
+                        found.add(other)
+                        next_frontier.append(other)
+        frontier = next_frontier
+    return found
+
+
+# Geometry kernel.
+# Math on rectangles of many nodes at once: [x, y, width, height], x, y of top left corner (node.location),
+# y goes up. Uses NumPy arrays when NumPy is available, plain Python otherwise.
+# NumPy is imported on first use of the kernel, not when the add-on is loaded.
+geometry_kernel = {
+    'loaded': False,
+    'numpy': None,
+}
+
+
+def kernel_numpy():
+    # NumPy module, None if it isn't available
+    if not geometry_kernel['loaded']:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        geometry_kernel['numpy'] = numpy
+        geometry_kernel['loaded'] = True
+    return geometry_kernel['numpy']
+
+
+def rects_array(rects):
+    # rects as an array, arrays of NodeGeometry are used as they are
+    numpy = kernel_numpy()
+    if numpy is not None:
+        return numpy.asarray(rects, dtype=numpy.float64).reshape(-1, 4)
+    return rects
+
+
+def rects_bounds(rects):
+    # min x, min y, max x, max y of all rects
+    numpy = kernel_numpy()
+    if numpy is not None:
+        r = rects_array(rects)
+        return (float(r[:, 0].min()), float((r[:, 1] - r[:, 3]).min()),
+                float((r[:, 0] + r[:, 2]).max()), float(r[:, 1].max()))
+    return (min(r[0] for r in rects), min(r[1] - r[3] for r in rects),
+            max(r[0] + r[2] for r in rects), max(r[1] for r in rects))
+
+
+def rects_mid(rects):
+    # middle of bounding box of rects
+    min_x, min_y, max_x, max_y = rects_bounds(rects)
+    return (min_x + max_x) / 2.0, (min_y + max_y) / 2.0
+
+
+def overlapping_pairs(rects, margin=0.0, block=512):
+    # [(i, j), ...] i < j of rects closer than margin. NumPy compares blocks of rects against all following
+    # rects, so memory stays at block * len(rects) booleans.
+    count = len(rects)
+    pairs = []
+    numpy = kernel_numpy()
+    if numpy is not None:
+        r = rects_array(rects)
+        left, top = r[:, 0], r[:, 1]
+        right, bottom = left + r[:, 2], top - r[:, 3]
+        for start in range(0, count, block):
+            end = min(start + block, count)
+            mask = ((left[start:end, None] - margin < right[None, :]) &
+                    (left[None, :] < right[start:end, None] + margin) &
+                    (top[start:end, None] + margin > bottom[None, :]) &
+                    (top[None, :] > bottom[start:end, None] - margin))
+            mask &= numpy.arange(count)[None, :] > numpy.arange(start, end)[:, None]
+            pairs.extend((int(i) + start, int(j)) for i, j in zip(*numpy.nonzero(mask)))
+        return pairs
+    for i in range(count):
+        x, y, w, h = rects[i]
+        for j in range(i + 1, count):
+            ox, oy, ow, oh = rects[j]
+            if x - margin < ox + ow and ox < x + w + margin and y + margin > oy - oh and oy > y - h - margin:
+                pairs.append((i, j))
+    return pairs
+
+
+def align_positions(rects, axis):
+    # New top left corners of rects aligned in a row (axis 'AXIS_Y') or column ('AXIS_X') with even spacing,
+    # spread between the first and the last of them.
+    count = len(rects)
+    numpy = kernel_numpy()
+    if numpy is not None:
+        r = rects_array(rects)
+        x, y, w, h = r[:, 0], r[:, 1], r[:, 2], r[:, 3]
+        if axis == 'AXIS_Y':
+            order = numpy.lexsort((-y, x))  # by x, then top first
+            top = numpy.lexsort((x, -y))
+            first, last = order[0], order[-1]
+            loc_y = (y[top[0]] - h[top[0]] / 2.0 + y[top[-1]] - h[top[-1]] / 2.0) / 2.0
+            offset = (x[last] - x[first] - w.sum() + w[last]) / (count - 1)
+            ws = w[order]
+            xs = x[first] + numpy.concatenate(([0.0], numpy.cumsum(ws[:-1] + offset)))
+            ys = loc_y + h[order] / 2.0
+        else:
+            order = numpy.lexsort((x, -y))  # top first, then by x
+            left = numpy.lexsort((-y, x))
+            first, last = order[0], order[-1]
+            loc_x = (x[left[-1]] + w[left[-1]] / 2.0 + x[left[0]] + w[left[0]] / 2.0) / 2.0
+            offset = (y[last] - y[first] + h.sum() - h[first]) / (count - 1)
+            hs = h[order]
+            ys = y[first] + numpy.concatenate(([0.0], numpy.cumsum(offset - hs[:-1])))
+            xs = loc_x - w[order] / 2.0
+        positions = numpy.empty((count, 2))
+        positions[order, 0] = xs
+        positions[order, 1] = ys
+        return positions.tolist()
+
+    positions = [None] * count
+    indices = range(count)
+    if axis == 'AXIS_Y':
+        order = sorted(indices, key=lambda i: (rects[i][0], -rects[i][1]))
+        top = sorted(indices, key=lambda i: (-rects[i][1], rects[i][0]))
+        first, last = rects[order[0]], rects[order[-1]]
+        loc_x = first[0]
+        loc_y = (rects[top[0]][1] - rects[top[0]][3] / 2.0 + rects[top[-1]][1] - rects[top[-1]][3] / 2.0) / 2.0
+        offset = (last[0] - first[0] - sum(r[2] for r in rects) + last[2]) / (count - 1)
+        for i in order:
+            positions[i] = [loc_x, loc_y + rects[i][3] / 2.0]
+            loc_x += offset + rects[i][2]
+    else:
+        order = sorted(indices, key=lambda i: (-rects[i][1], rects[i][0]))
+        left = sorted(indices, key=lambda i: (rects[i][0], -rects[i][1]))
+        first, last = rects[order[0]], rects[order[-1]]
+        loc_x = (rects[left[-1]][0] + rects[left[-1]][2] / 2.0 + rects[left[0]][0] + rects[left[0]][2] / 2.0) / 2.0
+        loc_y = first[1]
+        offset = (last[1] - first[1] + sum(r[3] for r in rects) - first[3]) / (count - 1)
+        for i in order:
+            positions[i] = [loc_x - rects[i][2] / 2.0, loc_y]
+            loc_y += offset - rects[i][3]
+    return positions
+
+
+class NodeGeometry:
+    # Absolute rects and parent offsets of nodes read in one loop, locations written back in one loop.
+    # rects are kept in the form of the geometry kernel (an array with NumPy), so they are converted once.
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        rects = []
+        offsets = []
+        for node in self.nodes:
+            ox, oy = absolute_location(node.parent) if node.parent else (0.0, 0.0)
+            x, y = node.location
+            w, h = node.dimensions
+            rects.append([x + ox, y + oy, w, h])
+            offsets.append((ox, oy))
+        self.rects = rects_array(rects)
+        self.offsets = offsets
+
+    def write(self, positions):
+        for node, (x, y), (ox, oy) in zip(self.nodes, positions, self.offsets):
+            node.location = x - ox, y - oy
+
+
+# Arrange.
+# Layout is a pure function over plain data, so that many trees can be arranged in worker processes:
+# rects = [[x, y, width, height], ...] (absolute location of top left corner), edges = [[from index, to index], ...]
+# Nodes go to columns by the longest path from nodes without inputs, and are stacked in columns
+# next to the nodes linked to them. Result is centered on the old middle of the rectangles.
+def arrange_layout(rects, edges, spacing=80.0, start_align=True, end_align=True):
+    count = len(rects)
+    upstream = [[] for i in range(count)]
+    downstream = [[] for i in range(count)]
+    for i, j in edges:
+        if i != j:
+            upstream[j].append(i)
+            downstream[i].append(j)
+    # columns, Kahn's algorithm. Nodes in cycles of invalid links stay in column 0.
+    column = [0] * count
+    pending = [len(up) for up in upstream]
+    ready = [i for i in range(count) if not pending[i]]
+    while ready:
+        i = ready.pop()
+        for j in downstream[i]:
+            column[j] = max(column[j], column[i] + 1)
+            pending[j] -= 1
+            if not pending[j]:
+                ready.append(j)
+    num_columns = max(column) + 1 if count else 0
+    if not start_align:
+        # nodes without inputs next to the nodes they are linked to
+        for i in sorted(range(count), key=lambda i: -column[i]):
+            if not upstream[i] and downstream[i]:
+                column[i] = min(column[j] for j in downstream[i]) - 1
+    if end_align:
+        for i in range(count):
+            if upstream[i] and not downstream[i]:
+                column[i] = num_columns - 1
+
+    columns = [[] for c in range(num_columns)]
+    for i in range(count):
+        columns[column[i]].append(i)
+    x = 0.0
+    positions = [None] * count
+    for nodes in columns:
+        if not nodes:
+            continue
+        # wanted center of node: middle of centers of nodes linked to it, or old location
+        wanted = {}
+        for i in nodes:
+            placed = [positions[j][1] - rects[j][3] / 2.0 for j in upstream[i] if positions[j]]
+            if placed:
+                wanted[i] = sum(placed) / len(placed)
+            else:
+                wanted[i] = rects[i][1] - rects[i][3] / 2.0
+        nodes.sort(key=lambda i: -wanted[i])
+        bottom = None
+        for i in nodes:
+            top = wanted[i] + rects[i][3] / 2.0
+            if bottom is not None and top > bottom - spacing / 2.0:
+                top = bottom - spacing / 2.0
+            positions[i] = [x, top]
+            bottom = top - rects[i][3]
+        x += max(rects[i][2] for i in nodes) + spacing
+
+    if count:
+        old_mid = rects_mid(rects)
+        new_mid = rects_mid([[p[0], p[1], r[2], r[3]] for p, r in zip(positions, rects)])
+        dx = old_mid[0] - new_mid[0]
+        dy = old_mid[1] - new_mid[1]
+        for p in positions:
+            p[0] += dx
+            p[1] += dy
+    return positions
+
+
+def arrange_job(job):
+    # worker of batch arrange: job = (rects, edges, spacing, start_align, end_align)
+    return arrange_layout(*job)
+
+
+def node_size(node):
+    # Dimensions are only known after a node has been drawn, estimate them for trees not opened in editor.
+    w, h = node.dimensions
+    if w and h:
+        return w, h
+    if node.hide:
+        return node.width_hidden, 30.0
+    sockets = len([s for s in node.inputs if s.enabled]) + len([s for s in node.outputs if s.enabled])
+    return node.width, 40.0 + 22.0 * sockets
+
+
+def layout_data(nodes, links, selected_only=False):
+    # Plain data of nodes for arrange_layout(). Frames fit to their nodes, so they are left out.
+    names = []
+    index = {}
+    rects = []
+    for node in nodes:
+        if node.type != 'FRAME' and (node.select or not selected_only):
+            index[node.name] = len(names)
+            names.append(node.name)
+            x, y = absolute_location(node)
+            w, h = node_size(node)
+            rects.append([x, y, w, h])
+    edges = []
+    for link in links:
+        i = index.get(link.from_node.name)
+        j = index.get(link.to_node.name)
+        if i is not None and j is not None:
+            edges.append([i, j])
+    return names, rects, edges
+
+
+def apply_layout(nodes, names, positions):
+    for name, (x, y) in zip(names, positions):
+        set_absolute_location(nodes[name], x, y)
+
+
+# Purge of unused data.
+# References that node trees make to other datablocks are found in one pass over all trees of the file.
+# Datablocks with users other than those references (objects, scenes, fake users...) are used,
+# and so is everything they reference, to any depth. All the rest can be removed.
+# Datablocks that can be removed, as names of collections in bpy.data
+purge_collections = ('materials', 'worlds', 'node_groups', 'textures', 'images', 'movieclips')
+# Datablocks whose node trees are part of them, only used as sources of references
+tree_owner_collections = ('materials', 'worlds', 'lamps', 'textures', 'scenes', 'linestyles')
+
+
+def node_references(tree):
+    # datablocks used by nodes of a tree
+    image_types = node_types.image_types
+    refs = []
+    for node in tree.nodes:
+        if node.type == 'GROUP':
+            data = node.node_tree
+        elif node.type == 'TEXTURE':
+            data = node.texture
+        elif node.type in image_types:
+            data = node.image
+        elif node.type in {'MATERIAL', 'MATERIAL_EXT'}:
+            data = node.material
+        else:
+            data = getattr(node, 'clip', None)
+        if data is not None:
+            refs.append(data)
+    return refs
+
+
+def unused_data():
+    # [(collection name, datablock), ...] of datablocks not used anywhere in the file
+    references = {}  # pointer: [datablocks used by it]
+    for name in set(purge_collections + tree_owner_collections):
+        for data in getattr(bpy.data, name, ()):
+            refs = []
+            tree = data if name == 'node_groups' else getattr(data, 'node_tree', None)
+            if tree is not None:
+                refs.extend(node_references(tree))
+            if name == 'textures' and getattr(data, 'image', None) is not None:
+                refs.append(data.image)
+            references[data.as_pointer()] = refs
+    # users that are references found above
+    counted = {}
+    for refs in references.values():
+        for data in refs:
+            key = data.as_pointer()
+            counted[key] = counted.get(key, 0) + 1
+    # used datablocks
+    used = set()
+    stack = []
+    for name in set(purge_collections + tree_owner_collections):
+        for data in getattr(bpy.data, name, ()):
+            key = data.as_pointer()
+            if (name == 'scenes' or data.users > counted.get(key, 0) or
+                    (name == 'images' and data.type in {'RENDER_RESULT', 'COMPOSITING'})):
+                used.add(key)
+                stack.append(key)
+    while stack:
+        for data in references.get(stack.pop(), ()):
+            key = data.as_pointer()
+            if key not in used:
+                used.add(key)
+                stack.append(key)
+    return [(name, data) for name in purge_collections for data in getattr(bpy.data, name)
+            if data.as_pointer() not in used]
+
+
+def data_memory(data):
+    # Estimated bytes of an image or clip: loaded pixels, else packed or external file
+    if isinstance(data, bpy.types.Image):
+        if data.has_data:
+            w, h = data.size
+            return w * h * data.channels * (4 if data.is_float else 1)
+        if data.packed_file:
+            return data.packed_file.size
+    if isinstance(data, (bpy.types.Image, bpy.types.MovieClip)) and data.source in {'FILE', 'MOVIE'}:
+        path = bpy.path.abspath(data.filepath, library=data.library)
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+    return 0
+
+
+# Duplicate images.
+# Appended assets bring their own copies of images ("wood.png", "wood.png.001"), each loaded separately.
+# Images loading the same file, or files with the same content, are found by grouping by path,
+# then by file size, and hashing only files that have the same size as another one.
+
+
+def file_trees():
+    # every node tree in the file
+    for name in tree_owner_collections:
+        for data in getattr(bpy.data, name, ()):
+            if getattr(data, 'node_tree', None) is not None:
+                yield data.node_tree
+    for tree in bpy.data.node_groups:
+        yield tree
+
+
+def image_settings(image):
+    # settings that change how pixels of an image are used, only images with the same settings are merged
+    colorspace = getattr(image, 'colorspace_settings', None)
+    return (colorspace.name if colorspace is not None else None,
+            getattr(image, 'alpha_mode', None), getattr(image, 'use_alpha', None))
+
+
+def file_hash(path):
+    # sha1 of a file read through a memory map, None if it can't be read
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return hashlib.sha1(data).hexdigest()
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def duplicate_images(images, threads=0):
+    # Lists of images loading the same content with the same settings, the one to keep first.
+    by_path = {}  # (path, settings): images
+    for image in images:
+        if image.source == 'FILE' and not image.packed_file:
+            by_path.setdefault((image_key(image), image_settings(image)), []).append(image)
+    by_size = {}  # (size, settings): paths
+    for path, settings in by_path:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue  # missing files are left alone
+        if size:
+            by_size.setdefault((size, settings), []).append(path)
+    # a path loaded with different settings is in several lists, it is hashed once
+    to_hash = list(set(path for paths in by_size.values() if len(paths) > 1 for path in paths))
+    hashes = {}
+    if to_hash:
+        # hashlib releases the GIL on big buffers, so threads hash files in parallel
+        with ThreadPoolExecutor(threads or multiprocessing.cpu_count()) as executor:
+            hashes = dict(zip(to_hash, executor.map(file_hash, to_hash)))
+    by_content = {}  # (hash or path, settings): images
+    for (path, settings), group in by_path.items():
+        content = hashes.get(path) or path
+        by_content.setdefault((content, settings), []).extend(group)
+
+    def keep_first(image):
+        # local images with names that don't end in .001 and alike are kept
+        name = image.name
+        numbered = len(name) > 4 and name[-4] == '.' and name[-3:].isdigit()
+        return image.library is not None, numbered, name
+
+    return [sorted(group, key=keep_first) for group in by_content.values() if len(group) > 1]
+
+
+def remap_images(groups):
+    # Make users of images (image nodes, textures, UV faces, brushes, image editors and 3D view backgrounds)
+    # use the first image of their group. Returns number of remapped users.
+    keep = {}
+    for group in groups:
+        for image in group[1:]:
+            keep[image.as_pointer()] = group[0]
+    remapped = [0]
+
+    def remap(owner, attr):
+        image = getattr(owner, attr, None)
+        if image is not None and image.as_pointer() in keep:
+            setattr(owner, attr, keep[image.as_pointer()])
+            remapped[0] += 1
+
+    for tree in file_trees():
+        if tree.library is not None:
+            continue
+        for node in tree.nodes:
+            if node.type in node_types.image_types:
+                remap(node, 'image')
+    for texture in bpy.data.textures:
+        if texture.library is None:
+            remap(texture, 'image')
+    for brush in bpy.data.brushes:
+        if brush.library is None:
+            remap(brush, 'clone_image')
+    for mesh in bpy.data.meshes:
+        if mesh.library is None:
+            for layer in getattr(mesh, 'uv_textures', ()):
+                for face in layer.data:
+                    remap(face, 'image')
+    for screen in bpy.data.screens:
+        for area in screen.areas:
+            for space in area.spaces:
+                if space.type == 'IMAGE_EDITOR':
+                    remap(space, 'image')
+                elif space.type == 'VIEW_3D':
+                    for background in space.background_images:
+                        remap(background, 'image')
+    return remapped[0]
+
+
+def remove_data(unused):
+    # Remove datablocks in unused [(collection name, datablock), ...]. Datablocks are removed once they have
+    # no users, which happens when datablocks using them are removed. Returns the ones left.
+    pending = unused
+    while pending:
+        left = []
+        for name, data in pending:
+            if data.users:
+                left.append((name, data))
+            else:
+                getattr(bpy.data, name).remove(data)
+        if len(left) == len(pending):
+            break
+        pending = left
+    return pending
 
 
 # Addon prefs
@@ -698,6 +2657,22 @@ class NWNodeWrangler(bpy.types.AddonPreferences):
         default="",
         description="Show only hotkeys that have this text in their name"
     )
+    templates_path = StringProperty(
+        name="Templates Folder",
+        subtype='DIR_PATH',
+        default="",
+        update=templates_path_update,
+        description="Folder of node templates, leave empty to use the user config folder"
+    )
+    undo_window = FloatProperty(
+        name="Hotkey Undo Window",
+        min=0.0,
+        max=10.0,
+        default=1.0,
+        subtype='TIME',
+        unit='TIME',
+        description="Repeated presses of the Change Factor and Next/Previous Blend Type hotkeys within this many seconds share one undo step, 0 for one step per press"
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -705,6 +2680,8 @@ class NWNodeWrangler(bpy.types.AddonPreferences):
         col.prop(self, "merge_position")
         col.prop(self, "merge_hide")
         col.prop(self, "bgl_antialiasing")
+        col.prop(self, "templates_path")
+        col.prop(self, "undo_window")
 
         box = col.box()
         col = box.column(align=True)
@@ -732,6 +2709,11 @@ class NWNodeWrangler(bpy.types.AddonPreferences):
                             keystr = "Ctrl " + keystr
                         row.label(keystr)
 
+        reg_time = "Registered in %.1f ms" % (lazy_ui['time'] * 1000.0)
+        if lazy_ui['registered']:
+            reg_time += ", menus and keymaps in %.1f ms" % (lazy_ui['ui_time'] * 1000.0)
+        layout.label(reg_time)
+
 
 class NWBase:
 
@@ -741,6 +2723,92 @@ class NWBase:
         return space.type == 'NODE_EDITOR' and space.node_tree is not None
 
 
+class NWChunked:
+    # Mixin of operators that do their work in chunks from a modal timer, so that Blender stays
+    # responsive on big trees, shows progress and can be stopped with Esc.
+    # The operator defines:
+    # steps(context) - generator doing the work, yields the done fraction (0.0 - 1.0) at points
+    #     where the data is consistent. The operator can be stopped at any of those.
+    # finish(context) - reports and returns the result of the operator.
+    # rollback(context) - optional, undoes the work done so far when stopped and returns True.
+    #     Without it the work done so far is kept and finish() is called.
+    # When invoked, steps run for "chunk_time" seconds per timer tick, the first chunk right away,
+    # so short operations finish without going modal. Execute (redo, scripts) does all at once.
+
+    chunk_time = 0.05  # seconds of work per timer tick
+    # events passed to the editor while working, anything else could change the tree
+    chunk_pass_events = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEMOVE'}
+
+    run_modal = BoolProperty(options={'HIDDEN', 'SKIP_SAVE'})
+
+    def finish(self, context):
+        return {'FINISHED'}
+
+    def rollback(self, context):
+        return False
+
+    def invoke(self, context, event):
+        self.run_modal = True
+        return self.execute(context)
+
+    def execute(self, context):
+        if not self.run_modal:
+            for done in self.steps(context):
+                pass
+            return self.finish(context)
+        self.run_modal = False  # redo does all at once
+        self._steps = self.steps(context)
+        self._done = 0.0
+        if self.run_chunk():
+            return self.finish(context)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.01, context.window)
+        self._area = context.area
+        wm.progress_begin(0.0, 1.0)
+        self.update_progress(context)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def run_chunk(self):
+        # True when all steps are done
+        end = time.time() + self.chunk_time
+        for done in self._steps:
+            self._done = done
+            if time.time() > end:
+                return False
+        return True
+
+    def update_progress(self, context):
+        context.window_manager.progress_update(self._done)
+        if self._area:
+            self._area.header_text_set("%s: %d%% done, Esc to stop" % (self.bl_label, self._done * 100))
+
+    def stop(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.window_manager.progress_end()
+        if self._area:
+            self._area.header_text_set()
+        self._steps.close()
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.stop(context)
+            if self.rollback(context):
+                self.report({'INFO'}, self.bl_label + " cancelled")
+                return {'CANCELLED'}
+            self.report({'INFO'}, self.bl_label + " stopped at %d%%" % (self._done * 100))
+            return self.finish(context)
+        if event.type != 'TIMER':
+            if event.type in self.chunk_pass_events:
+                return {'PASS_THROUGH'}
+            return {'RUNNING_MODAL'}
+        if self.run_chunk():
+            self.stop(context)
+            return self.finish(context)
+        self.update_progress(context)
+        return {'RUNNING_MODAL'}
+
+
 # OPERATORS
 class NWLazyMix(Operator, NWBase):
 
@@ -753,32 +2821,27 @@ class NWLazyMix(Operator, NWBase):
     merge_type = StringProperty(default='AUTO')
 
     def modal(self, context, event):
-        context.area.tag_redraw()
         nodes, links = get_nodes_links(context)
         cont = True
 
-        start_pos = [event.mouse_region_x, event.mouse_region_y]
-
         node1 = None
-        if not context.scene.NWBusyDrawing:
+        if not self.busy_drawing:
             node1 = node_at_pos(nodes, context, event)
             if node1:
-                context.scene.NWBusyDrawing = node1.name
+                self.busy_drawing = node1.name
         else:
-            if context.scene.NWBusyDrawing != 'STOP':
-                node1 = nodes[context.scene.NWBusyDrawing]
+            node1 = nodes.get(self.busy_drawing)
 
         if event.type == 'MOUSEMOVE':
-            self.mouse_path.append((event.mouse_region_x, event.mouse_region_y))
+            if move_mouse_end(self, event):
+                context.area.tag_redraw()
 
         elif event.type == 'RIGHTMOUSE':
-            end_pos = [event.mouse_region_x, event.mouse_region_y]
             bpy.types.SpaceNodeEditor.draw_handler_remove(self._handle, 'WINDOW')
+            context.area.tag_redraw()
 
             node2 = None
             node2 = node_at_pos(nodes, context, event)
-            if node2:
-                context.scene.NWBusyDrawing = node2.name
 
             if node1 == node2:
                 cont = False
@@ -792,12 +2855,12 @@ class NWLazyMix(Operator, NWBase):
 
                     bpy.ops.node.nw_merge_nodes(mode=self.mode, merge_type=self.merge_type)
 
-            context.scene.NWBusyDrawing = ""
             return {'FINISHED'}
 
         elif event.type == 'ESC':
             print('cancelled')
             bpy.types.SpaceNodeEditor.draw_handler_remove(self._handle, 'WINDOW')
+            context.area.tag_redraw()
             return {'CANCELLED'}
 
         return {'RUNNING_MODAL'}
@@ -806,11 +2869,13 @@ class NWLazyMix(Operator, NWBase):
         if context.area.type == 'NODE_EDITOR':
             # the arguments we pass the the callback
             args = (self, context, 'MIX')
+            self.busy_drawing = ""  # name of the node the line starts at
             # Add the region OpenGL drawing callback
             # draw in view space with 'POST_VIEW' and 'PRE_VIEW'
             self._handle = bpy.types.SpaceNodeEditor.draw_handler_add(draw_callback_mixnodes, args, 'WINDOW', 'POST_PIXEL')
 
-            self.mouse_path = []
+            self.mouse_start = None
+            self.mouse_end = [0, 0]
 
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
@@ -830,32 +2895,29 @@ class NWLazyConnect(Operator, NWBase):
     merge_type = StringProperty(default='AUTO')
 
     def modal(self, context, event):
-        context.area.tag_redraw()
         nodes, links = get_nodes_links(context)
         cont = True
 
-        start_pos = [event.mouse_region_x, event.mouse_region_y]
-
         node1 = None
-        if not context.scene.NWBusyDrawing:
+        if not self.busy_drawing:
             node1 = node_at_pos(nodes, context, event)
             if node1:
-                context.scene.NWBusyDrawing = node1.name
+                self.busy_drawing = node1.name
         else:
-            if context.scene.NWBusyDrawing != 'STOP':
-                node1 = nodes[context.scene.NWBusyDrawing]
+            node1 = nodes.get(self.busy_drawing)
 
         if event.type == 'MOUSEMOVE':
-            self.mouse_path.append((event.mouse_region_x, event.mouse_region_y))
+            if move_mouse_end(self, event):
+                if node1:
+                    self.update_preview(node1, node_at_pos(nodes, context, event))
+                context.area.tag_redraw()
 
         elif event.type == 'RIGHTMOUSE':
-            end_pos = [event.mouse_region_x, event.mouse_region_y]
             bpy.types.SpaceNodeEditor.draw_handler_remove(self._handle, 'WINDOW')
+            context.area.tag_redraw()
 
             node2 = None
             node2 = node_at_pos(nodes, context, event)
-            if node2:
-                context.scene.NWBusyDrawing = node2.name
 
             if node1 == node2:
                 cont = False
@@ -883,33 +2945,49 @@ class NWLazyConnect(Operator, NWBase):
 
             if link_success:
                 hack_force_update(context, nodes)
-            context.scene.NWBusyDrawing = ""
             return {'FINISHED'}
 
         elif event.type == 'ESC':
             bpy.types.SpaceNodeEditor.draw_handler_remove(self._handle, 'WINDOW')
+            context.area.tag_redraw()
             return {'CANCELLED'}
 
         return {'RUNNING_MODAL'}
 
+    def update_preview(self, node1, node2):
+        # text of sockets autolink would connect, only found again when the node under the mouse changes
+        name = node2.name if node2 else ""
+        if name == self.preview_node:
+            return
+        self.preview_node = name
+        self.preview = ""
+        if node2 and node2 != node1:
+            pair = best_link(node1, node2)
+            if pair:
+                self.preview = pair[0].name + " > " + pair[1].name
+
     def invoke(self, context, event):
         if context.area.type == 'NODE_EDITOR':
             nodes, links = get_nodes_links(context)
             node = node_at_pos(nodes, context, event)
+            # state of the drag is kept in the operator, writing it to the scene would make undo steps
+            self.busy_drawing = ""  # name of the node the line starts at
+            draw_col_type = 'x'
             if node:
-                context.scene.NWBusyDrawing = node.name
+                self.busy_drawing = node.name
                 if node.outputs:
-                    context.scene.NWDrawColType = node.outputs[0].type
-            else:
-                context.scene.NWDrawColType = 'x'
+                    draw_col_type = node.outputs[0].type
 
             # the arguments we pass the the callback
-            args = (self, context, context.scene.NWDrawColType)
+            args = (self, context, draw_col_type)
             # Add the region OpenGL drawing callback
             # draw in view space with 'POST_VIEW' and 'PRE_VIEW'
             self._handle = bpy.types.SpaceNodeEditor.draw_handler_add(draw_callback_mixnodes, args, 'WINDOW', 'POST_PIXEL')
 
-            self.mouse_path = []
+            self.mouse_start = None
+            self.mouse_end = [0, 0]
+            self.preview_node = ""
+            self.preview = ""
 
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
@@ -918,13 +2996,19 @@ class NWLazyConnect(Operator, NWBase):
             return {'CANCELLED'}
 
 
-class NWDeleteUnused(Operator, NWBase):
+class NWDeleteUnused(Operator, NWBase, NWChunked):
 
     'Delete all nodes whose output is not used'
     bl_idname = 'node.nw_del_unused'
     bl_label = 'Delete Unused Nodes'
     bl_options = {'REGISTER', 'UNDO'}
 
+    groups = BoolProperty(
+        name="Inside Groups",
+        default=True,
+        description="Also delete unused nodes inside node groups used in the tree, to any depth "
+                    "(changes the groups for all their users)")
+
     @classmethod
     def poll(cls, context):
         valid = False
@@ -934,106 +3018,485 @@ class NWDeleteUnused(Operator, NWBase):
                     valid = True
         return valid
 
-    def execute(self, context):
-        nodes, links = get_nodes_links(context)
-        end_types = 'OUTPUT_MATERIAL', 'OUTPUT', 'VIEWER', 'COMPOSITE', \
-            'SPLITVIEWER', 'OUTPUT_FILE', 'LEVELS', 'OUTPUT_LAMP', \
-            'OUTPUT_WORLD', 'GROUP', 'GROUP_INPUT', 'GROUP_OUTPUT'
-
-        # Store selection
-        selection = []
-        for node in nodes:
-            if node.select == True:
-                selection.append(node.name)
-
-        deleted_nodes = []
-        temp_deleted_nodes = []
-        del_unused_iterations = len(nodes)
-        for it in range(0, del_unused_iterations):
-            temp_deleted_nodes = list(deleted_nodes)  # keep record of last iteration
-            for node in nodes:
-                node.select = False
-            for node in nodes:
-                if is_end_node(node) and not node.type in end_types and node.type != 'FRAME':
-                    node.select = True
-                    deleted_nodes.append(node.name)
-                    bpy.ops.node.delete()
-
-            if temp_deleted_nodes == deleted_nodes:  # stop iterations when there are no more nodes to be deleted
-                break
-        # get unique list of deleted nodes (iterations would count the same node more than once)
-        deleted_nodes = list(set(deleted_nodes))
-        for n in deleted_nodes:
+    def steps(self, context):
+        edited = EditedTree(context)
+        trees = [edited.tree]
+        if self.groups:
+            # linked groups can't be changed
+            trees = [tree for tree, path in nested_trees(trees) if tree.library is None]
+        memo = {}
+        to_delete = []  # (tree, node name), all found before anything is deleted
+        for tree in trees:
+            graph = TreeGraph(tree.nodes, tree.links)
+            ordered = graph.order()
+            # nodes with unused outputs, then nodes only used by those
+            unused = {node.name for node in tree.nodes if not graph.outgoing[node.name] and
+                      not is_output_node(node, memo) and node.type != 'FRAME'}
+            unused_nodes(graph, ordered, unused, memo)
+            # last nodes first: when stopped, the remaining ones are found again by the next run
+            to_delete.extend((tree, node.name) for node in reversed(ordered) if node.name in unused)
+        self.where = str(edited)
+        self.deleted = []
+        for tree, name in to_delete:
+            tree.nodes.remove(tree.nodes[name])
+            self.deleted.append(name if tree == edited.tree else tree.name + " > " + name)
+            yield len(self.deleted) / len(to_delete)
+
+    def finish(self, context):
+        for n in self.deleted:
             self.report({'INFO'}, "Node " + n + " deleted")
-        num_deleted = len(deleted_nodes)
+        num_deleted = len(self.deleted)
         n = ' node'
         if num_deleted > 1:
             n += 's'
         if num_deleted:
-            self.report({'INFO'}, "Deleted " + str(num_deleted) + n)
+            self.report({'INFO'}, "Deleted " + str(num_deleted) + n + " in " + self.where)
         else:
             self.report({'INFO'}, "Nothing deleted")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.run_modal = True
+        return context.window_manager.invoke_confirm(self, event)
+
+
+class NWPurgeUnused(Operator, NWBase):
+    bl_idname = "node.nw_purge_unused"
+    bl_label = "Purge Unused Data"
+    bl_description = "Find node groups, images, textures, movie clips, materials and worlds not used anywhere " \
+                     "in the file, also through other node trees, and remove them"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    purge = BoolProperty(
+        name="Purge",
+        description="Remove unused data, otherwise only report it",
+        default=True)
+
+    def execute(self, context):
+        unused = unused_data()
+        if not unused:
+            self.report({'INFO'}, "No unused data")
+            return {'CANCELLED'}
+        counts = {}
+        memory = 0
+        for name, data in unused:
+            counts[name] = counts.get(name, 0) + 1
+            memory += data_memory(data)
+            print("Node Wrangler: unused " + name + " " + data.name)
+        found = ", ".join(str(counts[name]) + " " + name.replace('_', ' ')
+                          for name in purge_collections if name in counts)
+        found += ", about %.1f MB" % (memory / 1048576.0)
+        if not self.purge:
+            self.report({'INFO'}, "Unused: " + found)
+            return {'FINISHED'}
+
+        left = remove_data(unused)
+        if left:
+            self.report({'WARNING'}, "Purged " + found + ", " + str(len(left)) +
+                        " datablocks could not be removed: " + ", ".join(data.name for name, data in left))
+        else:
+            self.report({'INFO'}, "Purged " + found)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        if self.purge:
+            return context.window_manager.invoke_confirm(self, event)
+        return self.execute(context)
+
+
+class NWMergeDuplicateImages(Operator, NWBase):
+    bl_idname = "node.nw_merge_duplicate_images"
+    bl_label = "Merge Duplicate Images"
+    bl_description = "Find images used by nodes that load the same file or files with the same content, " \
+                     "and make all image nodes use one of them"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    merge = BoolProperty(
+        name="Merge",
+        description="Make nodes use one image of each group of duplicates, otherwise only report them",
+        default=True)
+    threads = IntProperty(
+        name="Threads",
+        default=0,
+        min=0,
+        description="Number of threads hashing files, 0 for one per CPU core")
+
+    def execute(self, context):
+        start = time.time()
+        images = {}
+        for tree in file_trees():
+            for node in tree.nodes:
+                if node.type == 'TEXTURE':
+                    image = getattr(node.texture, 'image', None)
+                elif node.type in node_types.image_types:
+                    image = node.image
+                else:
+                    continue
+                if image is not None:
+                    images[image.as_pointer()] = image
+        groups = duplicate_images(images.values(), self.threads)
+        if not groups:
+            self.report({'INFO'}, "No duplicate images")
+            return {'CANCELLED'}
+        num_duplicates = sum(len(group) - 1 for group in groups)
+        memory = sum(data_memory(image) for group in groups for image in group[1:])
+        for group in groups:
+            print("Node Wrangler: same image " + ", ".join(image.name for image in group))
+        found = "%d duplicates of %d images (about %.1f MB)" % (num_duplicates, len(groups), memory / 1048576.0)
+        if not self.merge:
+            self.report({'INFO'}, "Found " + found + " in %.2f s" % (time.time() - start))
+            return {'FINISHED'}
+
+        remapped = remap_images(groups)
+        hack_force_update(context, get_nodes_links(context)[0])
+        # users the add-on doesn't know about (other add-ons, fake users) keep duplicates in the file
+        left = [image for group in groups for image in group[1:] if image.users]
+        freed = sum(data_memory(image) for group in groups for image in group[1:] if not image.users)
+        report = "Merged %s, %d users remapped. " % (found, remapped)
+        if left:
+            self.report({'WARNING'}, report + "%d duplicates still have users: %s" %
+                        (len(left), ", ".join(image.name for image in left)))
+        else:
+            self.report({'INFO'}, report + "Purge Unused Data frees about %.1f MB" % (freed / 1048576.0))
+        return {'FINISHED'}
+
+
+class NWMergeDuplicates(Operator, NWBase):
+    bl_idname = "node.nw_merge_duplicates"
+    bl_label = "Merge Duplicate Nodes"
+    bl_description = "Find nodes that compute the same values as other nodes and merge them into one, " \
+                     "reconnecting their outputs to the kept node"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    merge = BoolProperty(
+        name="Merge",
+        description="Merge duplicates, otherwise only select them",
+        default=True)
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
 
-        # Restore selection
+    def execute(self, context):
         nodes, links = get_nodes_links(context)
-        for node in nodes:
-            if node.name in selection:
-                node.select = True
+        graph = TreeGraph(nodes, links)
+        groups = duplicate_nodes(graph)
+        num_duplicates = sum(len(group) - 1 for group in groups)
+        if not groups:
+            self.report({'INFO'}, "No duplicate nodes")
+            return {'CANCELLED'}
+        for group in groups:
+            print("Node Wrangler: equivalent nodes " + ", ".join(node.name for node in group))
+
+        if not self.merge:
+            for node in nodes:
+                node.select = False
+            for group in groups:
+                for node in group:
+                    node.select = True
+            self.report({'INFO'}, "Found " + str(num_duplicates) + " duplicate nodes in " +
+                        str(len(groups)) + " groups")
+            return {'FINISHED'}
+
+        # Groups are in topological order, duplicates downstream are equal
+        # because their inputs come from equal nodes, they are removed too.
+        active = nodes.active
+        removed = []
+        for group in groups:
+            keep = active if active in group else group[0]
+            for node in group:
+                if node != keep:
+                    for link in graph.outgoing[node.name]:
+                        links.new(keep.outputs[graph.output_index(link)], link.to_socket)
+                    removed.append(node)
+        for node in removed:
+            nodes.remove(node)
+        hack_force_update(context, nodes)
+        self.report({'INFO'}, "Merged " + str(num_duplicates) + " duplicate nodes in " +
+                    str(len(groups)) + " groups")
         return {'FINISHED'}
 
+
+class NWFoldConstants(Operator, NWBase):
+    bl_idname = "node.nw_fold_constants"
+    bl_label = "Fold Constants"
+    bl_description = "Replace Math and Mix nodes that only use constant inputs with a single Value or RGB node"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return (space.type == 'NODE_EDITOR' and space.node_tree is not None and
+                space.tree_type in {'ShaderNodeTree', 'CompositorNodeTree'})
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        tree_type = nodes.id_data.type
+        graph = TreeGraph(nodes, links)
+        ordered = graph.order()
+        values = fold_constants(graph, ordered, tree_type, context.scene.render.engine == 'CYCLES')
+        folded = set(name for name in values if nodes[name].type in {'MATH', 'MIX_RGB'})
+        # roots: folded nodes used by nodes that are not constant
+        roots = [node for node in ordered if node.name in folded and
+                 any(link.to_node.name not in values for link in graph.outgoing[node.name])]
+        if not roots:
+            self.report({'INFO'}, "No constant nodes to fold")
+            return {'CANCELLED'}
+        root_names = set(node.name for node in roots)
+
+        # nodes of the folded subgraphs
+        subgraph = set()
+        stack = [node.name for node in roots]
+        while stack:
+            name = stack.pop()
+            if name not in subgraph:
+                subgraph.add(name)
+                stack.extend(link.from_node.name for link in graph.incoming[name])
+
+        for node in roots:
+            value = values[node.name]
+            if node.type == 'MATH':
+                new_node = nodes.new(node_types.by_type[(tree_type, 'VALUE')][0])
+                new_node.outputs[0].default_value = value
+            else:
+                new_node = nodes.new(node_types.by_type[(tree_type, 'RGB')][0])
+                new_node.outputs[0].default_value = value
+            new_node.parent = node.parent
+            new_node.location = node.location
+            new_node.label = node.label
+            for link in graph.outgoing[node.name]:
+                if link.to_node.name not in values:
+                    links.new(new_node.outputs[0], link.to_socket)
+
+        # remove nodes of subgraphs that are only used inside the subgraphs, consumers first
+        removed = set()
+        for node in reversed(ordered):
+            if node.name in subgraph:
+                if all(link.to_node.name in removed or (node.name in root_names and link.to_node.name not in values)
+                       for link in graph.outgoing[node.name]):
+                    removed.add(node.name)
+        for name in removed:
+            nodes.remove(nodes[name])
+
+        hack_force_update(context, nodes)
+        self.report({'INFO'}, "Removed " + str(len(removed)) + " nodes, added " + str(len(roots)) + " constant nodes")
+        return {'FINISHED'}
+
+
+class NWBypassNodes(Operator, NWBase):
+    bl_idname = "node.nw_bypass_nodes"
+    bl_label = "Bypass Constant Mix"
+    bl_description = "Connect outputs of Mix nodes with factor 0 or 1 and Math nodes adding 0 or multiplying by 1 " \
+                     "to the input they pass on, select nodes that are no longer used"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    delete = BoolProperty(
+        name="Delete Unused",
+        description="Delete bypassed nodes and nodes only used by them",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        tree_type = nodes.id_data.type
+        graph = TreeGraph(nodes, links)
+        source = {}  # input pointer: output linked to it, kept up to date while relinking
+        for link in links:
+            source[link.to_socket.as_pointer()] = link.from_socket
+        bypassed = set()
+        # upstream first: chains of bypassed nodes reconnect to the first real source
+        for node in graph.order():
+            i = bypass_input(node, tree_type)
+            if i is None:
+                continue
+            from_socket = source.get(node.inputs[i].as_pointer())
+            output = node.outputs[0]
+            # consumers have to get the same value, so the output can't change type
+            if from_socket is None or (from_socket.type != output.type and
+                                       not (from_socket.type == 'VALUE' and output.type == 'RGBA')):
+                continue
+            for link in graph.outgoing[node.name]:
+                to_socket = link.to_socket
+                links.new(from_socket, to_socket)
+                source[to_socket.as_pointer()] = from_socket
+            bypassed.add(node.name)
+        if not bypassed:
+            self.report({'INFO'}, "No nodes to bypass")
+            return {'CANCELLED'}
+
+        graph = TreeGraph(nodes, links)
+        dead = unused_nodes(graph, graph.order(), set(bypassed))
+        if self.delete:
+            for name in dead:
+                nodes.remove(nodes[name])
+        else:
+            for node in nodes:
+                node.select = node.name in dead
+        hack_force_update(context, nodes)
+        self.report({'INFO'}, "Bypassed " + str(len(bypassed)) + " nodes, " + str(len(dead)) +
+                    (" nodes deleted" if self.delete else " nodes unused"))
+        return {'FINISHED'}
+
+
+class NWComplexityReport(Operator, NWBase):
+    bl_idname = "node.nw_complexity_report"
+    bl_label = "Complexity Report"
+    bl_description = "Count nodes by category, critical path depth, texture lookups on it, " \
+                     "unused, muted nodes and duplicate images"
+
+    scope = EnumProperty(
+        name="Scope",
+        items=(
+            ('TREE', "Tree", "Analyze the edited tree"),
+            ('MATERIALS', "All Materials", "Analyze node trees of all materials"),
+        ),
+        default='TREE')
+    sort_by = EnumProperty(
+        name="Sort By",
+        items=(
+            ('depth', "Depth", "Longest path from an input to an output"),
+            ('critical_textures', "Textures", "Texture lookups on the longest path"),
+            ('nodes', "Nodes", "Number of nodes"),
+        ),
+        default='depth',
+        description="Order of materials in the list of most expensive ones")
+    export = BoolProperty(
+        name="Export",
+        description="Save the report as JSON",
+        default=False)
+    filepath = StringProperty(subtype='FILE_PATH')
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
     def invoke(self, context, event):
-        return context.window_manager.invoke_confirm(self, event)
+        if self.export:
+            self.filepath = bpy.path.ensure_ext(bpy.path.display_name_from_filepath(bpy.data.filepath) or
+                                                "complexity", ".json")
+            context.window_manager.fileselect_add(self)
+            return {'RUNNING_MODAL'}
+        return self.execute(context)
+
+    def execute(self, context):
+        if self.scope == 'TREE':
+            nodes, links = get_nodes_links(context)
+            tree = nodes.id_data
+            stats = tree_complexity(nodes, links, tree.type)
+            complexity_report['tree'] = tree.name
+            complexity_report['stats'] = stats
+            result = {tree.name: stats}
+            self.report({'INFO'}, "%d nodes, depth %d, %d textures on critical path, %d unused, %d muted, "
+                        "%d duplicate images" % (stats['nodes'], stats['depth'], stats['critical_textures'],
+                                                 stats['unused'], stats['muted'], stats['duplicate_images']))
+        else:
+            result = {}
+            for mat in bpy.data.materials:
+                if mat.use_nodes and mat.node_tree:
+                    tree = mat.node_tree
+                    result[mat.name] = tree_complexity(tree.nodes, tree.links, tree.type)
+            top = sorted(result.items(), key=lambda item: item[1][self.sort_by], reverse=True)[:10]
+            complexity_report['top'] = top
+            self.report({'INFO'}, "Analyzed " + str(len(result)) + " materials")
+            for name, stats in top:
+                print("Node Wrangler: %s: %d nodes, depth %d, %d textures on critical path" %
+                      (name, stats['nodes'], stats['depth'], stats['critical_textures']))
+        if self.export and self.filepath:
+            with open(bpy.path.abspath(self.filepath), 'w') as f:
+                json.dump(result, f, indent=1, sort_keys=True)
+        return {'FINISHED'}
 
 
 class NWSwapOutputs(Operator, NWBase):
 
-    "Swap the output connections of the two selected nodes"
+    "Swap the output connections of the selected nodes (rotate them when more than two are selected)"
     bl_idname = 'node.nw_swap_outputs'
     bl_label = 'Swap Outputs'
     bl_options = {'REGISTER', 'UNDO'}
 
+    order = EnumProperty(
+        name="Order",
+        description="Order in which the outputs are passed on from node to node",
+        items=(
+            ('SELECTION', 'Selection', 'Start from the active node, then follow the order of the selected nodes'),
+            ('X', 'By X', 'From left to right'),
+            ('Y', 'By Y', 'From top to bottom'),
+        ),
+        default='SELECTION',
+    )
+    reverse = BoolProperty(
+        name="Reverse",
+        description="Rotate the outputs in the opposite direction",
+        default=False,
+    )
+
     @classmethod
     def poll(cls, context):
         snode = context.space_data
         if context.selected_nodes:
-            return len(context.selected_nodes) == 2
+            return len(context.selected_nodes) >= 2
         else:
             return False
 
     def execute(self, context):
         nodes, links = get_nodes_links(context)
-        selected_nodes = context.selected_nodes
-        n1 = selected_nodes[0]
-        n2 = selected_nodes[1]
-        n1_outputs = []
-        n2_outputs = []
-
-        out_index = 0
-        for output in n1.outputs:
-            if output.links:
-                for link in output.links:
-                    n1_outputs.append([out_index, link.to_socket])
-                    links.remove(link)
-            out_index += 1
-
-        out_index = 0
-        for output in n2.outputs:
-            if output.links:
-                for link in output.links:
-                    n2_outputs.append([out_index, link.to_socket])
-                    links.remove(link)
-            out_index += 1
-
-        for connection in n1_outputs:
-            try:
-                links.new(n2.outputs[connection[0]], connection[1])
-            except:
-                self.report({'WARNING'}, "Some connections have been lost due to differing numbers of output sockets")
-        for connection in n2_outputs:
-            try:
-                links.new(n1.outputs[connection[0]], connection[1])
-            except:
-                self.report({'WARNING'}, "Some connections have been lost due to differing numbers of output sockets")
+        selected = [n for n in context.selected_nodes if n.type != 'FRAME']
+        if len(selected) < 2:
+            return {'CANCELLED'}
+        order = self.order
+        if order == 'X':
+            selected.sort(key=lambda n: (n.location.x, -n.location.y))
+        elif order == 'Y':
+            selected.sort(key=lambda n: (-n.location.y, n.location.x))
+        else:
+            active = nodes.active
+            if active in selected:
+                selected.remove(active)
+                selected.insert(0, active)
+        if self.reverse:
+            selected.reverse()
+        count = len(selected)
+        # Outputs of every node are passed on to the next node in the rotation.
+        # With two nodes this is a plain swap.
+        position = {}  # entry = node name: position in rotation
+        out_indices = {}  # entry = socket pointer: index of output
+        for i, node in enumerate(selected):
+            position[node.name] = i
+            for out_i, output in enumerate(node.outputs):
+                out_indices[output.as_pointer()] = out_i
+
+        # gather all outgoing links of the rotated nodes in one pass over the links
+        moves = []  # entry = (link, dst node, output index, to_socket)
+        for link in links:
+            pos = position.get(link.from_node.name)
+            if pos is not None:
+                out_i = out_indices[link.from_socket.as_pointer()]
+                moves.append((link, selected[(pos + 1) % count], out_i, link.to_socket))
+
+        # Linking to an input that is already linked replaces the old link,
+        # so every moved connection costs a single link operation.
+        lost = 0  # dst has no such output
+        loops = 0  # dst would be linked to itself
+        for link, dst, out_i, to_socket in moves:
+            if out_i >= len(dst.outputs):
+                links.remove(link)
+                lost += 1
+            elif dst == link.to_node:
+                links.remove(link)
+                loops += 1
+            else:
+                links.new(dst.outputs[out_i], to_socket)
+        if lost:
+            self.report({'WARNING'}, "Some connections have been lost due to differing numbers of output sockets")
+        if loops:
+            self.report({'WARNING'}, str(loops) + " connections have been removed because they would link "
+                        "a node to itself")
 
         hack_force_update(context, nodes)
         return {'FINISHED'}
@@ -1094,7 +3557,7 @@ class NWEmissionViewer(Operator, NWBase):
 
         # to select at specific mouse position:
         # bpy.ops.node.select(mouse_x=156, mouse_y=410, extend=False)
-        shader_types = [x[1] for x in shaders_shader_nodes_props]
+        shader_types = node_types.shader_types
         mlocx = event.mouse_region_x
         mlocy = event.mouse_region_y
         select_node = bpy.ops.node.select(mouse_x=mlocx, mouse_y=mlocy, extend=False)
@@ -1103,7 +3566,7 @@ class NWEmissionViewer(Operator, NWBase):
             in_group = context.active_node != context.space_data.node_tree.nodes.active
             active = nodes.active
             valid = False
-            output_types = [x[1] for x in shaders_output_nodes_props]
+            output_types = node_types.shader_output_types
             if active:
                 if (active.name != "Emission Viewer") and (active.type not in output_types) and not in_group:
                     if active.select:
@@ -1243,10 +3706,73 @@ class NWFrameSelected(Operator, NWBase):
         return {'FINISHED'}
 
 
-class NWReloadImages(Operator, NWBase):
+class NWFrameComponents(Operator, NWBase):
+    bl_idname = "node.nw_frame_components"
+    bl_label = "Frame Connected Nodes"
+    bl_description = "Add a frame around every group of linked nodes that aren't in a frame yet"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    max_size = IntProperty(
+        name="Max Nodes",
+        default=0,
+        min=0,
+        description="Split groups bigger than this into smaller connected clusters (0 for no limit)")
+    min_size = IntProperty(
+        name="Min Nodes",
+        default=2,
+        min=1,
+        description="Don't frame groups with fewer nodes")
+    selected_only = BoolProperty(
+        name="Selected Only",
+        default=False,
+        description="Only frame selected nodes")
+    use_output_label = BoolProperty(
+        name="Label by Output",
+        default=True,
+        description="Name frames after the output node of their nodes")
+    color_prop = FloatVectorProperty(name="Color", description="The color of the frame nodes", default=(0.6, 0.6, 0.6),
+                                     min=0, max=1, step=1, precision=3, subtype='COLOR_GAMMA', size=3)
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        candidates = [node for node in nodes if node.type != 'FRAME' and node.parent is None and
+                      (node.select or not self.selected_only)]
+        index = dict((node.name, i) for i, node in enumerate(candidates))
+        edges = []
+        linked_out = set()  # nodes with outputs linked inside their group, not outputs of it
+        for link in links:
+            i = index.get(link.from_node.name)
+            j = index.get(link.to_node.name)
+            if i is not None and j is not None:
+                edges.append((i, j))
+                linked_out.add(i)
+        components = [c for c in connected_components(len(candidates), edges, self.max_size)
+                      if len(c) >= self.min_size]
+
+        frames = [nodes.new('NodeFrame') for c in components]
+        for frame, component in zip(frames, components):
+            frame.use_custom_color = True
+            frame.color = self.color_prop
+            if self.use_output_label:
+                outputs = [candidates[i] for i in component if i not in linked_out]
+                if outputs:
+                    output = max(outputs, key=lambda node: node.location.x)
+                    frame.label = output.label or output.name
+            for i in component:
+                candidates[i].parent = frame
+        self.report({'INFO'}, "Added " + str(len(frames)) + " frames")
+        return {'FINISHED'}
+
+
+class NWReloadImages(Operator, NWBase, NWChunked):
     bl_idname = "node.nw_reload_images"
     bl_label = "Reload Images"
-    bl_description = "Update all the image nodes to match their files on disk"
+    bl_description = "Update all the image nodes (also in node groups) to match their files on disk"
 
     @classmethod
     def poll(cls, context):
@@ -1257,23 +3783,31 @@ class NWReloadImages(Operator, NWBase):
                 valid = True
         return valid
 
-    def execute(self, context):
+    def steps(self, context):
         nodes, links = get_nodes_links(context)
-        image_types = ["IMAGE", "TEX_IMAGE", "TEX_ENVIRONMENT", "TEXTURE"]
-        num_reloaded = 0
-        for node in nodes:
+        image_types = node_types.image_types
+        images = []
+        for node in (node for tree, path in nested_trees([nodes.id_data]) for node in tree.nodes):
             if node.type in image_types:
                 if node.type == "TEXTURE":
                     if node.texture:  # node has texture assigned
                         if node.texture.type in ['IMAGE', 'ENVIRONMENT_MAP']:
                             if node.texture.image:  # texture has image assigned
-                                node.texture.image.reload()
-                                num_reloaded += 1
+                                images.append(node.texture.image)
                 else:
                     if node.image:
-                        node.image.reload()
-                        num_reloaded += 1
-
+                        images.append(node.image)
+        # images used by several nodes are read once
+        images = list({image.as_pointer(): image for image in images}.values())
+        self.num_reloaded = 0
+        for image in images:
+            image.reload()
+            self.num_reloaded += 1
+            yield self.num_reloaded / len(images)
+
+    def finish(self, context):
+        nodes, links = get_nodes_links(context)
+        num_reloaded = self.num_reloaded
         if num_reloaded:
             self.report({'INFO'}, "Reloaded images")
             print("Reloaded " + str(num_reloaded) + " images")
@@ -1286,7 +3820,7 @@ class NWReloadImages(Operator, NWBase):
             return {'CANCELLED'}
 
 
-class NWSwitchNodeType(Operator, NWBase):
+class NWSwitchNodeType(Operator, NWBase, NWChunked):
 
     """Switch type of selected nodes """
     bl_idname = "node.nw_swtch_node_type"
@@ -1295,48 +3829,42 @@ class NWSwitchNodeType(Operator, NWBase):
 
     to_type = EnumProperty(
         name="Switch to type",
-        items=list(shaders_input_nodes_props) +
-        list(shaders_output_nodes_props) +
-        list(shaders_shader_nodes_props) +
-        list(shaders_texture_nodes_props) +
-        list(shaders_color_nodes_props) +
-        list(shaders_vector_nodes_props) +
-        list(shaders_converter_nodes_props) +
-        list(shaders_layout_nodes_props) +
-        list(compo_input_nodes_props) +
-        list(compo_output_nodes_props) +
-        list(compo_color_nodes_props) +
-        list(compo_converter_nodes_props) +
-        list(compo_filter_nodes_props) +
-        list(compo_vector_nodes_props) +
-        list(compo_matte_nodes_props) +
-        list(compo_distort_nodes_props) +
-        list(compo_layout_nodes_props),
+        items=[props for tree_type, tree_name, category, nodes_props in nodes_catalog for props in nodes_props],
     )
 
-    def execute(self, context):
+    def steps(self, context):
         nodes, links = get_nodes_links(context)
         to_type = self.to_type
         # Those types of nodes will not swap.
         src_excludes = ('NodeFrame')
-        # Those attributes of nodes will be copied if possible
+        # Those attributes of all nodes will be copied
         attrs_to_pass = ('color', 'hide', 'label', 'mute', 'parent',
                          'show_options', 'show_preview', 'show_texture',
-                         'use_alpha', 'use_clamp', 'use_custom_color', 'location'
+                         'use_custom_color', 'location'
                          )
+        # Those type specific properties will be copied if both types have them
+        props_to_pass = ('use_alpha', 'use_clamp', 'image')
+        dst_info = node_info(to_type)
         selected = [n for n in nodes if n.select]
         reselect = []
-        for node in [n for n in selected if
+        to_switch = [n for n in selected if
                      n.rna_type.identifier not in src_excludes and
-                     n.rna_type.identifier != to_type]:
+                     n.rna_type.identifier != to_type]
+        for count, node in enumerate(to_switch):
             new_node = nodes.new(to_type)
             for attr in attrs_to_pass:
-                if hasattr(node, attr) and hasattr(new_node, attr):
-                    setattr(new_node, attr, getattr(node, attr))
-            # set image datablock of dst to image of src
-            if hasattr(node, 'image') and hasattr(new_node, 'image'):
-                if node.image:
-                    new_node.image = node.image
+                setattr(new_node, attr, getattr(node, attr))
+            src_info = node_info(node.rna_type.identifier)
+            if src_info and dst_info:
+                src_props = {prop for prop, prop_type in src_info['props']}
+                dst_props = {prop for prop, prop_type in dst_info['props']}
+                shared_props = [p for p in props_to_pass if p in src_props and p in dst_props]
+            else:  # types not in catalog (custom nodes)
+                shared_props = [p for p in props_to_pass if hasattr(node, p) and hasattr(new_node, p)]
+            for prop in shared_props:
+                # set image datablock of dst to image of src only if src has one
+                if prop != 'image' or node.image:
+                    setattr(new_node, prop, getattr(node, prop))
             # Special cases
             if new_node.type == 'SWITCH':
                 new_node.hide = True
@@ -1361,13 +3889,21 @@ class NWSwitchNodeType(Operator, NWBase):
             for sockets, nd in ((src_sockets, node), (dst_sockets, new_node)):
                 # Check node's inputs and outputs and fill proper entries in "sockets" dict
                 for in_out, in_out_name in ((nd.inputs, 'INPUTS'), (nd.outputs, 'OUTPUTS')):
+                    # Not every socket, especially in outputs has "default_value".
+                    # Catalog knows which inputs have it, unless number of sockets is dynamic.
+                    info = node_info(nd.rna_type.identifier)
+                    has_dval = None
+                    if info and in_out_name == 'INPUTS' and len(info['inputs']) == len(in_out):
+                        has_dval = [has_default for name, type, has_default in info['inputs']]
                     # enumerate in inputs, then in outputs
                     # find name, default value and links of socket
                     for i, socket in enumerate(in_out):
                         the_name = socket.name
                         dval = None
-                        # Not every socket, especially in outputs has "default_value"
-                        if hasattr(socket, 'default_value'):
+                        if has_dval is not None:
+                            if has_dval[i]:
+                                dval = socket.default_value
+                        elif hasattr(socket, 'default_value'):
                             dval = socket.default_value
                         socket_links = []
                         for lnk in socket.links:
@@ -1440,7 +3976,7 @@ class NWSwitchNodeType(Operator, NWBase):
                         new_dst_dval = max(src_dval[0], src_dval[1], src_dval[2])
                         new_node.inputs[dst_i].default_value = new_dst_dval
                         if node.type == 'MIX_RGB':
-                            if node.blend_type in [o[0] for o in operations]:
+                            if node.blend_type in node_types.operation_index:
                                 new_node.operation = node.blend_type
                     # Special case: switch from math to some types
                     if node.type == 'MATH' and\
@@ -1449,7 +3985,7 @@ class NWSwitchNodeType(Operator, NWBase):
                         for i in range(3):
                             new_node.inputs[dst_i].default_value[i] = src_dval
                         if new_node.type == 'MIX_RGB':
-                            if node.operation in [t[0] for t in blend_types]:
+                            if node.operation in node_types.blend_type_index:
                                 new_node.blend_type = node.operation
                             # Set Fac of MIX_RGB to 1.0
                             new_node.inputs[0].default_value = 1.0
@@ -1482,8 +4018,9 @@ class NWSwitchNodeType(Operator, NWBase):
                 for out_src_link in src_o.links:
                     if new_node.outputs:
                         links.new(new_node.outputs[0], out_src_link.to_socket)
+            mark_changed(nodes, [new_node], place=False)
             nodes.remove(node)
-        return {'FINISHED'}
+            yield (count + 1) / len(to_switch)
 
 
 class NWMergeNodes(Operator, NWBase):
@@ -1538,8 +4075,8 @@ class NWMergeNodes(Operator, NWBase):
                 if merge_type == 'AUTO':
                     for (type, types_list, dst) in (
                             ('SHADER', ('MIX', 'ADD'), selected_shader),
-                            ('RGBA', [t[0] for t in blend_types], selected_mix),
-                            ('VALUE', [t[0] for t in operations], selected_math),
+                            ('RGBA', node_types.blend_type_index, selected_mix),
+                            ('VALUE', node_types.operation_index, selected_math),
                     ):
                         output_type = node.outputs[0].type
                         valid_mode = mode in types_list
@@ -1556,8 +4093,8 @@ class NWMergeNodes(Operator, NWBase):
                 else:
                     for (type, types_list, dst) in (
                             ('SHADER', ('MIX', 'ADD'), selected_shader),
-                            ('MIX', [t[0] for t in blend_types], selected_mix),
-                            ('MATH', [t[0] for t in operations], selected_math),
+                            ('MIX', node_types.blend_type_index, selected_mix),
+                            ('MATH', node_types.operation_index, selected_math),
                     ):
                         if merge_type == type and mode in types_list:
                             dst.append([i, node.location.x, node.location.y])
@@ -1639,12 +4176,12 @@ class NWMergeNodes(Operator, NWBase):
                 # "last" node has been added as first, so its index is count_before.
                 last_add = nodes[count_before]
                 # add links from last_add to all links 'to_socket' of out links of first selected.
+                # Prevent cyclic dependencies when nodes to be marged are linked to one another.
+                # Create set of names of invalid nodes.
+                invalid_names = {nodes[n[0]].name for n in (selected_mix + selected_math + selected_shader)}
                 for fs_link in first_selected.outputs[0].links:
-                    # Prevent cyclic dependencies when nodes to be marged are linked to one another.
-                    # Create list of invalid indexes.
-                    invalid_i = [n[0] for n in (selected_mix + selected_math + selected_shader)]
-                    # Link only if "to_node" index not in invalid indexes list.
-                    if fs_link.to_node not in [nodes[i] for i in invalid_i]:
+                    # Link only if "to_node" not in invalid nodes.
+                    if fs_link.to_node.name not in invalid_names:
                         links.new(last_add.outputs[0], fs_link.to_socket)
                 # add link from "first" selected and "first" add node
                 links.new(first_selected.outputs[0], nodes[count_after - 1].inputs[first])
@@ -1657,12 +4194,120 @@ class NWMergeNodes(Operator, NWBase):
                     index -= 1
                 # set "last" of added nodes as active
                 nodes.active = last_add
+                mark_changed(nodes, nodes[count_before:])
                 for i, x, y in nodes_list:
                     nodes[i].select = False
 
         return {'FINISHED'}
 
 
+def batch_change(nodes, blend_type, operation):
+    for node in nodes:
+        if node.type == 'MIX_RGB':
+            if not blend_type in node_types.nav_names:
+                node.blend_type = blend_type
+            else:
+                index = node_types.blend_type_index[node.blend_type]
+                if blend_type == 'NEXT':
+                    node.blend_type = blend_types[(index + 1) % len(blend_types)][0]
+                if blend_type == 'PREV':
+                    node.blend_type = blend_types[(index - 1) % len(blend_types)][0]
+
+        if node.type == 'MATH':
+            if not operation in node_types.nav_names:
+                node.operation = operation
+            else:
+                index = node_types.operation_index[node.operation]
+                if operation == 'NEXT':
+                    node.operation = operations[(index + 1) % len(operations)][0]
+                if operation == 'PREV':
+                    node.operation = operations[(index - 1) % len(operations)][0]
+
+
+def change_mix_factor(nodes, option):
+    # option: Change factor.
+    # If option is 1.0 or 0.0 - set to 1.0 or 0.0
+    # Else - change factor by option value.
+    for node in nodes:
+        if node.select and node.type in {'MIX_RGB', 'MIX_SHADER'}:
+            fac = node.inputs[0]
+            node.hide = False
+            if option in {0.0, 1.0}:
+                fac.default_value = option
+            else:
+                fac.default_value += option
+
+
+# Undo coalescing of repeatable hotkeys (Alt+Arrows).
+# Every undo push stores the whole file, which is slow in big scenes. Presses of the same hotkey
+# that follow each other within the "Hotkey Undo Window" of the preferences share one undo step,
+# pushed by NWFlushUndo once the presses stop or anything else is clicked.
+# 'message': name of the pending undo step, "" if there is none
+# 'last': time of the last press
+# 'running': NWFlushUndo is waiting for the presses to stop
+undo_coalesce = {
+    'message': "",
+    'last': 0.0,
+    'running': False,
+}
+# keys that don't end a series of presses
+coalesce_keys = {'LEFT_ARROW', 'RIGHT_ARROW', 'UP_ARROW', 'DOWN_ARROW',
+                 'LEFT_ALT', 'RIGHT_ALT', 'LEFT_SHIFT', 'RIGHT_SHIFT', 'LEFT_CTRL', 'RIGHT_CTRL'}
+
+
+def flush_undo(keep=""):
+    # Push the pending undo step, unless it is named keep. Before changes of another hotkey.
+    if undo_coalesce['message'] and undo_coalesce['message'] != keep:
+        bpy.ops.ed.undo_push(message=undo_coalesce['message'])
+        undo_coalesce['message'] = ""
+
+
+def coalesce_undo(context, message):
+    # Call after the change is done, and flush_undo(message) before it. Returns the result for execute().
+    window = context.user_preferences.addons[__name__].preferences.undo_window
+    if undo_coalesce['message'] != message:
+        if window > 0.0:
+            undo_coalesce['message'] = message
+            if not undo_coalesce['running']:
+                bpy.ops.node.nw_flush_undo('INVOKE_DEFAULT')
+        else:
+            bpy.ops.ed.undo_push(message=message)
+    undo_coalesce['last'] = time.time()
+    return {'FINISHED'}
+
+
+class NWFlushUndo(Operator):
+    """Push the undo step shared by repeated hotkey presses once they stop"""
+    bl_idname = "node.nw_flush_undo"
+    bl_label = "Flush Undo"
+    bl_options = {'INTERNAL'}
+
+    def modal(self, context, event):
+        window = context.user_preferences.addons[__name__].preferences.undo_window
+        if undo_coalesce['message']:
+            if event.type == 'TIMER':
+                if time.time() - undo_coalesce['last'] < window:
+                    return {'PASS_THROUGH'}
+            elif event.value != 'PRESS' or event.type in coalesce_keys:
+                return {'PASS_THROUGH'}
+            # Push before the event is handled, so that the next operation gets an undo step of its own.
+            flush_undo()
+        context.window_manager.event_timer_remove(self._timer)
+        undo_coalesce['running'] = False
+        return {'FINISHED', 'PASS_THROUGH'}
+
+    def invoke(self, context, event):
+        self._timer = context.window_manager.event_timer_add(0.1, context.window)
+        context.window_manager.modal_handler_add(self)
+        undo_coalesce['running'] = True
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        undo_coalesce['message'] = ""
+        undo_coalesce['running'] = False
+
+
 class NWBatchChangeNodes(Operator, NWBase):
     bl_idname = "node.nw_batch_change"
     bl_label = "Batch Change"
@@ -1679,51 +4324,30 @@ class NWBatchChangeNodes(Operator, NWBase):
     )
 
     def execute(self, context):
+        batch_change(context.selected_nodes, self.blend_type, self.operation)
+        return {'FINISHED'}
 
-        nodes, links = get_nodes_links(context)
-        blend_type = self.blend_type
-        operation = self.operation
-        for node in context.selected_nodes:
-            if node.type == 'MIX_RGB':
-                if not blend_type in [nav[0] for nav in navs]:
-                    node.blend_type = blend_type
-                else:
-                    if blend_type == 'NEXT':
-                        index = [i for i, entry in enumerate(blend_types) if node.blend_type in entry][0]
-                        #index = blend_types.index(node.blend_type)
-                        if index == len(blend_types) - 1:
-                            node.blend_type = blend_types[0][0]
-                        else:
-                            node.blend_type = blend_types[index + 1][0]
-
-                    if blend_type == 'PREV':
-                        index = [i for i, entry in enumerate(blend_types) if node.blend_type in entry][0]
-                        if index == 0:
-                            node.blend_type = blend_types[len(blend_types) - 1][0]
-                        else:
-                            node.blend_type = blend_types[index - 1][0]
 
-            if node.type == 'MATH':
-                if not operation in [nav[0] for nav in navs]:
-                    node.operation = operation
-                else:
-                    if operation == 'NEXT':
-                        index = [i for i, entry in enumerate(operations) if node.operation in entry][0]
-                        #index = operations.index(node.operation)
-                        if index == len(operations) - 1:
-                            node.operation = operations[0][0]
-                        else:
-                            node.operation = operations[index + 1][0]
+class NWBatchChangeRepeat(Operator, NWBase):
+    bl_idname = "node.nw_batch_change_repeat"
+    bl_label = "Batch Change (Repeat)"
+    bl_description = "Batch Change Blend Type and Math Operation, repeated presses share one undo step"
+    # no 'UNDO', the undo step is pushed by coalesce_undo()
+    bl_options = {'REGISTER'}
 
-                    if operation == 'PREV':
-                        index = [i for i, entry in enumerate(operations) if node.operation in entry][0]
-                        #index = operations.index(node.operation)
-                        if index == 0:
-                            node.operation = operations[len(operations) - 1][0]
-                        else:
-                            node.operation = operations[index - 1][0]
+    blend_type = EnumProperty(
+        name="Blend Type",
+        items=blend_types + navs,
+    )
+    operation = EnumProperty(
+        name="Operation",
+        items=operations + navs,
+    )
 
-        return {'FINISHED'}
+    def execute(self, context):
+        flush_undo(self.bl_label)
+        batch_change(context.selected_nodes, self.blend_type, self.operation)
+        return coalesce_undo(context, self.bl_label)
 
 
 class NWChangeMixFactor(Operator, NWBase):
@@ -1732,30 +4356,139 @@ class NWChangeMixFactor(Operator, NWBase):
     bl_description = "Change Factors of Mix Nodes and Mix Shader Nodes"
     bl_options = {'REGISTER', 'UNDO'}
 
-    # option: Change factor.
-    # If option is 1.0 or 0.0 - set to 1.0 or 0.0
-    # Else - change factor by option value.
+    # see change_mix_factor()
     option = FloatProperty()
 
     def execute(self, context):
         nodes, links = get_nodes_links(context)
-        option = self.option
-        selected = []  # entry = index
-        for si, node in enumerate(nodes):
-            if node.select:
-                if node.type in {'MIX_RGB', 'MIX_SHADER'}:
-                    selected.append(si)
-
-        for si in selected:
-            fac = nodes[si].inputs[0]
-            nodes[si].hide = False
-            if option in {0.0, 1.0}:
-                fac.default_value = option
-            else:
-                fac.default_value += option
+        change_mix_factor(nodes, self.option)
+        return {'FINISHED'}
+
+
+class NWChangeMixFactorRepeat(Operator, NWBase):
+    bl_idname = "node.nw_factor_repeat"
+    bl_label = "Change Factor (Repeat)"
+    bl_description = "Change Factors of Mix Nodes and Mix Shader Nodes, repeated presses share one undo step"
+    # no 'UNDO', the undo step is pushed by coalesce_undo()
+    bl_options = {'REGISTER'}
+
+    # see change_mix_factor()
+    option = FloatProperty()
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        flush_undo(self.bl_label)
+        change_mix_factor(nodes, self.option)
+        return coalesce_undo(context, self.bl_label)
 
+
+def scrub_originals(nodes):
+    # (name, factor, blend type or operation) of nodes that can be scrubbed, None where not applicable
+    originals = []
+    for node in nodes:
+        if node.type == 'MIX_RGB':
+            originals.append((node.name, node.inputs[0].default_value, node.blend_type))
+        elif node.type == 'MIX_SHADER':
+            originals.append((node.name, node.inputs[0].default_value, None))
+        elif node.type == 'MATH':
+            originals.append((node.name, None, node.operation))
+    return originals
+
+
+def scrub_nodes(nodes, originals, factor, steps):
+    # Set factors to original + factor and step blend types/operations from the original ones.
+    # Only values that differ are written, every write updates the tree.
+    for name, fac, kind in originals:
+        node = nodes.get(name)
+        if node is None:
+            continue
+        if fac is not None:
+            value = clamp(fac + factor, 0.0, 1.0)
+            if node.inputs[0].default_value != value:
+                node.inputs[0].default_value = value
+        if node.type == 'MIX_RGB':
+            index = node_types.blend_type_index[kind]
+            blend_type = blend_types[(index + steps) % len(blend_types)][0]
+            if node.blend_type != blend_type:
+                node.blend_type = blend_type
+        elif node.type == 'MATH':
+            index = node_types.operation_index[kind]
+            operation = operations[(index + steps) % len(operations)][0]
+            if node.operation != operation:
+                node.operation = operation
+
+
+class NWScrubMixNodes(Operator, NWBase):
+    """Change factors with the mouse or Left/Right, blend types and operations with the wheel or Up/Down"""
+    bl_idname = "node.nw_scrub_mix"
+    bl_label = "Scrub Mix Nodes"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    factor = FloatProperty(
+        name="Factor",
+        description="Change of the factors of Mix nodes",
+    )
+    steps = IntProperty(
+        name="Steps",
+        description="Steps through the blend types of Mix nodes and operations of Math nodes",
+    )
+
+    def update_header(self, context):
+        context.area.header_text_set("Factor: %+.3f   Blend Type/Operation: %+d   "
+                                     "(Mouse, Left/Right: factor, Wheel, Up/Down: type, Ctrl: snap, Shift: precise)"
+                                     % (self.factor, self.steps))
+
+    def modal(self, context, event):
+        nodes, links = get_nodes_links(context)
+
+        if event.type == 'MOUSEMOVE':
+            self.drag = (event.mouse_x - self.mouse_x) * (0.0005 if event.shift else 0.005)
+        elif event.type in {'WHEELUPMOUSE', 'UP_ARROW'} and event.value == 'PRESS':
+            self.steps -= 1
+        elif event.type in {'WHEELDOWNMOUSE', 'DOWN_ARROW'} and event.value == 'PRESS':
+            self.steps += 1
+        elif event.type in {'LEFT_ARROW', 'RIGHT_ARROW'} and event.value == 'PRESS':
+            step = 0.01 if event.shift else 0.1
+            self.keys += step if event.type == 'RIGHT_ARROW' else -step
+        elif event.type in {'LEFTMOUSE', 'RET', 'NUMPAD_ENTER'} and event.value == 'PRESS':
+            context.area.header_text_set()
+            # one undo step for the whole scrub
+            return {'FINISHED'}
+        elif event.type in {'RIGHTMOUSE', 'ESC'} and event.value == 'PRESS':
+            scrub_nodes(nodes, self.originals, 0.0, 0)
+            context.area.header_text_set()
+            return {'CANCELLED'}
+        else:
+            return {'RUNNING_MODAL'}
+
+        factor = self.keys + self.drag
+        if event.ctrl:
+            factor = round(factor, 1)
+        self.factor = factor
+        scrub_nodes(nodes, self.originals, self.factor, self.steps)
+        self.update_header(context)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        # redo from the panel
+        nodes, links = get_nodes_links(context)
+        scrub_nodes(nodes, scrub_originals(context.selected_nodes), self.factor, self.steps)
         return {'FINISHED'}
 
+    def invoke(self, context, event):
+        self.originals = scrub_originals(context.selected_nodes)
+        if not self.originals:
+            self.report({'WARNING'}, "No Mix or Math nodes selected")
+            return {'CANCELLED'}
+        self.factor = 0.0
+        self.steps = 0
+        self.keys = 0.0  # factor change from Left/Right
+        self.drag = 0.0  # factor change from the mouse
+        self.mouse_x = event.mouse_x
+        self.update_header(context)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
 
 class NWCopySettings(Operator, NWBase):
     bl_idname = "node.nw_copy_settings"
@@ -1763,6 +4496,14 @@ class NWCopySettings(Operator, NWBase):
     bl_description = "Copy Settings of Active Node to Selected Nodes"
     bl_options = {'REGISTER', 'UNDO'}
 
+    # attributes the copy of active takes over from the node it replaces
+    kept_attributes = (
+        'hide', 'show_preview', 'mute', 'label',
+        'use_custom_color', 'color', 'width', 'width_hidden',
+    )
+    # attributes common to all nodes that the copy has from active
+    copied_attributes = ('show_options', 'show_texture')
+
     @classmethod
     def poll(cls, context):
         space = context.space_data
@@ -1782,8 +4523,18 @@ class NWCopySettings(Operator, NWBase):
         active = nodes.active
         if active.select:
             reselect.append(active)
+        # When catalog shows that all settings of active's type can be set directly
+        # they are copied without duplicating and relinking nodes.
+        info = node_info(active.rna_type.identifier)
+        copy_direct = (info is not None and not info['structs'] and
+                       len(info['inputs']) == len(active.inputs) and
+                       len(info['outputs']) == len(active.outputs))
 
         for node in selected:
+            if copy_direct and node.type == active.type and node != active:
+                if self.copy_props(active, node, info):
+                    reselect.append(node)
+                    continue
             if node.type == active.type and node != active:
                 # duplicate active, relink links as in 'node', append copy to 'reselect', delete node
                 bpy.ops.node.select_all(action='DESELECT')
@@ -1792,11 +4543,7 @@ class NWCopySettings(Operator, NWBase):
                 bpy.ops.node.duplicate()
                 copied = nodes.active
                 # Copied active should however inherit some properties from 'node'
-                attributes = (
-                    'hide', 'show_preview', 'mute', 'label',
-                    'use_custom_color', 'color', 'width', 'width_hidden',
-                )
-                for attr in attributes:
+                for attr in self.kept_attributes:
                     setattr(copied, attr, getattr(node, attr))
                 # Handle scenario when 'node' is in frame. 'copied' is in same frame then.
                 if copied.parent:
@@ -1834,6 +4581,47 @@ class NWCopySettings(Operator, NWBase):
 
         return {'FINISHED'}
 
+    @staticmethod
+    def copy_props(active, node, info):
+        # Make node look like the copy of active made by duplicating: type specific properties, input values,
+        # copied_attributes and hidden sockets of active, kept_attributes of node.
+        # Everything is read before anything is set. If a value can't be set, node gets its old values back
+        # and False is returned.
+        if node.rna_type.identifier != active.rna_type.identifier or len(node.inputs) != len(active.inputs):
+            return False
+
+        def snapshot(value):
+            # arrays are read into tuples, they would follow the property
+            if isinstance(value, (set, frozenset)):
+                return set(value)
+            if hasattr(value, '__len__') and not isinstance(value, (str, bpy.types.ID)):
+                return tuple(value)
+            return value
+
+        try:
+            values = [(node, attr, getattr(active, attr)) for attr in NWCopySettings.copied_attributes]
+            values.extend((node, prop, getattr(active, prop)) for prop, prop_type in info['props'])
+            for (name, type, has_default), src, dst in zip(info['inputs'], active.inputs, node.inputs):
+                values.append((dst, 'hide', src.hide))
+                if has_default:
+                    values.append((dst, 'default_value', src.default_value))
+            values.extend((dst, 'hide', src.hide) for src, dst in zip(active.outputs, node.outputs))
+            values = [(owner, attr, snapshot(value)) for owner, attr, value in values]
+            old = [(owner, attr, snapshot(getattr(owner, attr))) for owner, attr, value in values]
+        except AttributeError:
+            return False
+        try:
+            for owner, attr, value in values:
+                setattr(owner, attr, value)
+        except (AttributeError, TypeError, ValueError):
+            for owner, attr, value in old:
+                try:
+                    setattr(owner, attr, value)
+                except (AttributeError, TypeError, ValueError):
+                    pass
+            return False
+        return True
+
 
 class NWCopyLabel(Operator, NWBase):
     bl_idname = "node.nw_copy_label"
@@ -1940,6 +4728,12 @@ class NWAddTextureSetup(Operator, NWBase):
     bl_description = "Add Texture Node Setup to Selected Shaders"
     bl_options = {'REGISTER', 'UNDO'}
 
+    batch = BoolProperty(
+        name="All Selected",
+        description="Add texture setups to all selected shaders and textures, sharing one "
+                    "Texture Coordinate and Mapping node per coordinate output",
+        default=False)
+
     @classmethod
     def poll(cls, context):
         space = context.space_data
@@ -1949,11 +4743,75 @@ class NWAddTextureSetup(Operator, NWBase):
                 valid = True
         return valid
 
+    @staticmethod
+    def coord_output(node):
+        # Output of Texture Coordinate to use and type of image node to add for node
+        coordout = 2
+        image_type = 'ShaderNodeTexImage'
+        if (node.type in node_types.texture_types and node.type != 'TEX_IMAGE') or (node.type == 'BACKGROUND'):
+            coordout = 0  # image texture uses UVs, procedural textures and Background shader use Generated
+            if node.type == 'BACKGROUND':
+                image_type = 'ShaderNodeTexEnvironment'
+        return coordout, image_type
+
+    def execute_batch(self, nodes, links):
+        shader_types = node_types.bsdf_types
+        texture_types = node_types.texture_types
+        targets = [node for node in nodes if node.select and
+                   (node.type in shader_types or node.type in texture_types) and
+                   node.inputs and not node.inputs[0].is_linked]
+        if not targets:
+            return {'CANCELLED'}
+        targets.sort(key=lambda node: -node.location.y)
+        any_shader = any(node.type in shader_types for node in targets)
+        tex_x = min(node.location.x for node in targets) - 250.0
+        map_x = (tex_x if any_shader else tex_x + 250.0) - 300.0
+
+        # one column of image textures, then one Mapping per coordinate output feeding all of them
+        consumers = {}  # coordout: [(input to link Mapping to, loc y), ...]
+        added = []
+        last_y = None
+        for node in targets:
+            coordout, image_type = self.coord_output(node)
+            node.select = False
+            if node.type in shader_types:
+                tex = nodes.new(image_type)
+                loc_y = node.location.y + 28.0
+                if last_y is not None:
+                    loc_y = min(loc_y, last_y - 280.0)
+                last_y = loc_y
+                tex.location = tex_x, loc_y
+                links.new(tex.outputs[0], node.inputs[0])
+                consumers.setdefault(coordout, []).append((tex.inputs[0], loc_y))
+                added.append(tex)
+            else:
+                consumers.setdefault(coordout, []).append((node.inputs[0], node.location.y))
+        last_y = None
+        for coordout, inputs in sorted(consumers.items()):
+            map = nodes.new('ShaderNodeMapping')
+            loc_y = sum(y for socket, y in inputs) / len(inputs) + 80.0
+            if last_y is not None:
+                loc_y = min(loc_y, last_y - 400.0)
+            last_y = loc_y
+            map.location = map_x, loc_y
+            map.width = 240
+            coord = nodes.new('ShaderNodeTexCoord')
+            coord.location = map_x - 200.0, loc_y - 40.0
+            links.new(coord.outputs[coordout], map.inputs[0])
+            for socket, y in inputs:
+                links.new(map.outputs[0], socket)
+            added.extend((map, coord))
+        nodes.active = added[0]
+        mark_changed(nodes, added)
+        return {'FINISHED'}
+
     def execute(self, context):
         nodes, links = get_nodes_links(context)
+        if self.batch:
+            return self.execute_batch(nodes, links)
         active = nodes.active
-        shader_types = [x[1] for x in shaders_shader_nodes_props if x[1] not in {'MIX_SHADER', 'ADD_SHADER'}]
-        texture_types = [x[1] for x in shaders_texture_nodes_props]
+        shader_types = node_types.bsdf_types
+        texture_types = node_types.texture_types
         valid = False
         if active:
             if active.select:
@@ -1970,13 +4828,7 @@ class NWAddTextureSetup(Operator, NWBase):
                 xoffset = [290.0, 500.0]
                 isshader = False
 
-            coordout = 2
-            image_type = 'ShaderNodeTexImage'
-
-            if (active.type in texture_types and active.type != 'TEX_IMAGE') or (active.type == 'BACKGROUND'):
-                coordout = 0  # image texture uses UVs, procedural textures and Background shader use Generated
-                if active.type == 'BACKGROUND':
-                    image_type = 'ShaderNodeTexEnvironment'
+            coordout, image_type = self.coord_output(active)
 
             if isshader:
                 tex = nodes.new(image_type)
@@ -1994,11 +4846,13 @@ class NWAddTextureSetup(Operator, NWBase):
                 links.new(tex.outputs[0], active.inputs[0])
                 links.new(map.outputs[0], tex.inputs[0])
                 links.new(coord.outputs[coordout], map.inputs[0])
+                mark_changed(nodes, (tex, map, coord))
 
             else:
                 nodes.active = map
                 links.new(map.outputs[0], active.inputs[0])
                 links.new(coord.outputs[coordout], map.inputs[0])
+                mark_changed(nodes, (map, coord))
 
         return {'FINISHED'}
 
@@ -2200,87 +5054,190 @@ class NWAlignNodes(Operator, NWBase):
 
     def execute(self, context):
         nodes, links = get_nodes_links(context)
-        selected = []  # entry = [index, loc.x, loc.y, width, height]
-        frames_reselect = []  # entry = frame node. will be used to reselect all selected frames
         active = nodes.active
-        for i, node in enumerate(nodes):
-            total_w = 0.0  # total width of all nodes. Will be calculated later.
-            total_h = 0.0  # total height of all nodes. Will be calculated later
-            if node.select:
-                if node.type == 'FRAME':
-                    node.select = False
-                    frames_reselect.append(i)
-                else:
-                    locx = node.location.x
-                    locy = node.location.y
-                    width = node.dimensions[0]
-                    height = node.dimensions[1]
-                    total_w += width  # add nodes[i] width to total width of all nodes
-                    total_h += height  # add nodes[i] height to total height of all nodes
-                    # calculate relative locations
-                    parent = node.parent
-                    while parent is not None:
-                        locx += parent.location.x
-                        locy += parent.location.y
-                        parent = parent.parent
-                    selected.append([i, locx, locy, width, height])
-        count = len(selected)
-        if count > 1:  # aligning makes sense only if at least 2 nodes are selected
-            selected_sorted_x = sorted(selected, key=lambda k: (k[1], -k[2]))
-            selected_sorted_y = sorted(selected, key=lambda k: (-k[2], k[1]))
-            min_x = selected_sorted_x[0][1]  # min loc.x
-            min_x_loc_y = selected_sorted_x[0][2]  # loc y of node with min loc x
-            min_x_w = selected_sorted_x[0][3]  # width of node with max loc x
-            max_x = selected_sorted_x[count - 1][1]  # max loc.x
-            max_x_loc_y = selected_sorted_x[count - 1][2]  # loc y of node with max loc.x
-            max_x_w = selected_sorted_x[count - 1][3]  # width of node with max loc.x
-            min_y = selected_sorted_y[0][2]  # min loc.y
-            min_y_loc_x = selected_sorted_y[0][1]  # loc.x of node with min loc.y
-            min_y_h = selected_sorted_y[0][4]  # height of node with min loc.y
-            min_y_w = selected_sorted_y[0][3]  # width of node with min loc.y
-            max_y = selected_sorted_y[count - 1][2]  # max loc.y
-            max_y_loc_x = selected_sorted_y[count - 1][1]  # loc x of node with max loc.y
-            max_y_w = selected_sorted_y[count - 1][3]  # width of node with max loc.y
-            max_y_h = selected_sorted_y[count - 1][4]  # height of node with max loc.y
-
-            if self.option == 'AXIS_Y':  # Horizontally. Equivelent of s -> x -> 0 with even spacing.
-                loc_x = min_x
-                #loc_y = (max_x_loc_y + min_x_loc_y) / 2.0
-                loc_y = (max_y - max_y_h / 2.0 + min_y - min_y_h / 2.0) / 2.0
-                offset_x = (max_x - min_x - total_w + max_x_w) / (count - 1)
-                for i, x, y, w, h in selected_sorted_x:
-                    nodes[i].location.x = loc_x
-                    nodes[i].location.y = loc_y + h / 2.0
-                    parent = nodes[i].parent
-                    while parent is not None:
-                        nodes[i].location.x -= parent.location.x
-                        nodes[i].location.y -= parent.location.y
-                        parent = parent.parent
-                    loc_x += offset_x + w
-            else:  # if self.option == 'AXIS_Y'
-                #loc_x = (max_y_loc_x + max_y_w / 2.0 + min_y_loc_x + min_y_w / 2.0) / 2.0
-                loc_x = (max_x + max_x_w / 2.0 + min_x + min_x_w / 2.0) / 2.0
-                loc_y = min_y
-                offset_y = (max_y - min_y + total_h - min_y_h) / (count - 1)
-                for i, x, y, w, h in selected_sorted_y:
-                    nodes[i].location.x = loc_x - w / 2.0
-                    nodes[i].location.y = loc_y
-                    parent = nodes[i].parent
-                    while parent is not None:
-                        nodes[i].location.x -= parent.location.x
-                        nodes[i].location.y -= parent.location.y
-                        parent = parent.parent
-                    loc_y += offset_y - h
-
+        selected = [node for node in nodes if node.select and node.type != 'FRAME']
+        frames_reselect = [node for node in nodes if node.select and node.type == 'FRAME']
+        for frame in frames_reselect:
+            frame.select = False
+        if len(selected) > 1:  # aligning makes sense only if at least 2 nodes are selected
+            geometry = NodeGeometry(selected)
+            geometry.write(align_positions(geometry.rects, self.option))
             # reselect selected frames
-            for i in frames_reselect:
-                nodes[i].select = True
+            for frame in frames_reselect:
+                frame.select = True
             # restore active node
             nodes.active = active
 
         return {'FINISHED'}
 
 
+class NWArrangeNodes(Operator, NWBase, NWChunked):
+    bl_idname = "node.nw_arrange_nodes"
+    bl_label = "Arrange Nodes"
+    bl_description = "Automatically layout the selected nodes (all if none selected) in a linear " \
+                     "and non-overlapping fashion"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    spacing = FloatProperty(
+        name="Spacing",
+        default=80.0,
+        min=0.0,
+        description="The horizonal space between nodes (vertical is half this)")
+    start_align = BoolProperty(
+        name="Align Start Nodes",
+        default=True,
+        description="Put all nodes with no inputs on the left of the tree")
+    end_align = BoolProperty(
+        name="Align End Nodes",
+        default=True,
+        description="Put all nodes with no outputs on the right of the tree")
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def steps(self, context):
+        nodes, links = get_nodes_links(context)
+        self.moved = 0
+        self.selected_only = any(node.select for node in nodes)
+        self.names, self.rects, edges = layout_data(nodes, links, self.selected_only)
+        yield 0.1
+        positions = arrange_layout(self.rects, edges, self.spacing, self.start_align, self.end_align)
+        yield 0.5
+        for name, (x, y) in zip(self.names, positions):
+            set_absolute_location(nodes[name], x, y)
+            self.moved += 1
+            yield 0.5 + 0.5 * self.moved / len(positions)
+
+    def rollback(self, context):
+        nodes, links = get_nodes_links(context)
+        for name, rect in zip(self.names[:self.moved], self.rects):
+            set_absolute_location(nodes[name], rect[0], rect[1])
+        return True
+
+    def finish(self, context):
+        nodes, links = get_nodes_links(context)
+        names = self.names
+        if self.selected_only:
+            # arranged nodes can end up on top of the others
+            geometry = NodeGeometry(node for node in nodes if node.type != 'FRAME')
+            arranged = set(names)
+            overlaps = [(i, j) for i, j in overlapping_pairs(geometry.rects)
+                        if (geometry.nodes[i].name in arranged) != (geometry.nodes[j].name in arranged)]
+            if overlaps:
+                self.report({'WARNING'}, str(len(overlaps)) + " arranged nodes overlap other nodes")
+        return {'FINISHED'}
+
+
+class NWArrangeAll(Operator, NWBase, NWChunked):
+    bl_idname = "node.nw_arrange_all"
+    bl_label = "Arrange All Trees"
+    bl_description = "Arrange nodes of all local materials and node groups in the file, using all CPU cores on Linux"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    spacing = FloatProperty(
+        name="Spacing",
+        default=80.0,
+        min=0.0,
+        description="The horizonal space between nodes (vertical is half this)")
+    start_align = BoolProperty(
+        name="Align Start Nodes",
+        default=True,
+        description="Put all nodes with no inputs on the left of the tree")
+    end_align = BoolProperty(
+        name="Align End Nodes",
+        default=True,
+        description="Put all nodes with no outputs on the right of the tree")
+    processes = IntProperty(
+        name="Processes",
+        default=0,
+        min=0,
+        description="Number of worker processes on Linux, 0 for one per CPU core")
+
+    def steps(self, context):
+        self.start = time.time()
+        # (tree, names, rects) of trees already arranged, for rollback
+        self.arranged = []
+        # locations of nodes in linked trees can't be changed
+        trees = [mat.node_tree for mat in bpy.data.materials
+                 if mat.node_tree and mat.library is None and mat.node_tree.library is None]
+        trees.extend(tree for tree in bpy.data.node_groups if tree.library is None)
+        if not trees:
+            return
+        # read all trees on the main thread, bpy can't be used in workers
+        data = []
+        for tree in trees:
+            data.append(layout_data(tree.nodes, tree.links))
+            yield 0.5 * len(data) / len(trees)
+        jobs = [(rects, edges, self.spacing, self.start_align, self.end_align) for names, rects, edges in data]
+        processes = self.processes or multiprocessing.cpu_count()
+        # workers are forked: spawned processes would have to import the add-on without Blender.
+        # Forking a process that uses Cocoa and OpenGL isn't safe on Mac OS, there it runs serially.
+        if sys.platform.startswith('linux') and processes > 1 and len(jobs) > 1:
+            if hasattr(multiprocessing, 'get_context'):
+                pool = multiprocessing.get_context('fork').Pool(processes)
+            else:
+                pool = multiprocessing.Pool(processes)
+            results = pool.imap(arrange_job, jobs, chunksize=max(1, len(jobs) // (processes * 4)))
+        else:
+            pool = None
+            results = (arrange_job(job) for job in jobs)
+        try:
+            for tree, (names, rects, edges), positions in zip(trees, data, results):
+                apply_layout(tree.nodes, names, positions)
+                self.arranged.append((tree, names, rects))
+                yield 0.5 + 0.5 * len(self.arranged) / len(trees)
+        finally:
+            # also when stopped
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def rollback(self, context):
+        for tree, names, rects in self.arranged:
+            apply_layout(tree.nodes, names, [(rect[0], rect[1]) for rect in rects])
+        return True
+
+    def finish(self, context):
+        self.report({'INFO'}, "Arranged %d trees in %.2f s" % (len(self.arranged), time.time() - self.start))
+        return {'FINISHED'}
+
+
+class NWArrangeChanged(Operator, NWBase):
+    bl_idname = "node.nw_arrange_changed"
+    bl_label = "Arrange Changed Nodes"
+    bl_description = "Place nodes added by Node Wrangler (merge, texture setup, switch type) next to " \
+                     "the nodes they are linked to, moving other nodes only to make room"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    spacing = FloatProperty(
+        name="Spacing",
+        default=80.0,
+        min=0.0,
+        description="The horizonal space between nodes (vertical is half this)")
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        tree_changed = changed_nodes.pop(nodes.id_data.as_pointer(), {})
+        changed = dict((name, place) for name, place in tree_changed.items() if name in nodes)
+        if not changed:
+            # nothing tracked (or file reloaded): place selected nodes
+            changed = dict((node.name, True) for node in nodes if node.select and node.type != 'FRAME')
+        if not changed:
+            self.report({'INFO'}, "No changed nodes")
+            return {'CANCELLED'}
+        moved = layout_changed(nodes, links, changed, self.spacing)
+        self.report({'INFO'}, "Placed " + str(len(changed)) + " nodes, moved " +
+                    str(len(moved) - len(changed)) + " other nodes")
+        return {'FINISHED'}
+
+
 class NWSelectParentChildren(Operator, NWBase):
     bl_idname = "node.nw_select_parent_child"
     bl_label = "Select Parent or Children"
@@ -2312,6 +5269,62 @@ class NWSelectParentChildren(Operator, NWBase):
         return {'FINISHED'}
 
 
+class NWSelectLinked(Operator, NWBase):
+    bl_idname = "node.nw_select_linked"
+    bl_label = "Select Linked"
+    bl_description = "Select nodes feeding the selected nodes, nodes using them or both"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    direction = EnumProperty(
+        name="Direction",
+        items=(
+            ('UPSTREAM', "Upstream", "Select nodes linked to inputs of selected nodes, and their inputs"),
+            ('DOWNSTREAM', "Downstream", "Select nodes linked to outputs of selected nodes, and their outputs"),
+            ('CONNECTED', "Connected", "Select all nodes linked to selected nodes in any direction"),
+        ),
+        default='UPSTREAM')
+    depth = IntProperty(
+        name="Depth",
+        default=0,
+        min=0,
+        description="Number of links to follow (0 for no limit)")
+    stop_types = StringProperty(
+        name="Stop At",
+        default="",
+        description="Node types where the search stops, separated by commas (for example GROUP, TEX_IMAGE)")
+    extend = BoolProperty(
+        name="Extend",
+        default=True,
+        description="Keep selected nodes selected")
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        start = set(node.name for node in nodes if node.select)
+        if not start:
+            return {'CANCELLED'}
+        upstream, downstream = link_adjacency(links)
+        adjacency = {
+            'UPSTREAM': (upstream,),
+            'DOWNSTREAM': (downstream,),
+            'CONNECTED': (upstream, downstream),
+        }[self.direction]
+        stop = None
+        stop_types = set(t.strip().upper() for t in self.stop_types.split(',') if t.strip())
+        if stop_types:
+            stop = lambda name: nodes[name].type in stop_types
+        found = linked_nodes(start, adjacency, self.depth, stop)
+        if not self.extend:
+            found -= start
+        for node in nodes:
+            node.select = node.name in found
+        return {'FINISHED'}
+
+
 class NWDetachOutputs(Operator, NWBase):
     bl_idname = "node.nw_detach_outputs"
     bl_label = "Detach Outputs"
@@ -2348,9 +5361,7 @@ class NWLinkToOutputNode(Operator, NWBase):
         active = nodes.active
         output_node = None
         tree_type = context.space_data.tree_type
-        output_types_shaders = [x[1] for x in shaders_output_nodes_props]
-        output_types_compo = ['COMPOSITE']
-        output_types = output_types_shaders + output_types_compo
+        output_types = node_types.output_types
         for node in nodes:
             if node.type in output_types:
                 output_node = node
@@ -2381,6 +5392,199 @@ class NWLinkToOutputNode(Operator, NWBase):
         return {'FINISHED'}
 
 
+class NWExportNodes(Operator, NWBase, ExportHelper):
+    bl_idname = "node.nw_export_nodes"
+    bl_label = "Export Nodes"
+    bl_description = "Save selected nodes (or the whole tree) with their links to a file"
+
+    filename_ext = ".nwn"
+    filter_glob = StringProperty(default="*.nwn;*.json", options={'HIDDEN'})
+    selected_only = BoolProperty(
+        name="Selected Only",
+        description="Export only selected nodes and links between them",
+        default=True)
+    use_json = BoolProperty(
+        name="JSON",
+        description="Save as readable JSON instead of packed binary",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        data = serialize_nodes(nodes, links, self.selected_only)
+        if not data['nodes']:
+            self.report({'WARNING'}, "No nodes to export")
+            return {'CANCELLED'}
+        center_nodes(data)
+        filepath = self.filepath
+        if self.use_json:
+            filepath = os.path.splitext(filepath)[0] + ".json"
+        write_nodes_file(filepath, data)
+        self.report({'INFO'}, "Exported " + str(len(data['nodes'])) + " nodes")
+        return {'FINISHED'}
+
+
+class NWImportNodes(Operator, NWBase, ImportHelper):
+    bl_idname = "node.nw_import_nodes"
+    bl_label = "Import Nodes"
+    bl_description = "Add nodes saved with Export Nodes at mouse position"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filename_ext = ".nwn"
+    filter_glob = StringProperty(default="*.nwn;*.json", options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def invoke(self, context, event):
+        store_mouse_cursor(context, event)
+        return ImportHelper.invoke(self, context, event)
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        try:
+            data = read_nodes_file(self.filepath)
+        except (IOError, ValueError, struct.error) as err:
+            self.report({'ERROR'}, "Could not read nodes: " + str(err))
+            return {'CANCELLED'}
+        if data['tree'] != nodes.id_data.type:
+            self.report({'ERROR'}, "Nodes were saved from a different tree type (" + data['tree'] + ")")
+            return {'CANCELLED'}
+        for node in nodes:
+            node.select = False
+        # files exported before locations were centered
+        center_nodes(data)
+        instantiate_nodes(data, nodes, links, context.space_data.cursor_location)
+        hack_force_update(context, nodes)
+        return {'FINISHED'}
+
+
+class NWSaveTemplate(Operator, NWBase):
+    bl_idname = "node.nw_save_template"
+    bl_label = "Save Template"
+    bl_description = "Save selected nodes as a template in the templates folder"
+
+    name = StringProperty(
+        name="Name",
+        default="Template",
+    )
+    overwrite = BoolProperty(
+        name="Overwrite",
+        default=False,
+        description="Replace the template with the same name",
+        options={'SKIP_SAVE'},
+    )
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        data = serialize_nodes(nodes, links, selected_only=True)
+        if not data['nodes']:
+            self.report({'WARNING'}, "No nodes selected")
+            return {'CANCELLED'}
+        center_nodes(data)
+
+        try:
+            index = load_template_index(context)
+        except (IOError, OSError) as err:
+            self.report({'ERROR'}, "Could not read templates: " + str(err))
+            return {'CANCELLED'}
+        filename = bpy.path.clean_name(self.name) + ".nwn"
+        filepath = os.path.join(node_templates['path'], filename)
+        if (filename in index or os.path.exists(filepath)) and not self.overwrite:
+            # different names can clean to the same file name
+            other = index[filename][0] if filename in index else filename
+            self.report({'ERROR'}, "Template \"" + other + "\" already exists, enable Overwrite to replace it")
+            return {'CANCELLED'}
+        try:
+            write_nodes_file(filepath, data)
+        except (IOError, OSError) as err:
+            self.report({'ERROR'}, "Could not save template: " + str(err))
+            return {'CANCELLED'}
+        index[filename] = [self.name, data['tree'], os.path.getmtime(filepath)]
+        save_template_index()
+        if node_templates['error']:
+            self.report({'WARNING'}, "Saved template " + self.name + ", could not save template index: " +
+                        node_templates['error'])
+        else:
+            self.report({'INFO'}, "Saved template " + self.name)
+        return {'FINISHED'}
+
+
+class NWAddTemplate(Operator, NWBase):
+    bl_idname = "node.nw_add_template"
+    bl_label = "Add Template"
+    bl_description = "Add nodes of the template at mouse position"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filename = StringProperty()
+
+    @classmethod
+    def poll(cls, context):
+        space = context.space_data
+        return space.type == 'NODE_EDITOR' and space.node_tree is not None
+
+    def invoke(self, context, event):
+        store_mouse_cursor(context, event)
+        result = self.execute(context)
+        if 'FINISHED' in result:
+            bpy.ops.transform.translate('INVOKE_DEFAULT')
+        return result
+
+    def execute(self, context):
+        nodes, links = get_nodes_links(context)
+        try:
+            load_template_index(context)
+            data = read_nodes_file(os.path.join(node_templates['path'], self.filename))
+        except (IOError, OSError, ValueError, struct.error) as err:
+            self.report({'ERROR'}, "Could not read template: " + str(err))
+            return {'CANCELLED'}
+        if not data['nodes']:
+            self.report({'WARNING'}, "Template is empty")
+            return {'CANCELLED'}
+        if data['tree'] != nodes.id_data.type:
+            self.report({'ERROR'}, "Template is for a different tree type (" + data['tree'] + ")")
+            return {'CANCELLED'}
+        for node in nodes:
+            node.select = False
+        new_nodes = instantiate_nodes(data, nodes, links, context.space_data.cursor_location)
+        nodes.active = new_nodes[0]
+        hack_force_update(context, nodes)
+        return {'FINISHED'}
+
+
+class NWRefreshTemplates(Operator, NWBase):
+    bl_idname = "node.nw_refresh_templates"
+    bl_label = "Refresh Templates"
+    bl_description = "Rescan the templates folder"
+
+    def execute(self, context):
+        try:
+            index = load_template_index(context, rescan=True)
+        except (IOError, OSError) as err:
+            self.report({'ERROR'}, "Could not read templates: " + str(err))
+            return {'CANCELLED'}
+        if node_templates['error']:
+            self.report({'WARNING'}, str(len(index)) + " templates, could not save template index: " +
+                        node_templates['error'])
+        else:
+            self.report({'INFO'}, str(len(index)) + " templates")
+        return {'FINISHED'}
+
+
 #
 #  P A N E L
 #
@@ -2398,7 +5602,8 @@ def drawlayout(context, layout, mode='non-panel'):
 
     if tree_type == 'ShaderNodeTree':
         col = layout.column(align=True)
-        col.operator(NWAddTextureSetup.bl_idname, text="Add Texture Setup", icon='NODE_SEL')
+        col.operator(NWAddTextureSetup.bl_idname, text="Add Texture Setup", icon='NODE_SEL').batch = False
+        col.operator(NWAddTextureSetup.bl_idname, text="Add Texture Setups (Selected)").batch = True
         col.separator()
 
     col = layout.column(align=True)
@@ -2421,6 +5626,7 @@ def drawlayout(context, layout, mode='non-panel'):
         col.operator(NWClearLabel.bl_idname).option = True
         col.operator(NWModifyLabels.bl_idname)
     col.menu(NWBatchChangeNodesMenu.bl_idname, text="Batch Change")
+    col.operator(NWScrubMixNodes.bl_idname)
     col.separator()
     col.menu(NWCopyToSelectedMenu.bl_idname, text="Copy to Selected")
     col.separator()
@@ -2431,13 +5637,46 @@ def drawlayout(context, layout, mode='non-panel'):
     col.operator(NWReloadImages.bl_idname, icon='FILE_REFRESH')
     col.separator()
 
+    col = layout.column(align=True)
+    col.operator(NWSelectLinked.bl_idname, text="Select Upstream").direction = 'UPSTREAM'
+    col.operator(NWSelectLinked.bl_idname, text="Select Downstream").direction = 'DOWNSTREAM'
+    col.operator(NWSelectLinked.bl_idname, text="Select Connected").direction = 'CONNECTED'
+    col.separator()
+
     col = layout.column(align=True)
     col.operator(NWFrameSelected.bl_idname, icon='STICKY_UVS_LOC')
+    col.operator(NWFrameComponents.bl_idname)
+    col.operator(NWArrangeNodes.bl_idname)
+    col.operator(NWArrangeChanged.bl_idname)
+    col.operator(NWArrangeAll.bl_idname)
+    col.separator()
+
+    col = layout.column(align=True)
+    col.operator(NWExportNodes.bl_idname, icon='EXPORT')
+    col.operator(NWImportNodes.bl_idname, icon='IMPORT')
     col.separator()
 
     col = layout.column(align=True)
     col.operator(NWDeleteUnused.bl_idname, icon='CANCEL')
+    col.operator(NWPurgeUnused.bl_idname, text="Report Unused Data").purge = False
+    col.operator(NWPurgeUnused.bl_idname).purge = True
+    col.operator(NWMergeDuplicateImages.bl_idname, text="Find Duplicate Images").merge = False
+    col.operator(NWMergeDuplicateImages.bl_idname).merge = True
+    col.operator(NWMergeDuplicates.bl_idname, text="Select Duplicates").merge = False
+    col.operator(NWMergeDuplicates.bl_idname).merge = True
+    col.operator(NWFoldConstants.bl_idname)
+    col.operator(NWBypassNodes.bl_idname)
+    col.separator()
+
+
+def draw_templates(context, layout):
+    # Only the in-memory index is used here, template files are read by NWAddTemplate.
+    col = layout.column(align=True)
+    for name, filename in templates_for_tree(context.space_data.node_tree.type):
+        col.operator(NWAddTemplate.bl_idname, text=name).filename = filename
     col.separator()
+    col.operator(NWSaveTemplate.bl_idname, icon='ZOOMIN')
+    col.operator(NWRefreshTemplates.bl_idname, icon='FILE_REFRESH')
 
 
 class NodeWranglerPanel(Panel, NWBase):
@@ -2457,6 +5696,54 @@ class NodeWranglerPanel(Panel, NWBase):
         drawlayout(context, self.layout, mode='panel')
 
 
+class NWComplexityPanel(Panel, NWBase):
+    bl_idname = "NODE_PT_nw_complexity"
+    bl_space_type = 'NODE_EDITOR'
+    bl_region_type = 'UI'
+    bl_label = "Complexity"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row(align=True)
+        row.operator(NWComplexityReport.bl_idname, text="Analyze").scope = 'TREE'
+        props = row.operator(NWComplexityReport.bl_idname, text="", icon='EXPORT')
+        props.scope = 'TREE'
+        props.export = True
+
+        stats = complexity_report['stats']
+        if stats and complexity_report['tree'] == context.space_data.edit_tree.name:
+            col = layout.column(align=True)
+            col.label("Nodes: %d" % stats['nodes'])
+            for category, count in sorted(stats['categories'].items()):
+                col.label("    " + category + ": %d" % count)
+            col.label("Depth: %d" % stats['depth'])
+            col.label("Textures on critical path: %d" % stats['critical_textures'])
+            col.label("Unused: %d" % stats['unused'])
+            col.label("Muted: %d" % stats['muted'])
+            col.label("Duplicate images: %d" % stats['duplicate_images'])
+
+        layout.separator()
+        row = layout.row(align=True)
+        row.operator(NWComplexityReport.bl_idname, text="All Materials").scope = 'MATERIALS'
+        props = row.operator(NWComplexityReport.bl_idname, text="", icon='EXPORT')
+        props.scope = 'MATERIALS'
+        props.export = True
+        col = layout.column(align=True)
+        for name, stats in complexity_report['top']:
+            col.label("%s: %d nodes, depth %d" % (name, stats['nodes'], stats['depth']))
+
+
+class NWTemplatesPanel(Panel, NWBase):
+    bl_idname = "NODE_PT_nw_templates"
+    bl_space_type = 'NODE_EDITOR'
+    bl_region_type = 'TOOLS'
+    bl_label = "Templates"
+
+    def draw(self, context):
+        draw_templates(context, self.layout)
+
+
 #
 #  M E N U S
 #
@@ -2653,6 +5940,14 @@ class NWNodeAlignMenu(Menu, NWBase):
         layout.operator(NWAlignNodes.bl_idname, text="Vertically").option = 'AXIS_Y'
 
 
+class NWTemplatesMenu(Menu, NWBase):
+    bl_idname = "NODE_MT_nw_templates_menu"
+    bl_label = "Templates"
+
+    def draw(self, context):
+        draw_templates(context, self.layout)
+
+
 # TODO, add to toolbar panel
 class NWUVMenu(bpy.types.Menu):
     bl_idname = "NODE_MT_nw_node_uvs_menu"
@@ -2737,214 +6032,41 @@ class NWSwitchNodeTypeMenu(Menu, NWBase):
     def draw(self, context):
         layout = self.layout
         tree = context.space_data.node_tree
-        if tree.type == 'SHADER':
-            layout.menu(NWSwitchShadersInputSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersOutputSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersShaderSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersTextureSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersColorSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersVectorSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersConverterSubmenu.bl_idname)
-            layout.menu(NWSwitchShadersLayoutSubmenu.bl_idname)
-        if tree.type == 'COMPOSITING':
-            layout.menu(NWSwitchCompoInputSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoOutputSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoColorSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoConverterSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoFilterSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoVectorSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoMatteSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoDistortSubmenu.bl_idname)
-            layout.menu(NWSwitchCompoLayoutSubmenu.bl_idname)
-
-
-class NWSwitchShadersInputSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_input_submenu"
-    bl_label = "Input"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_input_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersOutputSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_output_submenu"
-    bl_label = "Output"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_output_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersShaderSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_shader_submenu"
-    bl_label = "Shader"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_shader_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersTextureSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_texture_submenu"
-    bl_label = "Texture"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_texture_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersColorSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_color_submenu"
-    bl_label = "Color"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_color_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersVectorSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_vector_submenu"
-    bl_label = "Vector"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_vector_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersConverterSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_converter_submenu"
-    bl_label = "Converter"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_converter_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchShadersLayoutSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_shaders_layout_submenu"
-    bl_label = "Layout"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in shaders_layout_nodes_props:
-            if type != 'FRAME':
-                props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-                props.to_type = ident
-
-
-class NWSwitchCompoInputSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_input_submenu"
-    bl_label = "Input"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_input_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchCompoOutputSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_output_submenu"
-    bl_label = "Output"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_output_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchCompoColorSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_color_submenu"
-    bl_label = "Color"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_color_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
+        for bl_idname in switch_submenus.get(tree.type, ()):
+            layout.menu(bl_idname)
 
 
-class NWSwitchCompoConverterSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_converter_submenu"
-    bl_label = "Converter"
+class NWSwitchNodeTypeSubmenu(Menu, NWBase):
+    # Not registered itself. Base of submenus created from nodes_catalog by make_switch_submenus().
+    # items entry = (rna_type.identifier, rna_type.name)
+    items = ()
 
     def draw(self, context):
         layout = self.layout
-        for ident, type, rna_name in compo_converter_nodes_props:
+        for ident, rna_name in self.items:
             props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
             props.to_type = ident
 
 
-class NWSwitchCompoFilterSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_filter_submenu"
-    bl_label = "Filter"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_filter_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchCompoVectorSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_vector_submenu"
-    bl_label = "Vector"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_vector_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchCompoMatteSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_matte_submenu"
-    bl_label = "Matte"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_matte_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
-
-
-class NWSwitchCompoDistortSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_distort_submenu"
-    bl_label = "Distort"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_distort_nodes_props:
-            props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-            props.to_type = ident
+# node_tree.type: bl_idnames of "Switch Type to..." submenus, filled by make_switch_submenus()
+switch_submenus = {}
 
 
-class NWSwitchCompoLayoutSubmenu(Menu, NWBase):
-    bl_idname = "NODE_MT_nw_switch_compo_layout_submenu"
-    bl_label = "Layout"
-
-    def draw(self, context):
-        layout = self.layout
-        for ident, type, rna_name in compo_layout_nodes_props:
-            if type != 'FRAME':
-                props = layout.operator(NWSwitchNodeType.bl_idname, text=rna_name)
-                props.to_type = ident
+def make_switch_submenus():
+    # Create one submenu class per category of nodes_catalog with a precomputed list of items.
+    classes = []
+    switch_submenus.clear()
+    for tree_type, tree_name, category, nodes_props in nodes_catalog:
+        bl_idname = "NODE_MT_nw_switch_%s_%s_submenu" % (tree_name.lower(), category.lower())
+        items = tuple((ident, rna_name) for ident, node_type, rna_name in nodes_props if node_type != 'FRAME')
+        cls = type('NWSwitch%s%sSubmenu' % (tree_name, category), (NWSwitchNodeTypeSubmenu,), {
+            'bl_idname': bl_idname,
+            'bl_label': category,
+            'items': items,
+        })
+        classes.append(cls)
+        switch_submenus.setdefault(tree_type, []).append(bl_idname)
+    return classes
 
 
 #
@@ -2956,6 +6078,10 @@ def select_parent_children_buttons(self, context):
     layout = self.layout
     layout.operator(NWSelectParentChildren.bl_idname, text="Select frame's members (children)").option = 'CHILD'
     layout.operator(NWSelectParentChildren.bl_idname, text="Select parent frame").option = 'PARENT'
+    layout.separator()
+    layout.operator(NWSelectLinked.bl_idname, text="Select Upstream").direction = 'UPSTREAM'
+    layout.operator(NWSelectLinked.bl_idname, text="Select Downstream").direction = 'DOWNSTREAM'
+    layout.operator(NWSelectLinked.bl_idname, text="Select Connected").direction = 'CONNECTED'
 
 
 def attr_nodes_menu_func(self, context):
@@ -2965,6 +6091,10 @@ def attr_nodes_menu_func(self, context):
     col.separator()
 
 
+def templates_menu_func(self, context):
+    self.layout.menu(NWTemplatesMenu.bl_idname)
+
+
 def bgreset_menu_func(self, context):
     self.layout.operator(NWResetBG.bl_idname)
 
@@ -3071,9 +6201,9 @@ kmi_defs = (
         (('blend_type', 'CURRENT'), ('operation', 'LESS_THAN'),), "Batch change blend type (Current)"),
     (NWBatchChangeNodes.bl_idname, 'PERIOD', False, False, True,
         (('blend_type', 'CURRENT'), ('operation', 'GREATER_THAN'),), "Batch change blend type (Current)"),
-    (NWBatchChangeNodes.bl_idname, 'DOWN_ARROW', False, False, True,
+    (NWBatchChangeRepeat.bl_idname, 'DOWN_ARROW', False, False, True,
         (('blend_type', 'NEXT'), ('operation', 'NEXT'),), "Batch change blend type (Next)"),
-    (NWBatchChangeNodes.bl_idname, 'UP_ARROW', False, False, True,
+    (NWBatchChangeRepeat.bl_idname, 'UP_ARROW', False, False, True,
         (('blend_type', 'PREV'), ('operation', 'PREV'),), "Batch change blend type (Previous)"),
     # LINK ACTIVE TO SELECTED
     # Don't use names, don't replace links (K)
@@ -3095,16 +6225,18 @@ kmi_defs = (
     (NWLinkActiveToSelected.bl_idname, 'SEMI_COLON', False, True, False,
         (('replace', True), ('use_node_name', False), ('use_outputs_names', True),), "Link active to selected (Replace links, output names)"),
     # CHANGE MIX FACTOR
-    (NWChangeMixFactor.bl_idname, 'LEFT_ARROW', False, False, True, (('option', -0.1),), "Reduce Mix Factor by 0.1"),
-    (NWChangeMixFactor.bl_idname, 'RIGHT_ARROW', False, False, True, (('option', 0.1),), "Increase Mix Factor by 0.1"),
-    (NWChangeMixFactor.bl_idname, 'LEFT_ARROW', False, True, True, (('option', -0.01),), "Reduce Mix Factor by 0.01"),
-    (NWChangeMixFactor.bl_idname, 'RIGHT_ARROW', False, True, True, (('option', 0.01),), "Increase Mix Factor by 0.01"),
+    (NWChangeMixFactorRepeat.bl_idname, 'LEFT_ARROW', False, False, True, (('option', -0.1),), "Reduce Mix Factor by 0.1"),
+    (NWChangeMixFactorRepeat.bl_idname, 'RIGHT_ARROW', False, False, True, (('option', 0.1),), "Increase Mix Factor by 0.1"),
+    (NWChangeMixFactorRepeat.bl_idname, 'LEFT_ARROW', False, True, True, (('option', -0.01),), "Reduce Mix Factor by 0.01"),
+    (NWChangeMixFactorRepeat.bl_idname, 'RIGHT_ARROW', False, True, True, (('option', 0.01),), "Increase Mix Factor by 0.01"),
     (NWChangeMixFactor.bl_idname, 'LEFT_ARROW', True, True, True, (('option', 0.0),), "Set Mix Factor to 0.0"),
     (NWChangeMixFactor.bl_idname, 'RIGHT_ARROW', True, True, True, (('option', 1.0),), "Set Mix Factor to 1.0"),
     (NWChangeMixFactor.bl_idname, 'NUMPAD_0', True, True, True, (('option', 0.0),), "Set Mix Factor to 0.0"),
     (NWChangeMixFactor.bl_idname, 'ZERO', True, True, True, (('option', 0.0),), "Set Mix Factor to 0.0"),
     (NWChangeMixFactor.bl_idname, 'NUMPAD_1', True, True, True, (('option', 1.0),), "Mix Factor to 1.0"),
     (NWChangeMixFactor.bl_idname, 'ONE', True, True, True, (('option', 1.0),), "Set Mix Factor to 1.0"),
+    # SCRUB MIX NODES (Alt F)
+    (NWScrubMixNodes.bl_idname, 'F', False, False, True, None, "Scrub mix factors and blend types"),
     # CLEAR LABEL (Alt L)
     (NWClearLabel.bl_idname, 'L', False, False, True, (('option', False),), "Clear node labels"),
     # MODIFY LABEL (Alt Shift L)
@@ -3122,6 +6254,7 @@ kmi_defs = (
     (NWSelectParentChildren.bl_idname, 'LEFT_BRACKET', False, False, False, (('option', 'PARENT'),), "Select Parent"),
     # Add Texture Setup
     (NWAddTextureSetup.bl_idname, 'T', True, False, False, None, "Add texture setup"),
+    (NWAddTextureSetup.bl_idname, 'T', True, True, False, (('batch', True),), "Add texture setups to selected"),
     # Reset backdrop
     (NWResetBG.bl_idname, 'Z', False, False, False, None, "Reset backdrop image zoom"),
     # Delete unused
@@ -3130,6 +6263,7 @@ kmi_defs = (
     (NWFrameSelected.bl_idname, 'P', False, True, False, None, "Frame selected nodes"),
     # Swap Outputs
     (NWSwapOutputs.bl_idname, 'S', False, False, True, None, "Swap Outputs"),
+    (NWSwapOutputs.bl_idname, 'S', True, False, True, (('reverse', True),), "Swap Outputs (Reverse)"),
     # Emission Viewer
     (NWEmissionViewer.bl_idname, 'LEFTMOUSE', True, True, False, None, "Connect to Cycles Viewer node"),
     # Reload Images
@@ -3149,18 +6283,116 @@ kmi_defs = (
 )
 
 
-def register():
-    # props
-    bpy.types.Scene.NWBusyDrawing = StringProperty(
-        name="Busy Drawing!",
-        default="",
-        description="An internal property used to store only the first mouse position")
-    bpy.types.Scene.NWDrawColType = StringProperty(
-        name="Color Type!",
-        default="x",
-        description="An internal property used to store the line color")
+# Classes needed to work on node tree data. These are the only ones registered in background mode.
+data_classes = (
+    NWNodeWrangler,
+    NWDeleteUnused,
+    NWPurgeUnused,
+    NWMergeDuplicateImages,
+    NWMergeDuplicates,
+    NWFoldConstants,
+    NWBypassNodes,
+    NWComplexityReport,
+    NWSwapOutputs,
+    NWFrameSelected,
+    NWFrameComponents,
+    NWReloadImages,
+    NWSwitchNodeType,
+    NWMergeNodes,
+    NWBatchChangeNodes,
+    NWChangeMixFactor,
+    NWCopySettings,
+    NWCopyLabel,
+    NWClearLabel,
+    NWModifyLabels,
+    NWAddTextureSetup,
+    NWAddReroutes,
+    NWLinkActiveToSelected,
+    NWAlignNodes,
+    NWArrangeNodes,
+    NWArrangeAll,
+    NWArrangeChanged,
+    NWSelectParentChildren,
+    NWSelectLinked,
+    NWLinkToOutputNode,
+    NWExportNodes,
+    NWImportNodes,
+    NWSaveTemplate,
+    NWAddTemplate,
+    NWRefreshTemplates,
+)
+# Operators that need mouse events or other operators' interactive modes.
+interactive_classes = (
+    NWLazyMix,
+    NWLazyConnect,
+    NWFlushUndo,
+    NWBatchChangeRepeat,
+    NWChangeMixFactorRepeat,
+    NWScrubMixNodes,
+    NWResetBG,
+    NWAddAttrNode,
+    NWEmissionViewer,
+    NWDetachOutputs,
+)
+# Panels and menus. Registered together with the keymaps on first use of the Node Editor.
+ui_classes = (
+    NodeWranglerPanel,
+    NWComplexityPanel,
+    NWTemplatesPanel,
+    NodeWranglerMenu,
+    NWMergeNodesMenu,
+    NWMergeShadersMenu,
+    NWMergeMixMenu,
+    NWMergeMathMenu,
+    NWBatchChangeNodesMenu,
+    NWBatchChangeBlendTypeMenu,
+    NWBatchChangeOperationMenu,
+    NWCopyToSelectedMenu,
+    NWCopyLabelMenu,
+    NWAddReroutesMenu,
+    NWLinkActiveToSelectedMenu,
+    NWLinkStandardMenu,
+    NWLinkUseNodeNameMenu,
+    NWLinkUseOutputsNamesMenu,
+    NWNodeAlignMenu,
+    NWUVMenu,
+    NWVertColMenu,
+    NWTemplatesMenu,
+    NWSwitchNodeTypeMenu,
+)
+
+registered_classes = []
+# Lazy registration of the UI.
+# 'draw_handle': draw callback flagging first use of the Node Editor
+# 'node_editor_used': set by that callback, picked up by lazy_ui_handler
+# 'time', 'ui_time': seconds spent in register() and in registering the UI
+lazy_ui = {
+    'draw_handle': None,
+    'node_editor_used': False,
+    'registered': False,
+    'time': 0.0,
+    'ui_time': 0.0,
+}
+
+
+def register_classes(classes):
+    for cls in classes:
+        bpy.utils.register_class(cls)
+        registered_classes.append(cls)
 
-    bpy.utils.register_module(__name__)
+
+def node_editor_used():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'NODE_EDITOR':
+                return True
+    return False
+
+
+def register_ui():
+    start = time.time()
+    register_classes(ui_classes)
+    register_classes(make_switch_submenus())
 
     # keymaps
     km = bpy.context.window_manager.keyconfigs.addon.keymaps.new(name='Node Editor', space_type="NODE_EDITOR")
@@ -3175,16 +6407,21 @@ def register():
     bpy.types.NODE_MT_select.append(select_parent_children_buttons)
     bpy.types.NODE_MT_category_SH_NEW_INPUT.prepend(attr_nodes_menu_func)
     bpy.types.NODE_PT_category_SH_NEW_INPUT.prepend(attr_nodes_menu_func)
+    bpy.types.NODE_MT_add.append(templates_menu_func)
     bpy.types.NODE_PT_backdrop.append(bgreset_menu_func)
 
+    # templates menu only reads the index
+    try:
+        load_template_index(bpy.context)
+    except (IOError, OSError) as err:
+        print("Node Wrangler: could not read templates: " + str(err))
 
-def unregister():
-    # props
-    del bpy.types.Scene.NWBusyDrawing
-    del bpy.types.Scene.NWDrawColType
+    lazy_ui['registered'] = True
+    lazy_ui['ui_time'] = time.time() - start
+    print("Node Wrangler: menus and keymaps registered in %.1f ms" % (lazy_ui['ui_time'] * 1000.0))
 
-    bpy.utils.unregister_module(__name__)
 
+def unregister_ui():
     # keymaps
     for km, kmi in addon_keymaps:
         km.keymap_items.remove(kmi)
@@ -3194,7 +6431,62 @@ def unregister():
     bpy.types.NODE_MT_select.remove(select_parent_children_buttons)
     bpy.types.NODE_MT_category_SH_NEW_INPUT.remove(attr_nodes_menu_func)
     bpy.types.NODE_PT_category_SH_NEW_INPUT.remove(attr_nodes_menu_func)
+    bpy.types.NODE_MT_add.remove(templates_menu_func)
     bpy.types.NODE_PT_backdrop.remove(bgreset_menu_func)
 
+    lazy_ui['registered'] = False
+
+
+def remove_lazy_ui_handlers():
+    if lazy_ui['draw_handle'] is not None:
+        bpy.types.SpaceNodeEditor.draw_handler_remove(lazy_ui['draw_handle'], 'WINDOW')
+        lazy_ui['draw_handle'] = None
+    if lazy_ui_handler in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(lazy_ui_handler)
+
+
+def draw_callback_node_editor_used():
+    # Only flag here. Registering classes or removing draw handlers while drawing is not safe.
+    lazy_ui['node_editor_used'] = True
+
+
+@persistent
+def lazy_ui_handler(scene):
+    if lazy_ui['node_editor_used'] and not lazy_ui['registered']:
+        remove_lazy_ui_handlers()
+        register_ui()
+
+
+def register():
+    start = time.time()
+    register_classes(data_classes)
+    if bpy.app.background:
+        mode = "background"
+    else:
+        register_classes(interactive_classes)
+        if node_editor_used():
+            register_ui()
+            mode = "interface"
+        else:
+            # wait for first use of the Node Editor
+            lazy_ui['node_editor_used'] = False
+            lazy_ui['draw_handle'] = bpy.types.SpaceNodeEditor.draw_handler_add(
+                draw_callback_node_editor_used, (), 'WINDOW', 'POST_PIXEL')
+            bpy.app.handlers.scene_update_post.append(lazy_ui_handler)
+            mode = "deferred interface"
+
+    lazy_ui['time'] = time.time() - start
+    print("Node Wrangler: registered in %.1f ms (%s)" % (lazy_ui['time'] * 1000.0, mode))
+
+
+def unregister():
+    remove_lazy_ui_handlers()
+    if lazy_ui['registered']:
+        unregister_ui()
+
+    for cls in reversed(registered_classes):
+        bpy.utils.unregister_class(cls)
+    registered_classes.clear()
+
 if __name__ == "__main__":
     register()